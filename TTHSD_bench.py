@@ -0,0 +1,240 @@
+"""
+TTHSD_bench.py - TTHSD_interface 性能评测
+
+基于 TTHSD_shim 的 Python 替身库与本地 HTTP 服务器，不需要 tthsd 动态库:
+  1. 回调开销: DLL 线程中每个事件的耗时（事件泵入队 vs 旧版在回调中直接解析）
+  2. JSON 解析开销: 每个事件解析 event/msg 两段 JSON 的耗时，以及事件泵的消费吞吐量
+  3. 任务编码开销: 每个任务编码为 JSON 字节串的耗时
+  4. 端到端耗时: 1 / 100 / 10000 个任务从提交到 Future 完成的耗时与首字节时间，
+     以及同样任务数经 submit_bulk 分批提交的耗时
+
+用法:
+    python TTHSD_bench.py
+    python TTHSD_bench.py --events 200000 --tasks 1 100 --size 65536
+"""
+
+import argparse
+import json
+import re
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from TTHSD_interface import _CALLBACK_TYPE, TTHSDownloader, _encode_tasks, get_download_metrics
+from TTHSD_shim import ShimLibrary
+
+_EVENT = json.dumps(
+    {"Type": "update", "Name": "update", "ShowName": "model.bin", "ID": "6f1c2a9e-bench"}
+).encode("utf-8")
+
+
+def _update_msg(downloaded: int) -> bytes:
+    return json.dumps({"Total": 1 << 30, "Downloaded": downloaded}).encode("utf-8")
+
+
+# ------------------------------------------------------------------
+# 本地 HTTP 服务器: /bytes/<大小>/<文件名> 返回指定大小的数据，支持 HEAD 与 Range
+# ------------------------------------------------------------------
+
+class _BytesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    _PATH = re.compile(r"^/bytes/(\d+)/")
+    _RANGE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(self, with_body: bool) -> None:
+        match = self._PATH.match(self.path)
+        if not match:
+            self.send_error(404)
+            return
+        size = int(match.group(1))
+        start, end, status = 0, size - 1, 200
+        range_match = self._RANGE.match(self.headers.get("Range", ""))
+        if range_match:
+            start = int(range_match.group(1))
+            end = min(int(range_match.group(2) or size - 1), size - 1)
+            status = 206
+        length = max(end - start + 1, 0)
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if with_body:
+            block = b"\0" * 65536
+            while length > 0:
+                chunk = block[:min(length, len(block))]
+                self.wfile.write(chunk)
+                length -= len(chunk)
+
+    def do_GET(self) -> None:
+        self._send(with_body=True)
+
+    def do_HEAD(self) -> None:
+        self._send(with_body=False)
+
+
+class _BenchServer(ThreadingHTTPServer):
+    # 默认 backlog 为 5，并行任务多时连接会被丢弃后重传，计入的是内核的 SYN 重试时间
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+def start_server() -> tuple[ThreadingHTTPServer, str]:
+    """在随机端口启动本地服务器，返回 (服务器, 基础 URL)。"""
+    server = _BenchServer(("127.0.0.1", 0), _BytesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ------------------------------------------------------------------
+# 1. 回调开销
+# ------------------------------------------------------------------
+
+def bench_callback_overhead(events: int) -> None:
+    """测量通过 C 回调进入 Python 后，每个事件占用 DLL 线程的时间。"""
+    messages = [_update_msg(i) for i in range(events)]
+    received = []
+
+    # 旧版做法：在 DLL 线程中解码并解析两段 JSON 后再调用用户回调
+    def legacy_inner(event_ptr: bytes, msg_ptr: bytes) -> None:
+        event_dict = json.loads(event_ptr.decode("utf-8"))
+        msg_dict = json.loads(msg_ptr.decode("utf-8"))
+        received.append((event_dict, msg_dict))
+
+    legacy_cb = _CALLBACK_TYPE(legacy_inner)
+    started = time.perf_counter()
+    for msg in messages:
+        legacy_cb(_EVENT, msg)
+    legacy = time.perf_counter() - started
+
+    dl = TTHSDownloader(library=ShimLibrary())
+    dispatched = []
+    pump_cb = dl._make_c_callback(lambda event, msg: dispatched.append(msg))
+    pump = dl._event_pumps[id(pump_cb)]
+    started = time.perf_counter()
+    for msg in messages:
+        pump_cb(_EVENT, msg)
+    enqueue = time.perf_counter() - started
+    pump_cb(b'{"Type": "end"}', b"{}")
+    pump.join()
+    drained = time.perf_counter() - started
+
+    print("== 回调开销（DLL 线程中每个事件的耗时）==")
+    print(f"  旧版（回调中解析）: {legacy / events * 1e6:8.2f} µs/事件")
+    print(f"  事件泵（只入队）:   {enqueue / events * 1e6:8.2f} µs/事件")
+    print(f"  事件泵消费完毕:     {drained:8.3f} s，{events / drained:,.0f} 事件/秒，"
+          f"转发给用户回调 {pump.events_dispatched} 次")
+
+
+# ------------------------------------------------------------------
+# 2. JSON 解析开销
+# ------------------------------------------------------------------
+
+def bench_json_decode(events: int) -> None:
+    """测量每个事件两段 JSON 的解析耗时（先解码为 str 再解析 vs 直接解析字节）。"""
+    messages = [_update_msg(i) for i in range(events)]
+
+    started = time.perf_counter()
+    for msg in messages:
+        json.loads(_EVENT.decode("utf-8"))
+        json.loads(msg.decode("utf-8"))
+    via_str = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for msg in messages:
+        json.loads(_EVENT)
+        json.loads(msg)
+    via_bytes = time.perf_counter() - started
+
+    print("== JSON 解析开销 ==")
+    print(f"  解码后解析: {via_str / events * 1e6:8.2f} µs/事件")
+    print(f"  直接解析字节: {via_bytes / events * 1e6:6.2f} µs/事件")
+
+
+# ------------------------------------------------------------------
+# 3. 任务编码开销
+# ------------------------------------------------------------------
+
+def bench_encode(task_count: int) -> None:
+    """测量把 task_count 个任务编码为传给 get_downloader 的 JSON 字节串的耗时。"""
+    urls = [f"https://cdn.example.com/pack/part_{i:06d}.bin?sig=0f3a" for i in range(task_count)]
+    save_paths = [f"/data/模型/part_{i:06d}.bin" for i in range(task_count)]
+    started = time.perf_counter()
+    data = _encode_tasks(urls, save_paths)
+    elapsed = time.perf_counter() - started
+    print("== 任务编码开销 ==")
+    print(f"  {task_count} 个任务: {elapsed * 1000:8.1f} ms，{elapsed / task_count * 1e6:6.2f} µs/任务，"
+          f"{len(data) / 1024 / 1024:.1f} MB")
+
+
+# ------------------------------------------------------------------
+# 4. 端到端耗时
+# ------------------------------------------------------------------
+
+def bench_end_to_end(task_counts: list[int], size: int, thread_count: int, batch_size: int) -> None:
+    """测量 N 个任务从提交到 Future 完成的耗时（一次提交与分批提交）。"""
+    server, base_url = start_server()
+    print(f"== 端到端耗时（每个文件 {size} 字节，并行下载，{thread_count} 线程）==")
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dl = TTHSDownloader(library=ShimLibrary())
+            for task_count in task_counts:
+                urls = [f"{base_url}/bytes/{size}/file_{i}.bin" for i in range(task_count)]
+                save_paths = [str(Path(tmp_dir) / f"{task_count}_{i}.bin") for i in range(task_count)]
+                started = time.perf_counter()
+                future = dl.submit(
+                    urls=urls,
+                    save_paths=save_paths,
+                    thread_count=thread_count,
+                    chunk_size_mb=1,
+                    is_multiple=True,
+                )
+                result = future.result()
+                elapsed = time.perf_counter() - started
+                metrics = get_download_metrics(result.downloader_id) or {}
+                ttfb = metrics.get("ttfb")
+                print(f"  {task_count:>6} 个任务: {elapsed:8.3f} s，{task_count / elapsed:10,.1f} 任务/秒，"
+                      f"首字节 {ttfb * 1000 if ttfb is not None else float('nan'):7.1f} ms，"
+                      f"共 {result.total_bytes:,} 字节")
+
+                if task_count <= batch_size:
+                    continue
+                started = time.perf_counter()
+                bulk = dl.submit_bulk(
+                    zip(urls, save_paths),
+                    batch_size=batch_size,
+                    thread_count=thread_count,
+                    chunk_size_mb=1,
+                ).result()
+                elapsed = time.perf_counter() - started
+                print(f"  {task_count:>6} 个任务（每批 {batch_size}）: {elapsed:8.3f} s，"
+                      f"{task_count / elapsed:10,.1f} 任务/秒，{bulk.batches} 批，"
+                      f"失败 {bulk.failed_batches} 批，共 {bulk.total_bytes:,} 字节")
+    finally:
+        server.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TTHSD_interface 性能评测")
+    parser.add_argument("--events", type=int, default=100_000, help="回调与解析评测的事件数")
+    parser.add_argument("--tasks", type=int, nargs="+", default=[1, 100, 10_000], help="端到端评测的任务数")
+    parser.add_argument("--size", type=int, default=16 * 1024, help="端到端评测中每个文件的大小（字节）")
+    parser.add_argument("--threads", type=int, default=32, help="端到端评测的下载线程数")
+    parser.add_argument("--batch-size", type=int, default=1000, help="端到端评测中分批提交的每批任务数")
+    parser.add_argument("--encode", type=int, default=100_000, help="编码评测的任务数")
+    args = parser.parse_args()
+
+    bench_callback_overhead(args.events)
+    bench_json_decode(args.events)
+    bench_encode(args.encode)
+    bench_end_to_end(args.tasks, args.size, args.threads, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,21 +7,32 @@ TTHSD_interface.py - TT 高速下载器 Python 接口封装
   - macOS:   tthsd.dylib
   - Linux:   tthsd.so
 
-依赖: Python 3.11+, 标准库 (ctypes, json, threading, queue, weakref)
+依赖: Python 3.11+, 标准库 (ctypes, json, threading, queue, weakref, concurrent.futures, asyncio, urllib)
 
 作者: 23XR Studio
 文档: https://docss.sxxyrry.qzz.io/TTHSD/
 """
 
+import asyncio
+import concurrent.futures
 import ctypes
 import json
 import logging
+import math
 import platform
 import queue
+import statistics
 import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
 import uuid
+from collections.abc import Callable, Iterable
+from itertools import islice
+from json.encoder import encode_basestring as _encode_json_str
 from pathlib import Path
-from collections.abc import Callable
 
 # ------------------------------------------------------------------
 # 内部日志器
@@ -52,6 +63,12 @@ except (OSError, IOError):
 
 _CALLBACK_TYPE = ctypes.CFUNCTYPE(None, ctypes.c_char_p, ctypes.c_char_p)
 
+# 同一任务的 update 事件默认每 0.2 秒最多转发一次
+DEFAULT_UPDATE_INTERVAL = 0.2
+
+
+def _ignore_event(event: dict, msg: dict) -> None:
+    """未设置用户回调时使用的空回调。"""
 
 def _default_dll_name() -> str:
     """根据当前操作系统返回默认动态库文件名。"""
@@ -63,14 +80,22 @@ def _default_dll_name() -> str:
     return "tthsd.so"
 
 
-def _build_tasks_json(
+def _show_name(url: str, index: int) -> str:
+    """URL 去掉查询参数后的最后一段，作为默认显示名称。"""
+    return url.partition("?")[0].rstrip("/").rpartition("/")[2] or f"task_{index}"
+
+
+def _encode_tasks(
     urls: list[str],
     save_paths: list[str],
     show_names: list[str] | None = None,
     ids: list[str] | None = None,
-) -> str:
+) -> bytes:
     """
-    将 URL / 保存路径列表打包为 DLL 所接受的 JSON 字符串。
+    将 URL / 保存路径列表直接编码为 DLL 所接受的 JSON（UTF-8 字节串）。
+
+    不为每个任务构建 dict，也不先生成整段 str 再编码；省略 ids 时任务 ID 为
+    "本批随机前缀-序号"，每批只生成一次 UUID。
 
     参数:
         urls:       下载 URL 列表
@@ -79,26 +104,730 @@ def _build_tasks_json(
         ids:        任务 ID（可选，省略时自动生成）
 
     返回:
-        JSON 格式字符串
+        UTF-8 编码的 JSON 数组
     """
     if len(urls) != len(save_paths):
         raise ValueError(
             f"urls 与 save_paths 长度不一致: {len(urls)} vs {len(save_paths)}"
         )
 
-    tasks = []
+    id_prefix = uuid.uuid4().hex[:12]
+    buf = bytearray(b"[")
     for i, (url, save_path) in enumerate(zip(urls, save_paths)):
         show_name = (show_names[i] if show_names and i < len(show_names)
-                     else Path(url.split("?")[0]).name or f"task_{i}")
+                     else _show_name(url, i))
         task_id = (ids[i] if ids and i < len(ids)
-                   else str(uuid.uuid4()))
-        tasks.append({
-            "url": url,
-            "save_path": str(save_path),
-            "show_name": show_name,
-            "id": task_id,
-        })
-    return json.dumps(tasks, ensure_ascii=False)
+                   else f"{id_prefix}-{i}")
+        if i:
+            buf += b","
+        buf += (
+            f'{{"url":{_encode_json_str(url)},'
+            f'"save_path":{_encode_json_str(str(save_path))},'
+            f'"show_name":{_encode_json_str(show_name)},'
+            f'"id":{_encode_json_str(task_id)}}}'
+        ).encode("utf-8")
+    buf += b"]"
+    return bytes(buf)
+
+
+# ------------------------------------------------------------------
+# 下载指标: 吞吐量 / 首字节时间 / 完成耗时
+# ------------------------------------------------------------------
+
+# 计算瞬时吞吐量的最小采样间隔（秒），避免同一批转发的事件产生极短的时间差
+_THROUGHPUT_SAMPLE_INTERVAL = 0.1
+# 吞吐量指数加权平均的时间常数（秒）
+_THROUGHPUT_EWMA_TAU = 2.0
+# 保留的已结束下载会话指标数量
+_MAX_FINISHED_METRICS = 32
+
+_metrics_registry: dict[int, "DownloadMetrics"] = {}
+_metrics_lock = threading.Lock()
+
+
+class DownloadMetrics:
+    """
+    单个下载器实例的性能指标，由事件泵在消费线程中根据事件更新。
+
+    记录内容:
+    - 瞬时吞吐量与指数加权平均吞吐量（字节/秒）
+    - 各任务已下载字节数、首字节时间（TTFB）与完成耗时
+    - 整个会话的首字节时间与完成耗时
+    - 创建时的 thread_count / chunk_size_mb，便于对照调参
+
+    时间均为从 time.monotonic() 计算的秒数。
+    """
+
+    def __init__(self, task_count: int, thread_count: int, chunk_size_mb: int):
+        self.downloader_id = -1
+        self.task_count = task_count
+        self.thread_count = thread_count
+        self.chunk_size_mb = chunk_size_mb
+        self.created_at = time.monotonic()
+        # 收到 start 事件的时间；仅创建未启动时为 None，按创建时间计算
+        self.started_at: float | None = None
+        self.first_byte_at: float | None = None
+        self.finished_at: float | None = None
+        self.errors: list[str] = []
+        self.total_bytes = 0
+        self.throughput = 0.0
+        self.throughput_ewma = 0.0
+        # 各任务: {任务键: {"bytes", "total", "started_at", "first_byte_at", "finished_at"}}
+        self._tasks: dict[str, dict] = {}
+        self._sample: tuple[float, int] = (self.created_at, 0)
+        self._lock = threading.Lock()
+        self._finish_listeners: list[Callable[["DownloadMetrics"], None]] = []
+
+    def add_finish_listener(self, listener: Callable[["DownloadMetrics"], None]) -> None:
+        """注册会话结束（end 事件）时调用的函数。"""
+        self._finish_listeners.append(listener)
+
+    def _task(self, task_key: str, now: float) -> dict:
+        task = self._tasks.get(task_key)
+        if task is None:
+            task = self._tasks[task_key] = {
+                "bytes": 0, "total": 0, "started_at": now, "first_byte_at": None, "finished_at": None
+            }
+        return task
+
+    def observe(self, event: dict, msg: dict) -> None:
+        """根据一条事件更新指标。"""
+        now = time.monotonic()
+        event_type = event.get("Type")
+        task_key = event.get("ID") or event.get("ShowName", "")
+        with self._lock:
+            if event_type == "update":
+                task = self._task(task_key, now)
+                downloaded = int(msg.get("Downloaded", 0))
+                self.total_bytes += downloaded - task["bytes"]
+                task["bytes"] = downloaded
+                task["total"] = int(msg.get("Total", 0))
+                if downloaded > 0 and task["first_byte_at"] is None:
+                    task["first_byte_at"] = now
+                    if self.first_byte_at is None:
+                        self.first_byte_at = now
+                self._sample_throughput(now)
+            elif event_type == "start":
+                self.started_at = now
+                self._sample = (now, self.total_bytes)
+            elif event_type == "startOne":
+                self._task(task_key, now)["started_at"] = now
+            elif event_type == "endOne":
+                self._task(task_key, now)["finished_at"] = now
+            elif event_type == "err":
+                self.errors.append(str(msg.get("Error", "")))
+            elif event_type == "end":
+                self.finished_at = now
+                self._sample_throughput(now)
+        if event_type == "end":
+            _retire_metrics(self)
+            for listener in self._finish_listeners:
+                listener(self)
+
+    def _sample_throughput(self, now: float) -> None:
+        """按采样间隔更新瞬时吞吐量与加权平均吞吐量。"""
+        sample_time, sample_bytes = self._sample
+        elapsed = now - sample_time
+        if elapsed < _THROUGHPUT_SAMPLE_INTERVAL:
+            return
+        self.throughput = max(self.total_bytes - sample_bytes, 0) / elapsed
+        # 按时间间隔调整权重，事件稀疏时新样本占比更高
+        alpha = 1.0 - math.exp(-elapsed / _THROUGHPUT_EWMA_TAU)
+        if self.throughput_ewma == 0.0:
+            self.throughput_ewma = self.throughput
+        else:
+            self.throughput_ewma += alpha * (self.throughput - self.throughput_ewma)
+        self._sample = (now, self.total_bytes)
+
+    def snapshot(self, include_tasks: bool = False) -> dict:
+        """
+        返回当前指标。
+
+        参数:
+            include_tasks: 是否包含每个任务的明细（任务很多时数据量较大）
+        """
+        now = time.monotonic()
+        with self._lock:
+            begin = self.started_at or self.created_at
+            end = self.finished_at or now
+            state = "running" if self.finished_at is None else ("failed" if self.errors else "finished")
+            result = {
+                "downloader_id": self.downloader_id,
+                "state": state,
+                "task_count": self.task_count,
+                "tasks_finished": sum(1 for task in self._tasks.values() if task["finished_at"] is not None),
+                "thread_count": self.thread_count,
+                "chunk_size_mb": self.chunk_size_mb,
+                "elapsed": end - begin,
+                "total_bytes": self.total_bytes,
+                "throughput": self.throughput if self.finished_at is None else 0.0,
+                "throughput_ewma": self.throughput_ewma,
+                "average_throughput": self.total_bytes / (end - begin) if end > begin else 0.0,
+                "ttfb": self.first_byte_at - begin if self.first_byte_at is not None else None,
+                "latency": self.finished_at - begin if self.finished_at is not None else None,
+                "errors": list(self.errors),
+            }
+            if include_tasks:
+                result["tasks"] = {
+                    task_key: {
+                        "bytes": task["bytes"],
+                        "total": task["total"],
+                        "ttfb": (task["first_byte_at"] - task["started_at"]
+                                 if task["first_byte_at"] is not None else None),
+                        "latency": (task["finished_at"] - task["started_at"]
+                                    if task["finished_at"] is not None else None),
+                    }
+                    for task_key, task in self._tasks.items()
+                }
+        return result
+
+
+def _register_metrics(metrics: DownloadMetrics) -> None:
+    with _metrics_lock:
+        _metrics_registry[metrics.downloader_id] = metrics
+
+
+def _retire_metrics(metrics: DownloadMetrics) -> None:
+    """会话结束后只保留最近的若干条已结束指标。"""
+    with _metrics_lock:
+        finished = [dl_id for dl_id, item in _metrics_registry.items() if item.finished_at is not None]
+        for dl_id in finished[:-_MAX_FINISHED_METRICS]:
+            del _metrics_registry[dl_id]
+
+
+def get_download_metrics(downloader_id: int | None = None,
+                         include_tasks: bool = False) -> dict | list[dict] | None:
+    """
+    查询下载指标。
+
+    参数:
+        downloader_id: 下载器实例 ID；为 None 时返回所有会话（含最近结束的）的指标列表
+        include_tasks: 是否包含每个任务的明细
+
+    返回:
+        单个会话的指标 dict（ID 不存在时为 None），或指标 dict 列表
+    """
+    with _metrics_lock:
+        if downloader_id is not None:
+            metrics = _metrics_registry.get(downloader_id)
+            return metrics.snapshot(include_tasks) if metrics is not None else None
+        all_metrics = list(_metrics_registry.values())
+    return [metrics.snapshot(include_tasks) for metrics in all_metrics]
+
+
+# ------------------------------------------------------------------
+# 自动选择线程数与分块大小
+# ------------------------------------------------------------------
+
+# 按单个文件大小分档: (大小上限字节（None 表示不限）, 线程数, 分块大小MB)
+_SIZE_TIERS = [
+    (1 << 20, 1, 1),
+    (16 << 20, 4, 1),
+    (128 << 20, 16, 4),
+    (1 << 30, 32, 8),
+    (None, 64, 16),
+]
+# 无法得知文件大小时使用的档位
+_UNKNOWN_SIZE_TIER = 2
+# 多任务时最多探测的 URL 数
+_PROBE_SAMPLE = 4
+_PROBE_TIMEOUT = 5.0
+# 同一参数组合至少有这么多次历史记录才参与比较
+_MIN_HISTORY_RUNS = 2
+# 每个主机/档位保留的历史记录数
+_MAX_HISTORY_RUNS = 20
+
+
+class DownloadTuner:
+    """
+    根据文件大小与历史吞吐量选择 thread_count / chunk_size_mb。
+
+    1. 文件大小优先取历史记录中同一 URL 的实际大小，其余抽样的 URL（多任务时取前几个）
+       并发发出 HEAD 请求，总耗时不超过 probe_timeout；都无法得知时使用
+       同一主机以往下载中 update 事件报告的文件大小
+    2. 按大小分档得到默认的线程数与分块大小，线程数不超过分块数
+    3. 同一主机、同一档位以往下载（包括手动指定参数的下载）用过的参数组合中，
+       平均吞吐量最高的优先
+
+    参数:
+        history_file:  历史记录文件（JSON），None 时只保存在内存中
+        probe_timeout: HEAD 请求超时（秒）
+    """
+
+    def __init__(self, history_file: str | Path | None = None, probe_timeout: float = _PROBE_TIMEOUT):
+        self.history_file = Path(history_file) if history_file is not None else None
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        # {"主机|档位": [{"url", "thread_count", "chunk_size_mb", "throughput", "file_size"}, ...]}
+        self._history: dict[str, list[dict]] = {}
+        if self.history_file is not None and self.history_file.exists():
+            try:
+                with open(self.history_file, "r", encoding="utf-8") as f:
+                    self._history = json.load(f)
+            except (OSError, json.JSONDecodeError) as exc:
+                _logger.warning("读取下载调优历史失败: %s", exc)
+
+    def probe_size(self, url: str, user_agent: str | None = None) -> int | None:
+        """HEAD 请求获取文件大小，服务器未返回 Content-Length 或请求失败时返回 None。"""
+        headers = {"User-Agent": user_agent} if user_agent else {}
+        probe_request = urllib.request.Request(url, method="HEAD", headers=headers)
+        try:
+            with urllib.request.urlopen(probe_request, timeout=self.probe_timeout) as response:
+                length = response.headers.get("Content-Length")
+                return int(length) if length else None
+        except (urllib.error.URLError, OSError, ValueError) as exc:
+            _logger.info("探测文件大小失败 (%s): %s", url, exc)
+            return None
+
+    @staticmethod
+    def _tier_index(size: int) -> int:
+        for index, (limit, _, _) in enumerate(_SIZE_TIERS):
+            if limit is None or size < limit:
+                return index
+        return len(_SIZE_TIERS) - 1
+
+    def choose(self, urls: list[str], user_agent: str | None = None) -> tuple[int, int]:
+        """
+        为一组下载任务选择参数。
+
+        返回:
+            (thread_count, chunk_size_mb)
+        """
+        host = urllib.parse.urlsplit(urls[0]).netloc if urls else ""
+        sample = urls[:_PROBE_SAMPLE]
+        with self._lock:
+            known = {run["url"]: run["file_size"] for runs in self._history.values()
+                     for run in runs if run.get("url") in sample and run.get("file_size")}
+        sizes = [known[url] for url in sample if url in known]
+        sizes += [size for size in self._probe_sizes([url for url in sample if url not in known], user_agent)
+                  if size]
+        with self._lock:
+            if not sizes:
+                # 退而使用该主机以往下载报告的文件大小
+                sizes = [run["file_size"] for key, runs in self._history.items()
+                         if key.startswith(host + "|") for run in runs if run.get("file_size")]
+            size = int(statistics.median(sizes)) if sizes else None
+            tier = self._tier_index(size) if size is not None else _UNKNOWN_SIZE_TIER
+            _, thread_count, chunk_size_mb = _SIZE_TIERS[tier]
+            if size is not None:
+                # 线程数超过分块数没有意义
+                chunks = -(-size // (chunk_size_mb << 20))
+                thread_count = max(1, min(thread_count, chunks))
+            best = self._best_from_history(f"{host}|{tier}")
+        if best is not None:
+            thread_count, chunk_size_mb = best
+        _logger.info("自动选择下载参数: 文件大小=%s, 线程数=%d, 分块=%dMB", size, thread_count, chunk_size_mb)
+        return thread_count, chunk_size_mb
+
+    def _probe_sizes(self, urls: list[str], user_agent: str | None = None) -> list[int | None]:
+        """并发探测多个 URL 的文件大小，总耗时不超过 probe_timeout，未按时返回的记为 None。"""
+        if not urls:
+            return []
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(urls))
+        futures = [pool.submit(self.probe_size, url, user_agent) for url in urls]
+        concurrent.futures.wait(futures, timeout=self.probe_timeout)
+        # 不等待超时的请求结束
+        pool.shutdown(wait=False, cancel_futures=True)
+        return [future.result() if future.done() and not future.cancelled() else None for future in futures]
+
+    def _best_from_history(self, key: str) -> tuple[int, int] | None:
+        """返回历史上平均吞吐量最高的参数组合（记录不足时返回 None）。"""
+        groups: dict[tuple[int, int], list[float]] = {}
+        for run in self._history.get(key, []):
+            groups.setdefault((run["thread_count"], run["chunk_size_mb"]), []).append(run["throughput"])
+        candidates = {params: statistics.median(values)
+                      for params, values in groups.items() if len(values) >= _MIN_HISTORY_RUNS}
+        if not candidates:
+            return None
+        return max(candidates, key=candidates.get)
+
+    def record(self, url: str, metrics: DownloadMetrics) -> None:
+        """
+        记录一次下载的参数与吞吐量（出错或没有数据的会话不记录）。
+
+        按 update 事件报告的实际文件大小归档，探测失败时也作为文件大小的参考。
+        """
+        snapshot = metrics.snapshot()
+        if snapshot["errors"] or not snapshot["total_bytes"]:
+            return
+        file_size = snapshot["total_bytes"] // max(snapshot["task_count"], 1)
+        run = {
+            # 多任务会话的 file_size 是平均值，不能作为某个 URL 的大小
+            "url": url if snapshot["task_count"] == 1 else None,
+            "thread_count": snapshot["thread_count"],
+            "chunk_size_mb": snapshot["chunk_size_mb"],
+            "throughput": snapshot["average_throughput"],
+            "file_size": file_size,
+        }
+        key = f"{urllib.parse.urlsplit(url).netloc}|{self._tier_index(file_size)}"
+        with self._lock:
+            runs = self._history.setdefault(key, [])
+            runs.append(run)
+            del runs[:-_MAX_HISTORY_RUNS]
+            history = json.dumps(self._history)
+        if self.history_file is not None:
+            try:
+                tmp_file = self.history_file.with_suffix(self.history_file.suffix + ".tmp")
+                tmp_file.write_text(history, encoding="utf-8")
+                tmp_file.replace(self.history_file)
+            except OSError as exc:
+                _logger.warning("保存下载调优历史失败: %s", exc)
+
+
+# 未指定调优器的下载器共用的调优器（历史记录只保存在内存中）
+default_tuner = DownloadTuner()
+
+
+# ------------------------------------------------------------------
+# 事件泵: DLL 线程只入队，解析与合并在消费线程中完成
+# ------------------------------------------------------------------
+
+class EventPump:
+    """
+    DLL 事件泵。
+
+    DLL 线程中的回调只把两个 char* 参数的原始字节放入队列，立即返回；
+    消费线程负责解析 JSON、合并 update 事件并调用用户回调：
+    - 同一任务的 update 事件每 update_interval 秒最多转发一次，只保留最新的一条
+      （update_interval 为 0 时不合并）
+    - 其他事件转发前先转发积压的 update，事件顺序不变
+    - 转发的 update 消息补充 Speed（字节/秒）与 ETA（剩余秒数，未知时为 None），
+      内核已不再提供 Speed 字段
+    - 转发 end 事件后消费线程退出
+
+    参数:
+        callback:        用户回调 (event: dict, msg: dict) -> None
+        update_interval: update 事件的最小转发间隔（秒）
+        metrics:         下载指标（可选），每条事件（合并前）都会用于更新指标
+    """
+
+    def __init__(self, callback: Callable[[dict, dict], None],
+                 update_interval: float = DEFAULT_UPDATE_INTERVAL,
+                 metrics: DownloadMetrics | None = None):
+        self._callback = callback
+        self.update_interval = update_interval
+        self.metrics = metrics
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        # 等待转发的 update 事件 {任务键: (event, msg)}
+        self._pending: dict[str, tuple[dict, dict]] = {}
+        # 各任务上次转发时的 (时间, 已下载字节数)，用于计算速度
+        self._last_progress: dict[str, tuple[float, int]] = {}
+        self._last_flush = 0.0
+        self.events_received = 0
+        self.events_dispatched = 0
+        # 已转发 end 事件；on_end 在此之后调用（由管理器设置，用于释放回调引用）
+        self.finished = False
+        self.on_end: Callable[[], None] | None = None
+        self._thread = threading.Thread(target=self._run, name="TTHSD-EventPump", daemon=True)
+        self._thread.start()
+
+    def push(self, event_ptr: bytes | None, msg_ptr: bytes | None) -> None:
+        """DLL 线程调用：只入队，不做任何解析。"""
+        self._queue.put((event_ptr, msg_ptr))
+
+    def close(self) -> None:
+        """转发积压事件后停止消费线程。"""
+        self._queue.put(None)
+
+    def join(self, timeout: float | None = None) -> None:
+        """等待消费线程退出。"""
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            timeout = None
+            if self._pending:
+                timeout = max(self._last_flush + self.update_interval - time.monotonic(), 0.0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush_updates()
+                continue
+            if item is None:
+                self._flush_updates()
+                return
+            try:
+                # 先解码再解析：json.loads 对 bytes 要先检测编码，比直接 decode 慢（见 TTHSD_bench.py）
+                event = json.loads((item[0] or b"{}").decode("utf-8"))
+                msg = json.loads((item[1] or b"{}").decode("utf-8"))
+            except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+                _logger.error("事件解析失败 (已忽略): %s", exc)
+                continue
+            self.events_received += 1
+            if self.metrics is not None:
+                self.metrics.observe(event, msg)
+
+            event_type = event.get("Type")
+            if event_type == "update":
+                self._pending[event.get("ID") or event.get("ShowName", "")] = (event, msg)
+                if time.monotonic() - self._last_flush >= self.update_interval:
+                    self._flush_updates()
+                continue
+
+            self._flush_updates()
+            self._dispatch(event, msg)
+            if event_type == "end":
+                self.finished = True
+                if self.on_end is not None:
+                    self.on_end()
+                return
+
+    def _flush_updates(self) -> None:
+        """转发积压的 update 事件，并补充速度与剩余时间。"""
+        now = time.monotonic()
+        self._last_flush = now
+        pending, self._pending = self._pending, {}
+        for task_key, (event, msg) in pending.items():
+            downloaded = int(msg.get("Downloaded", 0))
+            total = int(msg.get("Total", 0))
+            speed = 0.0
+            previous = self._last_progress.get(task_key)
+            if previous is not None and now > previous[0]:
+                speed = max(downloaded - previous[1], 0) / (now - previous[0])
+            self._last_progress[task_key] = (now, downloaded)
+            msg["Speed"] = speed
+            msg["ETA"] = (total - downloaded) / speed if speed > 0 and total > 0 else None
+            self._dispatch(event, msg)
+
+    def _dispatch(self, event: dict, msg: dict) -> None:
+        self.events_dispatched += 1
+        try:
+            self._callback(event, msg)
+        except Exception as exc:  # 用户回调出错不能让消费线程退出，否则后续事件（包括 end）都会丢失
+            _logger.error("回调函数异常 (已捕获，不影响下载): %s", exc, exc_info=True)
+
+
+# ------------------------------------------------------------------
+# 下载完成通知: Future 接口
+# ------------------------------------------------------------------
+
+class TTHSDError(OSError):
+    """下载器创建失败或下载过程中收到 err 事件。"""
+
+
+class DownloadResult:
+    """
+    一次下载会话的结果，由 DownloadFuture 在收到 end 事件后返回。
+
+    属性:
+        downloader_id: 下载器实例 ID
+        task_bytes:    各任务已下载字节数 {任务 ID: 字节数}
+        total_bytes:   所有任务已下载字节数之和
+        elapsed:       从提交到结束的耗时（秒）
+    """
+
+    def __init__(self, downloader_id: int, task_bytes: dict[str, int], elapsed: float):
+        self.downloader_id = downloader_id
+        self.task_bytes = task_bytes
+        self.total_bytes = sum(task_bytes.values())
+        self.elapsed = elapsed
+
+    def __repr__(self) -> str:
+        return (f"DownloadResult(downloader_id={self.downloader_id}, "
+                f"tasks={len(self.task_bytes)}, total_bytes={self.total_bytes}, "
+                f"elapsed={self.elapsed:.3f})")
+
+
+class DownloadFuture(concurrent.futures.Future):
+    """
+    在 end 事件时完成、err 事件时失败的 Future。
+
+    - result(timeout) 返回 DownloadResult，超时抛出 TimeoutError（不会停止下载）
+    - cancel() 会调用 stop_download 停止下载
+    - task_bytes() 随时返回各任务当前已下载的字节数
+
+    由 TTHSDownloader.submit() 创建，回调在事件泵的消费线程中执行（不是 DLL 线程）。
+    """
+
+    def __init__(self, downloader: "TTHSDownloader",
+                 callback: Callable[[dict, dict], None] | None = None):
+        super().__init__()
+        # 持有下载器引用，下载结束前回调引用不会随下载器一起被回收
+        self._downloader = downloader
+        self._user_callback = callback
+        self._task_bytes: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._timer: threading.Timer | None = None
+        self.downloader_id = -1
+
+    def task_bytes(self) -> dict[str, int]:
+        """返回各任务当前已下载字节数的副本。"""
+        with self._lock:
+            return dict(self._task_bytes)
+
+    def _on_event(self, event: dict, msg: dict) -> None:
+        """DLL 事件回调：记录进度，在 end/err 时完成 Future，并转发给用户回调。"""
+        event_type = event.get("Type")
+        if event_type == "update":
+            task_id = event.get("ID") or event.get("ShowName", "")
+            with self._lock:
+                self._task_bytes[task_id] = int(msg.get("Downloaded", 0))
+        try:
+            if self._user_callback is not None:
+                self._user_callback(event, msg)
+        finally:
+            # 用户回调抛出异常时同样要完成 Future
+            if event_type == "end":
+                self._resolve(result=DownloadResult(
+                    self.downloader_id, self.task_bytes(), time.monotonic() - self._started_at
+                ))
+            elif event_type == "err":
+                self._resolve(exception=TTHSDError(msg.get("Error", "下载失败")))
+
+    def _resolve(self, result: DownloadResult | None = None,
+                 exception: BaseException | None = None) -> None:
+        """完成 Future（已完成或已取消时忽略）。"""
+        if self._timer is not None:
+            self._timer.cancel()
+        try:
+            if exception is not None:
+                self.set_exception(exception)
+            else:
+                self.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _expire(self) -> None:
+        """提交时指定的超时到期：停止下载并以 TimeoutError 结束。"""
+        if self.done():
+            return
+        self._downloader.stop_download(self.downloader_id)
+        self._resolve(exception=TimeoutError(f"下载超时 (ID={self.downloader_id})"))
+
+    def cancel(self) -> bool:
+        """取消并停止下载。"""
+        if not super().cancel():
+            return False
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.downloader_id != -1:
+            self._downloader.stop_download(self.downloader_id)
+        return True
+
+
+# ------------------------------------------------------------------
+# 批量提交: 分批创建下载器，内存占用与任务总数无关
+# ------------------------------------------------------------------
+
+# submit_bulk 每批的默认任务数
+DEFAULT_BULK_BATCH_SIZE = 1000
+# BulkDownloadResult 中保留的错误信息条数
+_MAX_BULK_ERRORS = 32
+
+
+class BulkDownloadResult:
+    """
+    一次批量下载的汇总结果，由 BulkDownloadFuture 在所有批次结束后返回。
+
+    属性:
+        batches:        已提交的批次数
+        tasks:          已提交的任务数
+        total_bytes:    成功批次下载的字节数之和
+        failed_batches: 创建失败或收到 err 事件的批次数
+        errors:         最早的若干条错误信息
+        elapsed:        从提交到全部结束的耗时（秒）
+    """
+
+    def __init__(self, batches: int, tasks: int, total_bytes: int,
+                 failed_batches: int, errors: list[str], elapsed: float):
+        self.batches = batches
+        self.tasks = tasks
+        self.total_bytes = total_bytes
+        self.failed_batches = failed_batches
+        self.errors = errors
+        self.elapsed = elapsed
+
+    def __repr__(self) -> str:
+        return (f"BulkDownloadResult(batches={self.batches}, tasks={self.tasks}, "
+                f"total_bytes={self.total_bytes}, failed_batches={self.failed_batches}, "
+                f"elapsed={self.elapsed:.3f})")
+
+
+class BulkDownloadFuture(concurrent.futures.Future):
+    """
+    批量下载的 Future：所有批次结束后完成，结果为 BulkDownloadResult。
+
+    - 单个批次失败不会中断后续批次，失败数与错误信息记在结果中
+    - cancel() 停止提交新批次，并停止正在下载的批次
+    - progress() 随时返回当前的汇总计数
+
+    只保留计数与正在下载的批次，不保留已结束批次的任务信息。
+    由 TTHSDownloader.submit_bulk() 创建。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._active: set[DownloadFuture] = set()
+        self._started_at = time.monotonic()
+        self._batches = 0
+        self._tasks = 0
+        self._done_tasks = 0
+        self._total_bytes = 0
+        self._failed_batches = 0
+        self._errors: list[str] = []
+
+    def _track(self, future: DownloadFuture, task_count: int) -> None:
+        """登记新提交的批次。"""
+        with self._lock:
+            self._batches += 1
+            self._tasks += task_count
+            self._active.add(future)
+        future.add_done_callback(lambda done: self._on_batch_done(done, task_count))
+
+    def _on_batch_done(self, future: DownloadFuture, task_count: int) -> None:
+        with self._lock:
+            self._active.discard(future)
+            self._done_tasks += task_count
+            if future.cancelled():
+                return
+            exc = future.exception()
+            if exc is None:
+                self._total_bytes += future.result().total_bytes
+                return
+            self._failed_batches += 1
+            if len(self._errors) < _MAX_BULK_ERRORS:
+                self._errors.append(f"ID={future.downloader_id}: {exc}")
+
+    def _active_batches(self) -> list[DownloadFuture]:
+        with self._lock:
+            return list(self._active)
+
+    def progress(self) -> dict:
+        """返回 {batches, tasks, done_tasks, active_batches, total_bytes, failed_batches}。"""
+        with self._lock:
+            return {
+                "batches": self._batches,
+                "tasks": self._tasks,
+                "done_tasks": self._done_tasks,
+                "active_batches": len(self._active),
+                "total_bytes": self._total_bytes,
+                "failed_batches": self._failed_batches,
+            }
+
+    def _finish(self, exception: BaseException | None = None) -> None:
+        """所有批次结束（或任务迭代器出错）时完成 Future（已取消时忽略）。"""
+        try:
+            if exception is not None:
+                self.set_exception(exception)
+                return
+            with self._lock:
+                result = BulkDownloadResult(
+                    self._batches, self._tasks, self._total_bytes, self._failed_batches,
+                    list(self._errors), time.monotonic() - self._started_at,
+                )
+            self.set_result(result)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def cancel(self) -> bool:
+        """停止提交新批次，并取消正在下载的批次。"""
+        if not super().cancel():
+            return False
+        for future in self._active_batches():
+            future.cancel()
+        return True
 
 
 # ------------------------------------------------------------------
@@ -127,39 +856,55 @@ class TTHSDownloader:
         def my_callback(event: dict, msg: dict) -> None: ...
     """
 
-    def __init__(self, dll_path: str | Path | None = None):
+    def __init__(self, dll_path: str | Path | None = None,
+                 update_interval: float = DEFAULT_UPDATE_INTERVAL,
+                 tuner: DownloadTuner | None = None,
+                 library=None):
         """
         初始化下载器封装。
 
         参数:
-            dll_path: 动态库路径。若为 None，根据操作系统在当前目录下寻找默认文件名。
+            dll_path:        动态库路径。若为 None，根据操作系统在当前目录下寻找默认文件名。
+            update_interval: 同一任务 update 事件转发给回调的最小间隔（秒），0 表示不合并
+            tuner:           thread_count / chunk_size_mb 传 None 时使用的调优器，
+                             None 使用模块共享的 default_tuner
+            library:         提供与动态库相同导出函数的对象（如 TTHSD_shim.ShimLibrary()），
+                             提供时不加载 dll_path，用于测试与评测
         """
-        if dll_path is None:
-            dll_path = Path.cwd() / _default_dll_name()
-
-        dll_path = Path(dll_path).resolve()
-        if not dll_path.exists():
-            raise FileNotFoundError(
-                f"动态库文件不存在: {dll_path}\n"
-                "请确保 TTHSD.so (Linux) / TTHSD.dll (Windows) / TTHSD.dylib (macOS) "
-                "位于执行目录，或通过 dll_path 参数显式指定路径。"
-            )
+        self.update_interval = update_interval
+        self.tuner = tuner or default_tuner
+        # 动态库在进程内只加载和配置一次，下载会话由管理器统一跟踪
+        self._manager = TTHSDManager.instance()
 
-        _logger.info("加载动态库: %s", dll_path)
-        self._dll = ctypes.CDLL(str(dll_path))
-        self._setup_dll_signatures()
-
-        # 保存回调函数的 C 可调用对象，防止被 GC 回收导致崩溃
+        if library is not None:
+            self._dll = library
+        else:
+            if dll_path is None:
+                dll_path = Path.cwd() / _default_dll_name()
+
+            dll_path = Path(dll_path).resolve()
+            if not dll_path.exists():
+                raise FileNotFoundError(
+                    f"动态库文件不存在: {dll_path}\n"
+                    "请确保 TTHSD.so (Linux) / TTHSD.dll (Windows) / TTHSD.dylib (macOS) "
+                    "位于执行目录，或通过 dll_path 参数显式指定路径。"
+                )
+            self._dll = self._manager.load_library(dll_path)
+
+        # 保存回调函数的 C 可调用对象，防止被 GC 回收导致崩溃；
+        # 下载器创建成功后移交给管理器，在 end 事件后释放
         self._callback_refs: dict[int, ctypes.CFUNCTYPE] = {} \
             # pyright: ignore[reportGeneralTypeIssues]
+        # 各回调对应的事件泵
+        self._event_pumps: dict[int, EventPump] = {}
 
     # ------------------------------------------------------------------
     # DLL 函数签名配置
     # ------------------------------------------------------------------
 
-    def _setup_dll_signatures(self):
+    @staticmethod
+    def _setup_dll_signatures(dll: ctypes.CDLL):
         """配置 DLL 导出函数的参数类型和返回值类型。"""
-        dll = self._dll
 
         # --- get_downloader ---
         dll.get_downloader.argtypes = [
@@ -217,46 +962,18 @@ class TTHSDownloader:
     def _make_c_callback(
         self,
         user_callback: Callable[[dict, dict], None],
+        metrics: DownloadMetrics | None = None,
     ) -> ctypes.CFUNCTYPE: # pyright: ignore[reportGeneralTypeIssues]
         """
         将 Python 回调函数包装为 C 可调用对象。
 
-        DLL 调用时传入两个 char* 参数（均为 JSON 字符串）；
-        本包装器负责解析 JSON 并以 dict 形式转发给用户回调。
+        DLL 调用时传入两个 char* 参数（均为 JSON 字符串）；DLL 线程中只把原始字节
+        交给事件泵，由事件泵的消费线程解析、合并后以 dict 形式转发给用户回调。
         """
-        def _inner(event_ptr: ctypes.c_char_p, msg_ptr: ctypes.c_char_p):
-            try:
-                # 处理event_ptr
-                if event_ptr:
-                    if hasattr(event_ptr, 'value'):
-                        # 对于ctypes.c_char_p类型
-                        event_str = event_ptr.value.decode("utf-8")
-                    else:
-                        # 对于bytes类型
-                        event_str = event_ptr.decode("utf-8")
-                else:
-                    event_str = "{}"
-
-                # 处理msg_ptr
-                if msg_ptr:
-                    if hasattr(msg_ptr, 'value'):
-                        # 对于ctypes.c_char_p类型
-                        msg_str = msg_ptr.value.decode("utf-8")
-                    else:
-                        # 对于bytes类型
-                        msg_str = msg_ptr.decode("utf-8")
-                else:
-                    msg_str = "{}"
-
-                event_dict = json.loads(event_str)
-                msg_dict = json.loads(msg_str)
-                user_callback(event_dict, msg_dict)
-            except (json.JSONDecodeError, TypeError, ValueError) as exc:
-                _logger.error("回调函数异常 (已捕获，不影响下载): %s", exc, exc_info=True)
-
-        c_cb = _CALLBACK_TYPE(_inner)
-        # 用 id(user_callback) 作为键，避免同一 callback 重复保存多份引用
+        pump = EventPump(user_callback, self.update_interval, metrics)
+        c_cb = _CALLBACK_TYPE(pump.push)
         self._callback_refs[id(c_cb)] = c_cb
+        self._event_pumps[id(c_cb)] = pump
         return c_cb
 
     def _release_c_callback(self, c_cb: ctypes.CFUNCTYPE): \
@@ -264,6 +981,33 @@ class TTHSDownloader:
         """释放已不再需要的 C 回调引用。"""
         key = id(c_cb)
         self._callback_refs.pop(key, None)
+        pump = self._event_pumps.pop(key, None)
+        if pump is not None:
+            pump.close()
+
+    def _hand_over_callback(self, dl_id: int, c_cb: ctypes.CFUNCTYPE) -> None: \
+        # pyright: ignore[reportGeneralTypeIssues]
+        """创建成功时把回调引用交给管理器（end 事件后释放），失败时直接释放。"""
+        if dl_id == -1:
+            self._release_c_callback(c_cb)
+            return
+        key = id(c_cb)
+        self._callback_refs.pop(key, None)
+        self._manager.register(int(dl_id), self._dll, c_cb, self._event_pumps.pop(key))
+
+    def _resolve_tuning(
+        self,
+        urls: list[str],
+        thread_count: int | None,
+        chunk_size_mb: int | None,
+        user_agent: str | None,
+    ) -> tuple[int, int]:
+        """补全传 None 的下载参数。"""
+        if thread_count is not None and chunk_size_mb is not None:
+            return thread_count, chunk_size_mb
+        tuned_threads, tuned_chunk = self.tuner.choose(urls, user_agent)
+        return (tuned_threads if thread_count is None else thread_count,
+                tuned_chunk if chunk_size_mb is None else chunk_size_mb)
 
     # ------------------------------------------------------------------
     # 公开 API
@@ -273,8 +1017,8 @@ class TTHSDownloader:
         self,
         urls: list[str],
         save_paths: list[str],
-        thread_count: int = 64,
-        chunk_size_mb: int = 10,
+        thread_count: int | None = 64,
+        chunk_size_mb: int | None = 10,
         callback: Callable[[dict, dict], None] | None = None,
         use_callback_url: bool = False,
         user_agent: str | None = None,
@@ -289,8 +1033,8 @@ class TTHSDownloader:
         参数:
             urls:               下载 URL 列表
             save_paths:         保存路径列表（与 urls 等长）
-            thread_count:       下载线程数（默认 64）
-            chunk_size_mb:      分块大小（MB，默认 10）
+            thread_count:       下载线程数（默认 64，None 表示按文件大小自动选择）
+            chunk_size_mb:      分块大小（MB，默认 10，None 表示按文件大小自动选择）
             callback:           进度回调函数 (event: dict, msg: dict) -> None
             use_callback_url:   是否启用远程回调 URL（默认 False）
             user_agent:         自定义 User-Agent（None 使用 DLL 默认值）
@@ -302,14 +1046,22 @@ class TTHSDownloader:
         返回:
             下载器实例 ID（正整数），失败时返回 -1
         """
-        tasks_json = _build_tasks_json(urls, save_paths, show_names, ids)
+        tasks_data = _encode_tasks(urls, save_paths, show_names, ids)
         task_count = len(urls)
+        thread_count, chunk_size_mb = self._resolve_tuning(
+            urls, thread_count, chunk_size_mb, user_agent
+        )
 
-        c_cb = None
-        cb_ptr = None
+        metrics = None
         if callback is not None:
-            c_cb = self._make_c_callback(callback)
-            cb_ptr = ctypes.cast(c_cb, ctypes.c_void_p)
+            # 指标依赖事件，只在设置了回调时收集
+            metrics = DownloadMetrics(task_count, thread_count, chunk_size_mb)
+            if urls:
+                # 吞吐量记入调优历史
+                metrics.add_finish_listener(lambda finished: self.tuner.record(urls[0], finished))
+        # 没有用户回调也注册 C 回调：管理器靠 end 事件释放会话
+        c_cb = self._make_c_callback(callback or _ignore_event, metrics)
+        cb_ptr = ctypes.cast(c_cb, ctypes.c_void_p)
 
         ua_bytes = user_agent.encode("utf-8") if user_agent else None
         rc_url_bytes = remote_callback_url.encode("utf-8") if remote_callback_url else None
@@ -321,7 +1073,7 @@ class TTHSDownloader:
             use_socket_ptr = None
 
         dl_id = self._dll.get_downloader(
-            tasks_json.encode("utf-8"),
+            tasks_data,
             task_count,
             thread_count,
             chunk_size_mb,
@@ -332,9 +1084,13 @@ class TTHSDownloader:
             use_socket_ptr,
         )
 
+        self._hand_over_callback(dl_id, c_cb)
         if dl_id == -1:
             _logger.error("getDownloader 返回 -1，创建下载器实例失败")
         else:
+            if metrics is not None:
+                metrics.downloader_id = int(dl_id)
+                _register_metrics(metrics)
             _logger.info("下载器已创建 (ID=%s)，共 %d 个任务", dl_id, task_count)
 
         return int(dl_id)
@@ -343,8 +1099,8 @@ class TTHSDownloader:
         self,
         urls: list[str],
         save_paths: list[str],
-        thread_count: int = 64,
-        chunk_size_mb: int = 10,
+        thread_count: int | None = 64,
+        chunk_size_mb: int | None = 10,
         callback: Callable[[dict, dict], None] | None = None,
         use_callback_url: bool = False,
         user_agent: str | None = None,
@@ -360,8 +1116,8 @@ class TTHSDownloader:
         参数:
             urls:               下载 URL 列表
             save_paths:         保存路径列表（与 urls 等长）
-            thread_count:       下载线程数（默认 64）
-            chunk_size_mb:      分块大小（MB，默认 10）
+            thread_count:       下载线程数（默认 64，None 表示按文件大小自动选择）
+            chunk_size_mb:      分块大小（MB，默认 10，None 表示按文件大小自动选择）
             callback:           进度回调函数 (event: dict, msg: dict) -> None
             use_callback_url:   是否启用远程回调 URL（默认 False）
             user_agent:         自定义 User-Agent（None 使用 DLL 默认值）
@@ -374,14 +1130,22 @@ class TTHSDownloader:
         返回:
             下载器实例 ID（正整数），失败时返回 -1
         """
-        tasks_json = _build_tasks_json(urls, save_paths, show_names, ids)
+        tasks_data = _encode_tasks(urls, save_paths, show_names, ids)
         task_count = len(urls)
+        thread_count, chunk_size_mb = self._resolve_tuning(
+            urls, thread_count, chunk_size_mb, user_agent
+        )
 
-        c_cb = None
-        cb_ptr = None
+        metrics = None
         if callback is not None:
-            c_cb = self._make_c_callback(callback)
-            cb_ptr = ctypes.cast(c_cb, ctypes.c_void_p)
+            # 指标依赖事件，只在设置了回调时收集
+            metrics = DownloadMetrics(task_count, thread_count, chunk_size_mb)
+            if urls:
+                # 吞吐量记入调优历史
+                metrics.add_finish_listener(lambda finished: self.tuner.record(urls[0], finished))
+        # 没有用户回调也注册 C 回调：管理器靠 end 事件释放会话
+        c_cb = self._make_c_callback(callback or _ignore_event, metrics)
+        cb_ptr = ctypes.cast(c_cb, ctypes.c_void_p)
 
         ua_bytes = user_agent.encode("utf-8") if user_agent else None
         rc_url_bytes = remote_callback_url.encode("utf-8") if remote_callback_url else None
@@ -399,7 +1163,7 @@ class TTHSDownloader:
             is_multiple_ptr = None
 
         dl_id = self._dll.start_download(
-            tasks_json.encode("utf-8"),
+            tasks_data,
             task_count,
             thread_count,
             chunk_size_mb,
@@ -411,9 +1175,13 @@ class TTHSDownloader:
             is_multiple_ptr,
         )
 
+        self._hand_over_callback(dl_id, c_cb)
         if dl_id == -1:
             _logger.error("startDownload 返回 -1，创建/启动下载器失败")
         else:
+            if metrics is not None:
+                metrics.downloader_id = int(dl_id)
+                _register_metrics(metrics)
             _logger.info(
                 "下载器已创建并启动 (ID=%s)，共 %d 个任务，模式=%s",
                 dl_id, task_count, '并行' if is_multiple else '顺序'
@@ -421,6 +1189,150 @@ class TTHSDownloader:
 
         return int(dl_id)
 
+    def submit(
+        self,
+        urls: list[str],
+        save_paths: list[str],
+        thread_count: int | None = None,
+        chunk_size_mb: int | None = None,
+        callback: Callable[[dict, dict], None] | None = None,
+        timeout: float | None = None,
+        is_multiple: bool | None = None,
+        **kwargs,
+    ) -> DownloadFuture:
+        """
+        启动下载并返回 DownloadFuture，可直接等待下载结束。
+
+        参数:
+            urls / save_paths: 同 start_download
+            thread_count / chunk_size_mb: 同 start_download，默认按文件大小自动选择
+            callback: 进度回调函数（可选），在 Future 记录进度后调用
+            timeout:  超时秒数（可选），到期后停止下载并以 TimeoutError 结束
+            is_multiple: True=并行下载(实验性), False/None=顺序下载
+            **kwargs: 其余参数原样传给 get_downloader
+
+        返回:
+            DownloadFuture；下载器创建失败时 Future 以 TTHSDError 结束
+
+        用法:
+            result = dl.submit(urls=[...], save_paths=[...], timeout=30).result()
+        """
+        future = DownloadFuture(self, callback)
+        # 先创建再启动，保证事件到达前 Future 已知道下载器 ID
+        dl_id = self.get_downloader(
+            urls=urls,
+            save_paths=save_paths,
+            thread_count=thread_count,
+            chunk_size_mb=chunk_size_mb,
+            callback=future._on_event,
+            **kwargs,
+        )
+        future.downloader_id = dl_id
+        if dl_id == -1:
+            future._resolve(exception=TTHSDError("创建下载器失败"))
+            return future
+        if timeout is not None:
+            future._timer = threading.Timer(timeout, future._expire)
+            future._timer.daemon = True
+            future._timer.start()
+        if is_multiple:
+            started = self.start_multiple_downloads_by_id(dl_id)
+        else:
+            started = self.start_download_by_id(dl_id)
+        if not started:
+            future._resolve(exception=TTHSDError(f"启动下载器失败 (ID={dl_id})"))
+        return future
+
+    def submit_async(self, urls: list[str], save_paths: list[str], **kwargs) -> asyncio.Future:
+        """
+        submit() 的 asyncio 版本，返回可 await 的 Future（需在事件循环中调用）。
+
+        取消返回的 Future（包括 asyncio.wait_for 超时）会调用 stop_download 停止下载。
+        自动选择参数时会同步发出 HEAD 探测请求，在事件循环中调用时建议显式指定
+        thread_count / chunk_size_mb。
+
+        用法:
+            result = await asyncio.wait_for(dl.submit_async(urls=[...], save_paths=[...]), 30)
+        """
+        return asyncio.wrap_future(self.submit(urls, save_paths, **kwargs))
+
+    def submit_bulk(
+        self,
+        tasks: Iterable[tuple[str, str]],
+        batch_size: int = DEFAULT_BULK_BATCH_SIZE,
+        max_in_flight: int = 2,
+        thread_count: int | None = None,
+        chunk_size_mb: int | None = None,
+        callback: Callable[[dict, dict], None] | None = None,
+        is_multiple: bool = True,
+        **kwargs,
+    ) -> BulkDownloadFuture:
+        """
+        分批下载大量文件，返回 BulkDownloadFuture。
+
+        后台线程从 tasks 中每次取 batch_size 个任务，通过 get_downloader +
+        start_multiple_downloads_by_id（is_multiple=False 时为顺序下载）提交一批，
+        同时最多 max_in_flight 批在下载；tasks 可以是生成器，内存占用只与
+        batch_size × max_in_flight 有关，与任务总数无关。
+
+        参数:
+            tasks:         (URL, 保存路径) 的可迭代对象
+            batch_size:    每批任务数（默认 1000）
+            max_in_flight: 同时下载的批次数（默认 2）
+            thread_count / chunk_size_mb: 同 submit，默认按第一批的文件大小自动选择，之后的批次沿用
+            callback:      进度回调函数（可选），所有批次的事件都会转发
+            is_multiple:   True=批内并行下载（默认），False=批内顺序下载
+            **kwargs:      其余参数原样传给 submit（如 user_agent，timeout 为单批超时）
+
+        返回:
+            BulkDownloadFuture
+
+        用法:
+            tasks = ((url, str(root / name)) for url, name in manifest)
+            result = dl.submit_bulk(tasks, batch_size=500).result()
+        """
+        if batch_size < 1 or max_in_flight < 1:
+            raise ValueError("batch_size 与 max_in_flight 必须为正整数")
+        bulk = BulkDownloadFuture()
+
+        def drive() -> None:
+            task_iter = iter(tasks)
+            tuning = (thread_count, chunk_size_mb)
+            try:
+                while not bulk.cancelled():
+                    # 已完成的批次可能还没从 _active 中移除
+                    active = [future for future in bulk._active_batches() if not future.done()]
+                    if len(active) >= max_in_flight:
+                        concurrent.futures.wait(active, return_when=concurrent.futures.FIRST_COMPLETED)
+                        continue
+                    batch = list(islice(task_iter, batch_size))
+                    if not batch:
+                        break
+                    urls = [url for url, _ in batch]
+                    if None in tuning:
+                        # 只按第一批选择参数，之后的批次沿用，不再逐批探测
+                        tuning = self._resolve_tuning(urls, *tuning, kwargs.get("user_agent"))
+                    future = self.submit(
+                        urls=urls,
+                        save_paths=[save_path for _, save_path in batch],
+                        thread_count=tuning[0],
+                        chunk_size_mb=tuning[1],
+                        callback=callback,
+                        is_multiple=is_multiple,
+                        **kwargs,
+                    )
+                    bulk._track(future, len(batch))
+                    if bulk.cancelled():
+                        future.cancel()
+                concurrent.futures.wait(bulk._active_batches())
+            except Exception as exc:  # 任务迭代器由调用方提供，出错时以该异常结束 Future，而不是让线程静默退出
+                bulk._finish(exception=exc)
+                return
+            bulk._finish()
+
+        threading.Thread(target=drive, name="TTHSD-Bulk", daemon=True).start()
+        return bulk
+
     def start_download_by_id(self, downloader_id: int) -> bool:
         """
         启动已创建的下载器（**顺序**下载）。
@@ -503,10 +1415,13 @@ class TTHSDownloader:
 
     def close(self):
         """
-        清理所有内部回调引用（可选调用）。
-        通常无需手动调用，Python GC 会自动释放。
+        清理尚未移交给管理器的回调引用（可选调用）。
+        进行中的下载不受影响，其回调引用由 TTHSDManager 持有到 end 事件。
         """
         self._callback_refs.clear()
+        for pump in self._event_pumps.values():
+            pump.close()
+        self._event_pumps.clear()
         _logger.info("TTHSDownloader.close() 已调用，回调引用已清理")
 
     # ------------------------------------------------------------------
@@ -527,6 +1442,629 @@ class TTHSDownloader:
             pass
 
 
+# ------------------------------------------------------------------
+# 进程级管理器: 共享动态库句柄，跟踪所有下载会话
+# ------------------------------------------------------------------
+
+class _Session:
+    """一个进行中的下载会话及其回调引用。"""
+
+    __slots__ = ("dll", "c_callback", "pump")
+
+    def __init__(self, dll: ctypes.CDLL, c_callback: ctypes.CFUNCTYPE, pump: EventPump): \
+            # pyright: ignore[reportGeneralTypeIssues]
+        self.dll = dll
+        self.c_callback = c_callback
+        self.pump = pump
+
+
+class TTHSDManager:
+    """
+    进程内唯一的 TTHSD 管理器。
+
+    - 每个动态库只加载、配置一次，所有 TTHSDownloader 共用同一个句柄
+    - 跟踪所有进行中的下载器 ID 及其回调引用，收到 end 事件后自动释放
+    - 支持对所有会话统一暂停 / 恢复 / 停止
+
+    通过 TTHSDManager.instance() 获取。
+    """
+
+    _instance: "TTHSDManager | None" = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._libraries: dict[Path, ctypes.CDLL] = {}
+        self._sessions: dict[int, _Session] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> "TTHSDManager":
+        """返回进程内唯一的管理器。"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def load_library(self, dll_path: Path) -> ctypes.CDLL:
+        """加载并配置动态库，同一路径只加载一次。"""
+        with self._lock:
+            dll = self._libraries.get(dll_path)
+            if dll is None:
+                _logger.info("加载动态库: %s", dll_path)
+                dll = ctypes.CDLL(str(dll_path))
+                TTHSDownloader._setup_dll_signatures(dll)
+                self._libraries[dll_path] = dll
+            return dll
+
+    def register(self, downloader_id: int, dll: ctypes.CDLL,
+                 c_callback: ctypes.CFUNCTYPE, pump: EventPump) -> None: \
+            # pyright: ignore[reportGeneralTypeIssues]
+        """登记新创建的下载器，回调引用保留到 end 事件。"""
+        with self._lock:
+            self._sessions[downloader_id] = _Session(dll, c_callback, pump)
+        pump.on_end = lambda: self.release(downloader_id)
+        if pump.finished:
+            # 登记前 end 事件已经处理完
+            self.release(downloader_id)
+
+    def release(self, downloader_id: int) -> None:
+        """释放下载器的回调引用。"""
+        with self._lock:
+            session = self._sessions.pop(downloader_id, None)
+        if session is not None:
+            _logger.info("下载器已结束，释放回调引用 (ID=%s)", downloader_id)
+
+    def active_ids(self) -> list[int]:
+        """返回所有进行中的下载器 ID。"""
+        with self._lock:
+            return list(self._sessions)
+
+    def _for_all(self, func_name: str) -> dict[int, bool]:
+        with self._lock:
+            sessions = list(self._sessions.items())
+        results = {}
+        for downloader_id, session in sessions:
+            ret = getattr(session.dll, func_name)(ctypes.c_int(downloader_id))
+            if ret != 0:
+                _logger.warning("%s(id=%s) 返回 %s（失败）", func_name, downloader_id, ret)
+            results[downloader_id] = ret == 0
+        return results
+
+    def pause_all(self) -> dict[int, bool]:
+        """暂停所有会话，返回 {下载器 ID: 是否成功}。"""
+        return self._for_all("pause_download")
+
+    def resume_all(self) -> dict[int, bool]:
+        """恢复所有会话，返回 {下载器 ID: 是否成功}。"""
+        return self._for_all("resume_download")
+
+    def stop_all(self) -> dict[int, bool]:
+        """停止所有会话，返回 {下载器 ID: 是否成功}。回调引用在各自的 end 事件后释放。"""
+        return self._for_all("stop_download")
+
+
+# ------------------------------------------------------------------
+# 断点续传: 会话清单持久化到磁盘，程序重启后继续未完成的任务
+# ------------------------------------------------------------------
+
+# 会话清单文件名后缀
+_MANIFEST_SUFFIX = ".session.json"
+# update 事件触发的清单保存最小间隔（秒）；endOne / err / end 总是立即保存
+_MANIFEST_SAVE_INTERVAL = 1.0
+# 每个会话最多为这么多个任务探测 ETag / Last-Modified
+_MAX_VALIDATOR_PROBES = 16
+# 内核不支持从指定偏移继续下载：服务器支持 Range 且不小于此大小的文件由会话自己按字节区间下载，
+# 已完成的区间记入清单，重启后只下载缺失的区间
+_RANGED_MIN_SIZE = 16 << 20
+# 区间大小（字节），也是中断时最多重新下载的数据量
+_RANGE_SEGMENT_SIZE = 4 << 20
+# 同时下载的区间数
+_RANGED_THREADS = 4
+# 区间下载的读超时（秒）与每次读取的字节数
+_RANGED_TIMEOUT = 30.0
+_RANGED_READ_BLOCK = 64 << 10
+
+
+def _probe_validators(url: str, user_agent: str | None = None,
+                      timeout: float = _PROBE_TIMEOUT) -> dict:
+    """
+    HEAD 请求获取 ETag / Last-Modified，以及文件大小（size）与是否支持 Range（accept_ranges）。
+    请求失败时 etag / last_modified / size 均为 None。
+    """
+    headers = {"User-Agent": user_agent} if user_agent else {}
+    probe_request = urllib.request.Request(url, method="HEAD", headers=headers)
+    try:
+        with urllib.request.urlopen(probe_request, timeout=timeout) as response:
+            length = response.headers.get("Content-Length")
+            return {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "size": int(length) if length and length.isdigit() else None,
+                "accept_ranges": response.headers.get("Accept-Ranges") == "bytes",
+            }
+    except (urllib.error.URLError, OSError, ValueError) as exc:
+        _logger.info("获取校验信息失败 (%s): %s", url, exc)
+        return {"etag": None, "last_modified": None, "size": None, "accept_ranges": False}
+
+
+def _validators_changed(task: dict, current: dict | None) -> bool:
+    """服务器上的文件是否与清单记录的不同；未探测或服务器暂时无法访问时视为未变化。"""
+    if current is None or (current["etag"] is None and current["last_modified"] is None):
+        return False
+    return (current["etag"] != task.get("etag")
+            or current["last_modified"] != task.get("last_modified"))
+
+
+def _add_range(ranges: list[list[int]], start: int, end: int) -> list[list[int]]:
+    """把 [start, end) 并入有序、不重叠的区间列表，返回新列表（不修改原列表）。"""
+    merged: list[list[int]] = []
+    for lo, hi in sorted([*ranges, [start, end]]):
+        if merged and lo <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+
+def _missing_segments(ranges: list[list[int]], total: int,
+                      segment_size: int | None = None) -> list[tuple[int, int]]:
+    """返回 [0, total) 中未被 ranges 覆盖的部分，按 segment_size（默认区间大小）切分为 (起, 止) 区间。"""
+    segment_size = segment_size or _RANGE_SEGMENT_SIZE
+    segments = []
+    pos = 0
+    for lo, hi in [*ranges, [total, total]]:
+        segments.extend((start, min(start + segment_size, lo)) for start in range(pos, lo, segment_size))
+        pos = max(pos, hi)
+    return segments
+
+
+def _probe_validators_many(urls: list[str], user_agent: str | None = None) -> list[dict]:
+    """并发探测多个 URL 的校验信息，结果顺序与 urls 一致；总耗时约为单次探测的超时时间。"""
+    if not urls:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(urls), _MAX_VALIDATOR_PROBES)) as pool:
+        return list(pool.map(lambda url: _probe_validators(url, user_agent), urls))
+
+
+class _ManifestTracker:
+    """根据下载事件更新会话清单并写回磁盘，在 Future 的事件回调之前调用。"""
+
+    def __init__(self, sessions: "ResumableDownloads", manifest: dict,
+                 callback: Callable[[dict, dict], None] | None):
+        self.sessions = sessions
+        self.manifest = manifest
+        self.callback = callback
+        self.tasks = {task["id"]: task for task in manifest["tasks"]}
+        self._last_save = 0.0
+
+    def __call__(self, event: dict, msg: dict) -> None:
+        event_type = event.get("Type")
+        task = self.tasks.get(event.get("ID"))
+        if event_type == "update" and task is not None:
+            task["downloaded"] = int(msg.get("Downloaded", 0))
+            task["total"] = int(msg.get("Total", 0)) or task.get("total")
+            if time.monotonic() - self._last_save >= _MANIFEST_SAVE_INTERVAL:
+                self._save()
+        elif event_type == "endOne" and task is not None:
+            task["done"] = True
+            if task.get("total"):
+                task["downloaded"] = task["total"]
+            self._save()
+        elif event_type == "err":
+            self._save()
+        elif event_type == "end":
+            if all(task.get("done") for task in self.manifest["tasks"]):
+                self.sessions.discard(self.manifest["session_id"])
+            else:
+                self._save()
+        if self.callback is not None:
+            self.callback(event, msg)
+
+    def _save(self) -> None:
+        self._last_save = time.monotonic()
+        self.sessions._save_manifest(self.manifest)
+
+
+class _DownloadStopped(Exception):
+    """区间下载已被停止。"""
+
+
+class _RangedDownload:
+    """
+    不经过内核下载一个会话的任务：任务依次下载，带 "ranges" 字段的任务按字节区间并行下载，
+    每完成一个区间就并入 task["ranges"]（由 _ManifestTracker 随事件写回清单），其余任务整个下载。
+
+    事件格式与内核相同（start / startOne / update / endOne / err / end），经事件泵转发给 callback。
+    """
+
+    def __init__(self, tasks: list[dict], user_agent: str | None,
+                 callback: Callable[[dict, dict], None]):
+        self.tasks = tasks
+        self.user_agent = user_agent
+        self._pump = EventPump(callback)
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        threading.Thread(target=self._run, name="TTHSD-Ranged", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _emit(self, event_type: str, task: dict | None, msg: dict) -> None:
+        event = {
+            "Type": event_type,
+            "Name": event_type,
+            "ShowName": task["show_name"] if task else "",
+            "ID": task["id"] if task else "",
+        }
+        self._pump.push(json.dumps(event, ensure_ascii=False).encode("utf-8"),
+                        json.dumps(msg, ensure_ascii=False).encode("utf-8"))
+
+    def _checkpoint(self) -> None:
+        if self._stopped.is_set():
+            raise _DownloadStopped()
+
+    def _open(self, url: str, byte_range: tuple[int, int] | None = None):
+        headers = {"User-Agent": self.user_agent} if self.user_agent else {}
+        if byte_range is not None:
+            headers["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=_RANGED_TIMEOUT)
+
+    def _run(self) -> None:
+        self._emit("start", None, {})
+        for index, task in enumerate(self.tasks, 1):
+            info = {"URL": task["url"], "Index": index, "Total": len(self.tasks)}
+            self._emit("startOne", task, info)
+            try:
+                if "ranges" in task:
+                    self._download_ranges(task)
+                else:
+                    self._download_whole(task)
+            except _DownloadStopped:
+                break
+            except (urllib.error.URLError, OSError, ValueError) as exc:
+                self._emit("err", task, {"Error": f"{task['url']}: {exc}"})
+                continue
+            self._emit("endOne", task, info)
+        # 停止时同样发出 end，清单随之保存、事件泵退出
+        self._emit("end", None, {})
+
+    def _download_whole(self, task: dict) -> None:
+        save_path = Path(task["save_path"])
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._open(task["url"]) as response, open(save_path, "wb") as f:
+            total = int(response.headers.get("Content-Length") or 0)
+            downloaded = 0
+            while True:
+                self._checkpoint()
+                block = response.read(_RANGED_READ_BLOCK)
+                if not block:
+                    break
+                f.write(block)
+                downloaded += len(block)
+                self._emit("update", task, {"Total": total, "Downloaded": downloaded})
+
+    def _download_ranges(self, task: dict) -> None:
+        save_path = Path(task["save_path"])
+        total = task["total"]
+        try:
+            size = save_path.stat().st_size
+        except OSError:
+            size = None
+        if size != total:
+            # 文件缺失或不完整，已记录的区间作废
+            task["ranges"] = []
+            save_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(save_path, "wb") as f:
+                f.truncate(total)
+        progress = {"downloaded": sum(hi - lo for lo, hi in task["ranges"])}
+
+        def fetch(segment: tuple[int, int]) -> None:
+            start, end = segment
+            with self._open(task["url"], (start, end - 1)) as response, open(save_path, "r+b") as f:
+                if response.status != 206:
+                    raise ValueError(f"服务器没有按 Range 返回部分内容 (HTTP {response.status})")
+                f.seek(start)
+                pos = start
+                while pos < end:
+                    self._checkpoint()
+                    block = response.read(min(_RANGED_READ_BLOCK, end - pos))
+                    if not block:
+                        raise ValueError(f"区间 {start}-{end - 1} 数据不完整")
+                    f.write(block)
+                    pos += len(block)
+                    with self._lock:
+                        progress["downloaded"] += len(block)
+                        downloaded = progress["downloaded"]
+                    self._emit("update", task, {"Total": total, "Downloaded": downloaded})
+            # 文件关闭后才记为完成；整体替换列表，写清单时不会读到修改中的列表
+            with self._lock:
+                task["ranges"] = _add_range(task["ranges"], start, end)
+
+        segments = _missing_segments(task["ranges"], total)
+        if not segments:
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(_RANGED_THREADS, len(segments))) as pool:
+            for future in [pool.submit(fetch, segment) for segment in segments]:
+                future.result()
+
+
+class _RangedFuture(DownloadFuture):
+    """_RangedDownload 的 Future：取消或超时时停止区间下载，而不是调用 stop_download。"""
+
+    def __init__(self, callback: Callable[[dict, dict], None] | None = None):
+        super().__init__(None, callback)
+        self.download: _RangedDownload | None = None
+
+    def _expire(self) -> None:
+        if self.done():
+            return
+        self.download.stop()
+        self._resolve(exception=TimeoutError("下载超时"))
+
+    def cancel(self) -> bool:
+        if not concurrent.futures.Future.cancel(self):
+            return False
+        if self._timer is not None:
+            self._timer.cancel()
+        self.download.stop()
+        return True
+
+
+class ResumableDownloads:
+    """
+    可断点续传的下载会话。
+
+    每个会话的任务列表（URL、保存路径、任务 ID）、各任务已下载字节数与完成状态、
+    以及 ETag / Last-Modified 保存在 directory 下的清单文件中，下载过程中随事件更新，
+    全部完成后删除。程序重启后 resume() / resume_all() 只重新提交未完成的任务：
+    已完成的任务若文件缺失、大小不符或服务器上的文件已变化（校验信息不同），
+    同样重新下载。
+
+    内核不支持从指定偏移继续下载。服务器支持 Range 的大文件（不小于 16 MB）
+    不经过内核，按 4 MB 的字节区间下载，清单记录已完成的区间（"ranges"），
+    续传时校验信息不变则只下载缺失的区间；其余任务由内核下载，未完成时从头下载。
+
+    参数:
+        directory:  清单文件目录
+        downloader: 用于提交下载的 TTHSDownloader，None 时在首次提交时创建
+
+    用法:
+        sessions = ResumableDownloads(APP_DATA_DIR / "temp" / "sessions")
+        future = sessions.submit(urls=[...], save_paths=[...])
+        # 程序重启后
+        futures = sessions.resume_all()
+    """
+
+    def __init__(self, directory: str | Path, downloader: TTHSDownloader | None = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._downloader = downloader
+        self._lock = threading.Lock()
+
+    @property
+    def downloader(self) -> TTHSDownloader:
+        with self._lock:
+            if self._downloader is None:
+                self._downloader = TTHSDownloader()
+            return self._downloader
+
+    # ------------------------------------------------------------------
+    # 清单文件
+    # ------------------------------------------------------------------
+
+    def _manifest_path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}{_MANIFEST_SUFFIX}"
+
+    def _save_manifest(self, manifest: dict) -> None:
+        """原子写入清单（先写临时文件再替换）。"""
+        manifest["updated_at"] = time.time()
+        path = self._manifest_path(manifest["session_id"])
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            with self._lock:
+                tmp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+                tmp_path.replace(path)
+        except OSError as exc:
+            _logger.warning("保存下载会话清单失败 (%s): %s", path, exc)
+
+    def _load_manifest(self, session_id: str) -> dict | None:
+        try:
+            with open(self._manifest_path(session_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as exc:
+            _logger.warning("读取下载会话清单失败 (%s): %s", session_id, exc)
+            return None
+
+    def session_ids(self) -> list[str]:
+        """返回磁盘上所有未完成会话的 ID。"""
+        return sorted(path.name[:-len(_MANIFEST_SUFFIX)]
+                      for path in self.directory.glob(f"*{_MANIFEST_SUFFIX}"))
+
+    def pending(self) -> list[dict]:
+        """返回未完成会话的摘要 {session_id, tasks, done_tasks, downloaded, total, updated_at}。"""
+        summaries = []
+        for session_id in self.session_ids():
+            manifest = self._load_manifest(session_id)
+            if manifest is None:
+                continue
+            tasks = manifest["tasks"]
+            summaries.append({
+                "session_id": session_id,
+                "tasks": len(tasks),
+                "done_tasks": sum(1 for task in tasks if task.get("done")),
+                "downloaded": sum(task.get("downloaded", 0) for task in tasks),
+                "total": sum(task.get("total") or 0 for task in tasks),
+                "updated_at": manifest.get("updated_at"),
+            })
+        return summaries
+
+    def discard(self, session_id: str) -> None:
+        """删除会话清单（不删除已下载的文件）。"""
+        with self._lock:
+            self._manifest_path(session_id).unlink(missing_ok=True)
+
+    # ------------------------------------------------------------------
+    # 提交与续传
+    # ------------------------------------------------------------------
+
+    def submit(
+        self,
+        urls: list[str],
+        save_paths: list[str],
+        session_id: str | None = None,
+        callback: Callable[[dict, dict], None] | None = None,
+        thread_count: int | None = None,
+        chunk_size_mb: int | None = None,
+        is_multiple: bool | None = None,
+        user_agent: str | None = None,
+        timeout: float | None = None,
+    ) -> DownloadFuture:
+        """
+        记录会话清单后启动下载，返回 DownloadFuture。
+
+        参数:
+            urls / save_paths: 同 TTHSDownloader.submit
+            session_id: 会话 ID（可选，省略时自动生成）；已存在同 ID 的清单时会被覆盖
+            callback / thread_count / chunk_size_mb / is_multiple / user_agent / timeout:
+                同 TTHSDownloader.submit，除 callback 与 timeout 外都记入清单，续传时沿用
+        """
+        if len(urls) != len(save_paths):
+            raise ValueError(
+                f"urls 与 save_paths 长度不一致: {len(urls)} vs {len(save_paths)}"
+            )
+        session_id = session_id or uuid.uuid4().hex
+        validators = _probe_validators_many(urls[:_MAX_VALIDATOR_PROBES], user_agent)
+        tasks = []
+        for i, (url, save_path) in enumerate(zip(urls, save_paths)):
+            task = {
+                "id": f"{session_id}-{i}",
+                "url": url,
+                "save_path": str(save_path),
+                "show_name": _show_name(url, i),
+                "downloaded": 0,
+                "total": None,
+                "done": False,
+            }
+            if i < len(validators):
+                probe = validators[i]
+                task["etag"] = probe["etag"]
+                task["last_modified"] = probe["last_modified"]
+                if probe["accept_ranges"] and (probe["size"] or 0) >= _RANGED_MIN_SIZE:
+                    task["total"] = probe["size"]
+                    task["ranges"] = []
+            tasks.append(task)
+        manifest = {
+            "session_id": session_id,
+            "created_at": time.time(),
+            "options": {
+                "thread_count": thread_count,
+                "chunk_size_mb": chunk_size_mb,
+                "is_multiple": is_multiple,
+                "user_agent": user_agent,
+            },
+            "tasks": tasks,
+        }
+        self._save_manifest(manifest)
+        return self._start(manifest, tasks, callback, timeout)
+
+    def _start(self, manifest: dict, tasks: list[dict],
+               callback: Callable[[dict, dict], None] | None,
+               timeout: float | None) -> DownloadFuture:
+        options = manifest["options"]
+        if any("ranges" in task for task in tasks):
+            return self._start_ranged(manifest, tasks, callback, timeout)
+        return self.downloader.submit(
+            urls=[task["url"] for task in tasks],
+            save_paths=[task["save_path"] for task in tasks],
+            thread_count=options.get("thread_count"),
+            chunk_size_mb=options.get("chunk_size_mb"),
+            callback=_ManifestTracker(self, manifest, callback),
+            timeout=timeout,
+            is_multiple=options.get("is_multiple"),
+            user_agent=options.get("user_agent"),
+            show_names=[task["show_name"] for task in tasks],
+            ids=[task["id"] for task in tasks],
+        )
+
+    def _start_ranged(self, manifest: dict, tasks: list[dict],
+                      callback: Callable[[dict, dict], None] | None,
+                      timeout: float | None) -> DownloadFuture:
+        """含按区间下载的任务时，整个会话由 _RangedDownload 下载。"""
+        future = _RangedFuture(_ManifestTracker(self, manifest, callback))
+        future.download = _RangedDownload(tasks, manifest["options"].get("user_agent"), future._on_event)
+        if timeout is not None:
+            future._timer = threading.Timer(timeout, future._expire)
+            future._timer.daemon = True
+            future._timer.start()
+        future.download.start()
+        return future
+
+    @staticmethod
+    def _still_complete(task: dict, current: dict | None) -> bool:
+        """已完成的任务：文件仍在、大小相符，且服务器上的文件没有变化（current 为刚探测到的校验信息）。"""
+        try:
+            size = Path(task["save_path"]).stat().st_size
+        except OSError:
+            return False
+        if task.get("total") and size != task["total"]:
+            return False
+        # 服务器暂时无法访问时相信本地文件
+        return not _validators_changed(task, current)
+
+    def resume(self, session_id: str,
+               callback: Callable[[dict, dict], None] | None = None,
+               timeout: float | None = None) -> DownloadFuture | None:
+        """
+        继续下载会话中未完成的任务。
+
+        返回:
+            DownloadFuture；会话不存在或所有任务都已完成（此时清单被删除）时返回 None
+        """
+        manifest = self._load_manifest(session_id)
+        if manifest is None:
+            return None
+        user_agent = manifest["options"].get("user_agent")
+        # 记录过校验信息的任务一次性并发探测，避免服务器不可达时逐个等待超时
+        tasks = manifest["tasks"]
+        probed = [i for i, task in enumerate(tasks) if task.get("etag") or task.get("last_modified")]
+        validators = dict(zip(probed, _probe_validators_many([tasks[i]["url"] for i in probed], user_agent)))
+        remaining = []
+        for i, task in enumerate(tasks):
+            current = validators.get(i)
+            if task.get("done") and self._still_complete(task, current):
+                continue
+            if task.get("done"):
+                _logger.info("已下载的文件缺失或已变化，重新下载: %s", task["save_path"])
+            if "ranges" in task and (task.get("done") or _validators_changed(task, current)):
+                task["ranges"] = []
+            task["done"] = False
+            task["downloaded"] = sum(hi - lo for lo, hi in task.get("ranges", ()))
+            if current is not None and not (current["etag"] is None and current["last_modified"] is None):
+                task["etag"] = current["etag"]
+                task["last_modified"] = current["last_modified"]
+            remaining.append(task)
+        if not remaining:
+            self.discard(session_id)
+            return None
+        self._save_manifest(manifest)
+        _logger.info("继续下载会话 %s: 剩余 %d/%d 个任务",
+                     session_id, len(remaining), len(manifest["tasks"]))
+        return self._start(manifest, remaining, callback, timeout)
+
+    def resume_all(self, callback: Callable[[dict, dict], None] | None = None) -> dict[str, DownloadFuture]:
+        """继续所有未完成的会话，返回 {会话 ID: DownloadFuture}。"""
+        futures = {}
+        for session_id in self.session_ids():
+            future = self.resume(session_id, callback)
+            if future is not None:
+                futures[session_id] = future
+        return futures
+
+
 # ------------------------------------------------------------------
 # 快捷辅助工具: 构建事件回调
 # ------------------------------------------------------------------
@@ -592,15 +2130,17 @@ def quick_download(
     urls: list[str],
     save_paths: list[str],
     dll_path: str | Path | None = None,
-    thread_count: int = 64,
-    chunk_size_mb: int = 10,
+    thread_count: int | None = None,
+    chunk_size_mb: int | None = None,
     callback: Callable[[dict, dict], None] | None = None,
     is_multiple: bool = False,
 ) -> int:
     """
     快捷函数：一行代码发起下载，返回下载器 ID。
 
-    注意：此函数内部不会等待下载完成，使用方需自行等待（如通过 callback 中的 end 事件判断）。
+    thread_count / chunk_size_mb 默认按文件大小与历史吞吐量自动选择。
+
+    注意：此函数内部不会等待下载完成；需要等待时使用 TTHSDownloader.submit() 返回的 Future。
 
     用法:
         dl_id = quick_download(
@@ -0,0 +1,287 @@
+"""
+TTHSD_shim.py - TTHSD 动态库的 Python 替身
+
+实现与 tthsd 动态库相同的导出函数:
+  get_downloader / start_download / start_download_id / start_multiple_downloads_id /
+  pause_download / resume_download / stop_download
+
+参数与 TTHSD_interface 通过 ctypes 传入的完全一致（char* 字节串、c_void_p 回调指针、
+bool* 指针、c_int 实例 ID），下载使用 urllib 从 HTTP 服务器获取，事件按内核的格式
+（start / startOne / update / endOne / end / err）通过同一个 C 回调发出，
+update 事件来自各下载线程，频率与真实内核相近。
+
+用于在没有动态库的环境中测试与评测 TTHSD_interface，不用于正式下载。
+
+用法:
+    from TTHSD_interface import TTHSDownloader
+    from TTHSD_shim import ShimLibrary
+
+    dl = TTHSDownloader(library=ShimLibrary())
+    result = dl.submit(urls=["http://127.0.0.1:8000/a.bin"], save_paths=["./a.bin"]).result()
+"""
+
+import ctypes
+import itertools
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from TTHSD_interface import _CALLBACK_TYPE
+
+# 每读取这么多字节发出一次 update 事件
+_READ_BLOCK = 64 * 1024
+_REQUEST_TIMEOUT = 30.0
+
+
+class _Stopped(Exception):
+    """下载器已被 stop_download 停止。"""
+
+
+def _as_int(value) -> int:
+    """ctypes.c_int / c_void_p 或 int 转为 int。"""
+    return value.value if hasattr(value, "value") else int(value)
+
+
+def _read_bool_ptr(ptr) -> bool | None:
+    """读取 bool* 参数（None 表示未提供）。"""
+    if ptr is None:
+        return None
+    address = _as_int(ptr)
+    if not address:
+        return None
+    return ctypes.cast(address, ctypes.POINTER(ctypes.c_bool)).contents.value
+
+
+class _ShimDownloader:
+    """一个下载器实例：按任务顺序或并行下载，大文件按分块多线程下载。"""
+
+    def __init__(self, downloader_id: int, tasks: list[dict], thread_count: int,
+                 chunk_size_mb: int, callback, user_agent: str | None, on_finish):
+        self.downloader_id = downloader_id
+        self.on_finish = on_finish
+        self.tasks = tasks
+        self.thread_count = max(thread_count, 1)
+        self.chunk_size = max(chunk_size_mb, 1) << 20
+        self.callback = callback
+        self.user_agent = user_agent
+        self._running = threading.Event()
+        self._running.set()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ------------------------------------------------------------------
+    # 事件
+    # ------------------------------------------------------------------
+
+    def _emit(self, event_type: str, task: dict | None, msg: dict) -> None:
+        if self.callback is None:
+            return
+        event = {
+            "Type": event_type,
+            "Name": event_type,
+            "ShowName": task["show_name"] if task else "",
+            "ID": task["id"] if task else "",
+        }
+        self.callback(
+            json.dumps(event, ensure_ascii=False).encode("utf-8"),
+            json.dumps(msg, ensure_ascii=False).encode("utf-8"),
+        )
+
+    # ------------------------------------------------------------------
+    # 控制
+    # ------------------------------------------------------------------
+
+    def start(self, parallel: bool) -> bool:
+        if self._thread is not None:
+            return False
+        self._thread = threading.Thread(
+            target=self._run, args=(parallel,), name=f"TTHSD-Shim-{self.downloader_id}", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def pause(self) -> None:
+        self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._running.set()
+
+    def _checkpoint(self) -> None:
+        """暂停时等待恢复，已停止时中断下载。"""
+        self._running.wait()
+        if self._stopped.is_set():
+            raise _Stopped()
+
+    # ------------------------------------------------------------------
+    # 下载
+    # ------------------------------------------------------------------
+
+    def _run(self, parallel: bool) -> None:
+        self._emit("start", None, {})
+        indexed = list(enumerate(self.tasks, 1))
+        if parallel and len(indexed) > 1:
+            with ThreadPoolExecutor(max_workers=min(self.thread_count, len(indexed))) as pool:
+                list(pool.map(lambda item: self._run_task(*item), indexed))
+        else:
+            for index, task in indexed:
+                if self._stopped.is_set():
+                    break
+                self._run_task(index, task)
+        # 与内核一致：结束后实例被移除
+        self.on_finish(self.downloader_id)
+        self._emit("end", None, {})
+
+    def _run_task(self, index: int, task: dict) -> None:
+        info = {"URL": task["url"], "Index": index, "Total": len(self.tasks)}
+        self._emit("startOne", task, info)
+        try:
+            self._download(task)
+        except _Stopped:
+            return
+        except (urllib.error.URLError, OSError, ValueError) as exc:
+            self._emit("err", task, {"Error": f"{task['url']}: {exc}"})
+            return
+        self._emit("endOne", task, info)
+
+    def _open(self, url: str, byte_range: tuple[int, int] | None = None):
+        headers = {"User-Agent": self.user_agent} if self.user_agent else {}
+        if byte_range is not None:
+            headers["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=_REQUEST_TIMEOUT)
+
+    def _download(self, task: dict) -> None:
+        save_path = Path(task["save_path"])
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        response = self._open(task["url"])
+        total = int(response.headers.get("Content-Length") or 0)
+        ranged = (self.thread_count > 1 and total > self.chunk_size
+                  and response.headers.get("Accept-Ranges") == "bytes")
+        if not ranged:
+            with response, open(save_path, "wb") as f:
+                downloaded = 0
+                while True:
+                    self._checkpoint()
+                    block = response.read(_READ_BLOCK)
+                    if not block:
+                        break
+                    f.write(block)
+                    downloaded += len(block)
+                    self._emit("update", task, {"Total": total, "Downloaded": downloaded})
+            return
+
+        # 分块下载：预分配文件，各线程按 Range 写入各自的区间
+        response.close()
+        with open(save_path, "wb") as f:
+            f.truncate(total)
+        progress = {"downloaded": 0}
+        lock = threading.Lock()
+
+        def fetch(start: int) -> None:
+            end = min(start + self.chunk_size, total) - 1
+            with self._open(task["url"], (start, end)) as part, open(save_path, "r+b") as f:
+                f.seek(start)
+                while True:
+                    self._checkpoint()
+                    block = part.read(_READ_BLOCK)
+                    if not block:
+                        break
+                    f.write(block)
+                    with lock:
+                        progress["downloaded"] += len(block)
+                        downloaded = progress["downloaded"]
+                    self._emit("update", task, {"Total": total, "Downloaded": downloaded})
+
+        chunks = range(0, total, self.chunk_size)
+        with ThreadPoolExecutor(max_workers=min(self.thread_count, len(chunks))) as pool:
+            for future in [pool.submit(fetch, start) for start in chunks]:
+                future.result()
+
+
+class ShimLibrary:
+    """
+    与 tthsd 动态库导出函数一致的 Python 实现，可作为 TTHSDownloader(library=...) 使用。
+
+    返回值约定与动态库相同：get_downloader / start_download 返回实例 ID（失败 -1），
+    其余函数成功返回 0，实例不存在返回 -1。
+    """
+
+    def __init__(self):
+        self._downloaders: dict[int, _ShimDownloader] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _remove(self, downloader_id: int) -> None:
+        with self._lock:
+            self._downloaders.pop(downloader_id, None)
+
+    def _lookup(self, downloader_id) -> _ShimDownloader | None:
+        with self._lock:
+            return self._downloaders.get(_as_int(downloader_id))
+
+    def get_downloader(self, tasks_data: bytes, task_count: int, thread_count: int, chunk_size_mb: int,
+                       callback, use_callback_url: bool, user_agent: bytes | None,
+                       remote_callback_url: bytes | None, use_socket) -> int:
+        try:
+            tasks = json.loads(tasks_data)
+        except (json.JSONDecodeError, TypeError):
+            return -1
+        if len(tasks) != _as_int(task_count):
+            return -1
+        c_callback = None
+        if callback is not None and _as_int(callback):
+            c_callback = _CALLBACK_TYPE(_as_int(callback))
+        with self._lock:
+            downloader_id = next(self._ids)
+            self._downloaders[downloader_id] = _ShimDownloader(
+                downloader_id, tasks, _as_int(thread_count), _as_int(chunk_size_mb), c_callback,
+                user_agent.decode("utf-8") if user_agent else None, self._remove,
+            )
+        return downloader_id
+
+    def start_download(self, tasks_data: bytes, task_count: int, thread_count: int, chunk_size_mb: int,
+                       callback, use_callback_url: bool, user_agent: bytes | None,
+                       remote_callback_url: bytes | None, use_socket, is_multiple) -> int:
+        downloader_id = self.get_downloader(
+            tasks_data, task_count, thread_count, chunk_size_mb, callback,
+            use_callback_url, user_agent, remote_callback_url, use_socket,
+        )
+        if downloader_id != -1:
+            self._downloaders[downloader_id].start(bool(_read_bool_ptr(is_multiple)))
+        return downloader_id
+
+    def start_download_id(self, downloader_id) -> int:
+        downloader = self._lookup(downloader_id)
+        return 0 if downloader is not None and downloader.start(parallel=False) else -1
+
+    def start_multiple_downloads_id(self, downloader_id) -> int:
+        downloader = self._lookup(downloader_id)
+        return 0 if downloader is not None and downloader.start(parallel=True) else -1
+
+    def pause_download(self, downloader_id) -> int:
+        downloader = self._lookup(downloader_id)
+        if downloader is None:
+            return -1
+        downloader.pause()
+        return 0
+
+    def resume_download(self, downloader_id) -> int:
+        downloader = self._lookup(downloader_id)
+        if downloader is None:
+            return -1
+        downloader.resume()
+        return 0
+
+    def stop_download(self, downloader_id) -> int:
+        with self._lock:
+            downloader = self._downloaders.pop(_as_int(downloader_id), None)
+        if downloader is None:
+            return -1
+        downloader.stop()
+        return 0
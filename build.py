@@ -2,7 +2,10 @@
 """
 打包脚本 - 使用PyInstaller打包AI-Chat2应用程序
 """
+import hashlib
+import json
 import os
+import platform
 import subprocess
 import sys
 
@@ -18,6 +21,24 @@ ICON_FILE = "favicon.ico"
 # 输出目录
 OUTPUT_DIR = os.path.join(PROJECT_ROOT, "dist")
 
+# 可执行文件
+EXECUTABLE = os.path.join(OUTPUT_DIR, "AI-Chat2.exe" if sys.platform == "win32" else "AI-Chat2")
+
+# 版本文件
+VERSION_FILE = os.path.join(PROJECT_ROOT, "aichat.txt")
+
+# 发布清单：写在仓库根目录（与 aichat.txt 放在一起），提交到 main 分支后供程序内更新使用
+RELEASE_MANIFEST = os.path.join(PROJECT_ROOT, "release.json")
+
+# 分块文件目录：按哈希命名，与可执行文件一起上传到发布页
+BLOCKS_DIR = os.path.join(OUTPUT_DIR, "blocks")
+
+# 发布页下载地址
+RELEASE_BASE_URL = "https://github.com/xiaohuihuib/AI-Chat2/releases/download/v{version}"
+
+# 分块大小：更新时只下载与旧版本不同的分块
+RELEASE_BLOCK_SIZE = 4 * 1024 * 1024
+
 # 打包命令
 PACK_COMMAND = [
     sys.executable,
@@ -42,6 +63,47 @@ PACK_COMMAND = [
     MAIN_SCRIPT  # 主脚本文件
 ]
 
+def write_release_manifest():
+    """生成发布清单与按哈希命名的分块文件
+
+    release.json 中按系统记录可执行文件的地址、大小、SHA-256 与分块哈希，
+    多个系统分别打包时合并到同一版本的清单中：在其他机器上打包前先拉取已提交的
+    release.json，否则只会包含当前系统。
+    """
+    with open(VERSION_FILE, "r", encoding="utf-8") as f:
+        version = f.read().strip()
+    base_url = RELEASE_BASE_URL.format(version=version)
+
+    os.makedirs(BLOCKS_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    blocks = []
+    size = 0
+    with open(EXECUTABLE, "rb") as f:
+        for block in iter(lambda: f.read(RELEASE_BLOCK_SIZE), b""):
+            digest.update(block)
+            block_hash = hashlib.sha256(block).hexdigest()
+            blocks.append(block_hash)
+            size += len(block)
+            with open(os.path.join(BLOCKS_DIR, block_hash), "wb") as block_file:
+                block_file.write(block)
+
+    manifest = {"version": version, "block_url": base_url + "/{hash}", "platforms": {}}
+    if os.path.exists(RELEASE_MANIFEST):
+        with open(RELEASE_MANIFEST, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+        if existing.get("version") == version:
+            manifest["platforms"] = existing.get("platforms", {})
+    manifest["platforms"][platform.system().lower()] = {
+        "url": f"{base_url}/{os.path.basename(EXECUTABLE)}",
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "block_size": RELEASE_BLOCK_SIZE,
+        "blocks": blocks,
+    }
+    with open(RELEASE_MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"发布清单: {RELEASE_MANIFEST}（{len(blocks)} 个分块，{len(set(blocks))} 个不同分块）")
+
 def main():
     """执行打包命令"""
     print("开始打包AI-Chat2应用程序...")
@@ -71,7 +133,8 @@ def main():
 
         if result.returncode == 0:
             print("\n打包成功！")
-            print(f"可执行文件位置: {os.path.join(OUTPUT_DIR, 'AI-Chat2.exe')}")
+            print(f"可执行文件位置: {EXECUTABLE}")
+            write_release_manifest()
         else:
             print("\n打包失败！")
             print(f"返回码: {result.returncode}")
@@ -5,19 +5,41 @@ AI-Chat2 - 智能对话聊天程序
 功能: 基于pywebview和Flask的单文件可执行聊天应用
 """
 import os
+import io
+import re
 import json
+import gzip
+import bisect
+import asyncio
+import sqlite3
 import threading
+import uuid
 import time
 import sys
+import hashlib
+import platform
+import shlex
+import shutil
+import subprocess
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, Literal, TypedDict
 import urllib.request
 import ssl
-from flask import Flask, request, jsonify
+import httpx
+from flask import Flask, Response, request, jsonify, stream_with_context
 import webview
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from openai import OpenAIError, RateLimitError, AuthenticationError
-from TTHSD_interface import TTHSDownloader
+from TTHSD_interface import ResumableDownloads, TTHSDManager, TTHSDownloader, get_download_metrics
+
+# ASGI服务模式的可选依赖
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
 
 # 打印Python路径
 print(f"Python路径: {sys.path}")
@@ -44,13 +66,37 @@ print(f"数据目录创建成功: {APP_DATA_DIR.exists()}")
 # 配置文件路径
 CONFIG_FILE = APP_DATA_DIR / 'config.json'
 CHAT_HISTORY_FILE = APP_DATA_DIR / 'chat_history.json'
+CHAT_JOURNAL_FILE = APP_DATA_DIR / 'chat_history.jsonl'
+CHAT_DB_FILE = APP_DATA_DIR / 'chat_history.db'
+# 闲置对话的归档目录，每个对话一个压缩文件
+CHAT_ARCHIVE_DIR = APP_DATA_DIR / 'archive'
+# 消息与标题的全文索引（SQLite FTS5），可以随时删除，启动时重建
+CHAT_SEARCH_DB_FILE = APP_DATA_DIR / 'search_index.db'
+
+# 对话日志累计多少条记录后合并回 chat_history.json
+JOURNAL_COMPACT_THRESHOLD = 500
+
+# 配置与对话快照保留的备份代数（config.json.bak1 为最近一代）
+BACKUP_GENERATIONS = 3
+
+# 后台写入：最后一次修改后等待多久再写盘（秒），连续修改时最多等待多久
+WRITE_BEHIND_DELAY = 0.05
+WRITE_BEHIND_MAX_DELAY = 1.0
+WRITE_BEHIND_RETRY_INTERVAL = 1.0   # 写入失败后重试的间隔（秒）
+# 写盘耗时直方图的分桶上限（毫秒）
+FLUSH_LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
 
 # 默认配置
 DEFAULT_CONFIG = {
     "api_key": "",
     "base_url": "",
     "model": "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B",
-    "system_prompt": "你是一个智能助手，帮助用户解决问题。"
+    "system_prompt": "你是一个智能助手，帮助用户解决问题。",
+    "storage_backend": "json",  # 对话存储后端: json（日志+快照）或 sqlite
+    "context_token_budget": 8000,  # 发送给模型的历史消息token预算，0表示不限制
+    "context_summary": False,  # 超出预算的早期对话是否用摘要代替
+    "archive_idle_days": 30,  # 闲置超过多少天的对话移入压缩归档（json存储后端），0表示不归档
+    "server_mode": "flask"  # 服务模式: flask（开发服务器）或 asgi（需安装uvicorn）
 }
 
 # 全局变量
@@ -60,74 +106,1557 @@ app.config['SECRET_KEY'] = 'supersecretkey'
 # 版本检查URL
 VERSION_URL = "https://raw.githubusercontent.com/xiaohuihuib/AI-Chat2/refs/heads/main/aichat.txt"
 
+# 发布清单URL（与版本文件放在一起），提供新版本可执行文件的地址、SHA-256与分块哈希
+RELEASE_MANIFEST_URL = "https://raw.githubusercontent.com/xiaohuihuib/AI-Chat2/refs/heads/main/release.json"
+
 # 下载临时目录
 TEMP_DIR = APP_DATA_DIR / 'temp'
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
+# 可续传下载的会话清单，程序重启后继续未完成的下载
+DOWNLOAD_SESSIONS_DIR = TEMP_DIR / 'sessions'
+
+# 应用内更新：下载的新版本与分块保存在这里，pending.json 记录待安装的更新
+UPDATE_DIR = TEMP_DIR / 'update'
+UPDATE_PENDING_FILE = UPDATE_DIR / 'pending.json'
+UPDATE_SESSION_PREFIX = 'update-'   # 更新下载会话ID前缀，由更新程序自己继续
+UPDATE_DOWNLOAD_TIMEOUT = 3600      # 下载更新包的超时（秒）
+
+# 更新检查结果缓存
+UPDATE_CHECK_FILE = APP_DATA_DIR / 'update_check.json'
+UPDATE_CHECK_TTL = 6 * 3600        # 检查成功后的缓存有效期（秒）
+UPDATE_RETRY_INTERVAL = 10 * 60    # 检查失败后重试的间隔（秒）
+VERSION_DOWNLOAD_TIMEOUT = 15      # 下载版本文件的超时（秒）
+
 # 对话管理
-def load_config() -> Dict[str, Any]:
-    """加载配置"""
-    if CONFIG_FILE.exists():
+def _backup_path(path: Path, generation: int) -> Path:
+    return path.with_name(f'{path.name}.bak{generation}')
+
+def _fsync_dir(directory: Path) -> None:
+    """同步目录项，保证重命名在断电后仍然有效（Windows 不支持打开目录，跳过）"""
+    if os.name == 'nt':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _atomic_write_json(path: Path, data: Any, backups: int = BACKUP_GENERATIONS,
+                       indent: int | None = 2) -> None:
+    """崩溃安全地写入JSON文件
+
+    先完整写入临时文件并 fsync，再把现有文件轮换为 .bak1 … .bak{backups}，
+    最后把临时文件重命名为目标文件。任何时刻崩溃，目标文件、临时文件或
+    最近的备份中总有一份是完整的，由 _load_json_with_recovery 找回。
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent,
+                  separators=None if indent else (',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    if backups > 0 and path.exists():
+        for generation in range(backups - 1, 0, -1):
+            older = _backup_path(path, generation)
+            if older.exists():
+                os.replace(older, _backup_path(path, generation + 1))
+        os.replace(path, _backup_path(path, 1))
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+def _load_json_with_recovery(path: Path, backups: int = BACKUP_GENERATIONS) -> Any | None:
+    """读取JSON文件，损坏或缺失时依次尝试临时文件和各代备份
+
+    返回第一份能完整解析的数据，都不可用时返回 None。尝试次数只与备份代数有关。
+    从其他文件恢复时，把损坏的目标文件改名为 .corrupt，避免下次写入时被轮换进备份。
+    """
+    candidates = [path, path.with_name(path.name + '.tmp')]
+    candidates += [_backup_path(path, generation) for generation in range(1, backups + 1)]
+    for candidate in candidates:
+        if not candidate.exists():
+            continue
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, OSError):
-            return DEFAULT_CONFIG.copy()
-    return DEFAULT_CONFIG.copy()
+            with open(candidate, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError, OSError) as e:
+            print(f"文件损坏，尝试下一份备份: {candidate.name}: {e}")
+            continue
+        if candidate != path:
+            print(f"已从 {candidate.name} 恢复 {path.name}")
+            if path.exists():
+                try:
+                    os.replace(path, path.with_name(path.name + '.corrupt'))
+                except OSError as e:
+                    print(f"无法移走损坏的文件 {path.name}: {e}")
+        return data
+    return None
+
+def load_config() -> Dict[str, Any]:
+    """加载配置（损坏时从备份恢复）"""
+    data = _load_json_with_recovery(CONFIG_FILE)
+    if not isinstance(data, dict):
+        return DEFAULT_CONFIG.copy()
+    # 补全旧配置文件中缺少的新配置项
+    return {**DEFAULT_CONFIG, **data}
 
 def save_config(new_config: Dict[str, Any]) -> None:
-    """保存配置"""
-    try:
-        print(f"保存配置到: {CONFIG_FILE}")
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(new_config, f, ensure_ascii=False, indent=2)
-        print(f"配置保存成功: {CONFIG_FILE.exists()}")
-    except OSError as e:
-        print(f"保存配置失败: {e}")
+    """保存配置，失败时抛出 OSError（由后台写入线程稍后重试）"""
+    print(f"保存配置到: {CONFIG_FILE}")
+    _atomic_write_json(CONFIG_FILE, new_config)
+    print(f"配置保存成功: {CONFIG_FILE.exists()}")
 
 def load_conversations() -> Dict[str, Any]:
-    """加载对话历史"""
+    """加载对话历史（损坏时从最近的有效备份恢复）"""
     print(f"加载对话历史从: {CHAT_HISTORY_FILE}")
     print(f"文件存在: {CHAT_HISTORY_FILE.exists()}")
-    if CHAT_HISTORY_FILE.exists():
-        try:
-            print(f"文件大小: {CHAT_HISTORY_FILE.stat().st_size} bytes")
-            with open(CHAT_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
-                print(f"文件内容: {content[:200]}...")  # 打印前200个字符
-                data = json.loads(content)
-                print(f"加载的对话数量: {len(data.get('conversations', {}))}")
-                return {
-                    'conversations': data.get('conversations', {}),
-                    'conversation_titles': data.get('conversation_titles', {})
-                }
-        except json.JSONDecodeError as e:
-            print(f"JSON解析错误: {e}")
-        except OSError as e:
-            print(f"文件读取错误: {e}")
-    else:
-        print("文件不存在，返回空数据")
+    data = _load_json_with_recovery(CHAT_HISTORY_FILE)
+    if isinstance(data, dict):
+        print(f"加载的对话数量: {len(data.get('conversations', {}))}")
+        return {
+            'conversations': data.get('conversations', {}),
+            'conversation_titles': data.get('conversation_titles', {}),
+            'conversation_meta': data.get('conversation_meta', {}),
+            'journal_seq': data.get('journal_seq', 0),
+            'archive_gc': data.get('archive_gc', [])
+        }
+    print("没有可用的对话历史，返回空数据")
     return {
         'conversations': {},
-        'conversation_titles': {}
+        'conversation_titles': {},
+        'conversation_meta': {},
+        'journal_seq': 0,
+        'archive_gc': []
     }
 
-def save_conversations(data: Dict[str, Any]) -> None:
-    """保存对话历史"""
+def save_conversations(data: Dict[str, Any]) -> bool:
+    """保存对话历史，返回是否成功"""
     try:
         print(f"保存对话历史到: {CHAT_HISTORY_FILE}")
         print(f"对话数量: {len(data.get('conversations', {}))}")
-        with open(CHAT_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 快照只由程序读取，不缩进可以明显减小文件体积和写入耗时
+        _atomic_write_json(CHAT_HISTORY_FILE, data, indent=None)
         print(f"对话历史保存成功: {CHAT_HISTORY_FILE.exists()}")
+        return True
     except OSError as e:
         print(f"保存对话历史失败: {e}")
+        return False
+
+class ConversationArchive:
+    """闲置对话的归档：每个对话一个 gzip 压缩的JSON文件
+
+    文件名取对话ID的哈希（对话ID来自页面，不一定能用作文件名），
+    文件内同时保存对话ID用于校验。写入先写临时文件再重命名，不会留下半个文件。
+    """
+
+    def __init__(self, directory: Path, compresslevel: int = 6):
+        self.directory = directory
+        self.compresslevel = compresslevel
+
+    def path(self, conv_id: str) -> Path:
+        digest = hashlib.sha256(conv_id.encode('utf-8')).hexdigest()[:32]
+        return self.directory / f'{digest}.json.gz'
+
+    def write(self, conv_id: str, messages: list[Dict[str, Any]]) -> None:
+        """写入归档文件，失败时抛出 OSError"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(conv_id)
+        tmp_path = path.with_name(path.name + '.tmp')
+        payload = json.dumps({'id': conv_id, 'messages': messages},
+                             ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(payload, compresslevel=self.compresslevel, mtime=0))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_dir(self.directory)
+
+    def read(self, conv_id: str) -> list[Dict[str, Any]] | None:
+        """读取归档的消息，文件缺失或损坏时返回 None（损坏的文件改名为 .corrupt 保留）"""
+        path = self.path(conv_id)
+        try:
+            with open(path, 'rb') as f:
+                data = json.loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            print(f"对话归档不存在: {conv_id}")
+            return None
+        except (OSError, EOFError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"对话归档损坏: {conv_id}: {e}")
+            try:
+                os.replace(path, path.with_name(path.name + '.corrupt'))
+            except OSError as replace_error:
+                print(f"无法移走损坏的归档 {path.name}: {replace_error}")
+            return None
+        if not isinstance(data, dict) or data.get('id') != conv_id:
+            print(f"对话归档与对话ID不符: {conv_id}")
+            return None
+        return data.get('messages', [])
+
+    def remove(self, conv_id: str) -> None:
+        try:
+            self.path(conv_id).unlink(missing_ok=True)
+        except OSError as e:
+            print(f"删除对话归档失败: {conv_id}: {e}")
+
+class WriteBehind:
+    """后台写入线程
+
+    调用方用 submit() 登记待写入的内容后立即返回，磁盘延迟不会计入请求耗时；
+    后台线程在最后一次登记后等待 delay 秒（从第一次登记起最多 max_delay 秒），
+    把期间登记的全部内容合并为一次 flush_func(items) 调用，内容按登记顺序传入。
+    flush_func 抛出 OSError 时内容保留，稍后重试。close() 写出剩余内容并调用
+    sync_func（如 fsync），程序退出前调用以保证不丢数据。
+
+    每次写出的耗时与从登记到写完的延迟分别计入直方图，由 stats() 返回。
+    """
+
+    def __init__(self, name: str, flush_func, sync_func=None,
+                 delay: float = WRITE_BEHIND_DELAY, max_delay: float = WRITE_BEHIND_MAX_DELAY):
+        self.name = name
+        self.delay = delay
+        self.max_delay = max_delay
+        self._flush_func = flush_func
+        self._sync_func = sync_func
+        self._pending: list = []
+        self._first_at = 0.0
+        self._last_at = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        # 保证写出按登记顺序进行、不交错
+        self._io_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._flushes = 0
+        self._items = 0
+        self._failures = 0
+        self._max_write_ms = 0.0
+        self._write_histogram = [0] * (len(FLUSH_LATENCY_BUCKETS_MS) + 1)
+        self._delay_histogram = [0] * (len(FLUSH_LATENCY_BUCKETS_MS) + 1)
+        self._thread = threading.Thread(target=self._run, name=f'write-behind-{name}', daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> None:
+        """登记一项待写入的内容"""
+        with self._cond:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_at = now
+            self._pending.append(item)
+            self._last_at = now
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                # 合并窗口：等到一段时间内没有新的登记，或第一项已等待了 max_delay
+                while self._pending and not self._closed:
+                    deadline = min(self._last_at + self.delay, self._first_at + self.max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if not self.flush():
+                if self._closed:
+                    # 剩余内容由 close() 再尝试一次
+                    return
+                time.sleep(WRITE_BEHIND_RETRY_INTERVAL)
+
+    def flush(self) -> bool:
+        """在调用线程中立即写出待写内容，返回是否成功"""
+        with self._io_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> bool:
+        with self._cond:
+            items, self._pending = self._pending, []
+            first_at = self._first_at
+        if not items:
+            return True
+        started = time.monotonic()
+        try:
+            self._flush_func(items)
+        except OSError as e:
+            print(f"后台写入失败（{self.name}），稍后重试: {e}")
+            with self._cond:
+                self._pending = items + self._pending
+                self._first_at = first_at
+            with self._stats_lock:
+                self._failures += 1
+            return False
+        finished = time.monotonic()
+        with self._stats_lock:
+            self._flushes += 1
+            self._items += len(items)
+            write_ms = (finished - started) * 1000
+            self._max_write_ms = max(self._max_write_ms, write_ms)
+            self._write_histogram[self._bucket(write_ms)] += 1
+            self._delay_histogram[self._bucket((finished - first_at) * 1000)] += 1
+        return True
+
+    @contextmanager
+    def drained(self):
+        """写出全部待写内容，并在 with 块内暂停后台写入（用于替换写入目标，如日志轮换）"""
+        with self._io_lock:
+            self._flush_locked()
+            yield
+
+    def close(self) -> None:
+        """写出剩余内容、调用 sync_func 并停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        with self._io_lock:
+            self._flush_locked()
+            if self._sync_func is not None:
+                try:
+                    self._sync_func()
+                except OSError as e:
+                    print(f"同步写入磁盘失败（{self.name}）: {e}")
+
+    @staticmethod
+    def _bucket(ms: float) -> int:
+        for index, limit in enumerate(FLUSH_LATENCY_BUCKETS_MS):
+            if ms <= limit:
+                return index
+        return len(FLUSH_LATENCY_BUCKETS_MS)
+
+    @staticmethod
+    def _labelled(histogram: list[int]) -> list[Dict[str, Any]]:
+        """[{le_ms: 分桶上限（最后一桶为 None）, count: 次数}, ...]，按分桶顺序排列"""
+        limits = [*FLUSH_LATENCY_BUCKETS_MS, None]
+        return [{'le_ms': limit, 'count': count} for limit, count in zip(limits, histogram)]
+
+    def stats(self) -> Dict[str, Any]:
+        """返回写入次数、合并的条数、失败次数与耗时直方图"""
+        with self._cond:
+            pending = len(self._pending)
+        with self._stats_lock:
+            return {
+                'flushes': self._flushes,
+                'items': self._items,
+                'pending': pending,
+                'failures': self._failures,
+                'max_write_ms': round(self._max_write_ms, 3),
+                # 单次写盘耗时
+                'write_latency': self._labelled(self._write_histogram),
+                # 从第一次登记到写完的延迟（包括合并等待）
+                'flush_latency': self._labelled(self._delay_histogram)
+            }
+
+class ConversationStore(ABC):
+    """对话存储接口，JSON日志与SQLite两种后端共用
+
+    单次读写由各后端保证线程安全；“检查版本号再修改”这类复合操作需要在
+    conversation_lock() 返回的对话级锁内完成，不同对话之间互不阻塞。
+    """
+
+    def __init__(self):
+        self._conversation_locks: Dict[str, threading.RLock] = {}
+        self._conversation_locks_guard = threading.Lock()
+        self._listeners: list = []
+
+    def add_listener(self, listener) -> None:
+        """登记修改通知
+
+        每次修改后以 listener(event) 调用，event 与日志记录格式相同
+        （op 为 append / put / title / delete，id 为对话ID），另带修改后的版本号 version，
+        append 带新消息的序号 message_seq。调用时持有存储的写锁，通知按修改顺序发出，
+        listener 只应登记事件、不做耗时操作。
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, event: Dict[str, Any]) -> None:
+        for listener in self._listeners:
+            listener(event)
+
+    def conversation_lock(self, conv_id: str) -> threading.RLock:
+        """返回对话级的锁"""
+        with self._conversation_locks_guard:
+            lock = self._conversation_locks.get(conv_id)
+            if lock is None:
+                lock = self._conversation_locks[conv_id] = threading.RLock()
+            return lock
+
+    def discard_conversation_lock(self, conv_id: str) -> None:
+        """对话删除后释放对应的锁"""
+        with self._conversation_locks_guard:
+            self._conversation_locks.pop(conv_id, None)
+
+    @abstractmethod
+    def load(self) -> None:
+        """打开存储并加载必要的数据"""
+
+    @abstractmethod
+    def conversation_ids(self) -> list[str]:
+        """按创建顺序返回所有对话ID"""
+
+    @abstractmethod
+    def has_conversation(self, conv_id: str) -> bool:
+        """对话是否存在"""
+
+    @abstractmethod
+    def get_messages(self, conv_id: str) -> list[Dict[str, Any]] | None:
+        """读取单个对话的消息，对话不存在时返回None"""
+
+    def scan_messages(self, conv_id: str) -> list[Dict[str, Any]] | None:
+        """为批量处理（如建立索引）读取对话消息，不影响对话的冷热状态"""
+        return self.get_messages(conv_id)
+
+    @abstractmethod
+    def get_titles(self) -> Dict[str, str]:
+        """读取所有对话标题"""
+
+    @abstractmethod
+    def get_version(self, conv_id: str) -> int | None:
+        """读取对话版本号（每次修改加1），对话不存在时返回None"""
+
+    @abstractmethod
+    def get_versions(self) -> Dict[str, int]:
+        """读取所有对话的版本号"""
+
+    @abstractmethod
+    def export_all(self) -> Dict[str, Any]:
+        """导出全部对话、标题与版本号"""
+
+    @abstractmethod
+    def list_conversations(self, limit: int, cursor: str | None = None) -> Dict[str, Any]:
+        """按创建顺序从新到旧分页列出对话摘要（不含消息内容）
+
+        返回 {'items': [...], 'next_cursor': str | None, 'total': int}，
+        next_cursor 为 None 表示没有更多。
+        """
+
+    @abstractmethod
+    def get_message_page(self, conv_id: str, limit: int,
+                         before: int | None = None) -> Dict[str, Any] | None:
+        """从新到旧分页读取对话消息，before 为上一页返回的 next_before
+
+        返回 {'messages': [...], 'next_before': int | None, 'total': int}，
+        每条消息带有序号 seq；对话不存在时返回None。
+        """
+
+    @abstractmethod
+    def append_message(self, conv_id: str, message: Dict[str, Any]) -> int:
+        """向对话追加一条消息，返回新版本号"""
+
+    @abstractmethod
+    def put_conversation(self, conv_id: str, messages: list, title: str | None = None) -> int:
+        """整体写入一个对话（新建或覆盖），返回新版本号"""
+
+    @abstractmethod
+    def set_title(self, conv_id: str, title: str) -> int:
+        """修改对话标题，返回新版本号"""
+
+    @abstractmethod
+    def delete_conversation(self, conv_id: str) -> None:
+        """删除对话"""
+
+    def write_stats(self) -> Dict[str, Any] | None:
+        """后台写入统计，同步写入的后端返回 None"""
+        return None
+
+    def close(self) -> None:
+        """关闭存储"""
+
+    def sync_all(self, new_conversations: Dict[str, list], new_titles: Dict[str, str]) -> None:
+        """与页面提交的完整对话数据比对，只写入发生变化的部分"""
+        for conv_id in self.conversation_ids():
+            if conv_id not in new_conversations:
+                self.delete_conversation(conv_id)
+        current_titles = self.get_titles()
+        for conv_id, messages in new_conversations.items():
+            current = self.get_messages(conv_id)
+            title = new_titles.get(conv_id)
+            if current is None:
+                self.put_conversation(conv_id, messages, title)
+                continue
+            if messages != current:
+                if len(messages) > len(current) and messages[:len(current)] == current:
+                    for message in messages[len(current):]:
+                        self.append_message(conv_id, message)
+                else:
+                    self.put_conversation(conv_id, messages)
+            if title is not None and title != current_titles.get(conv_id):
+                self.set_title(conv_id, title)
+
+class JournalStore(ConversationStore):
+    """追加写日志的对话存储
+
+    chat_history.json 作为快照，之后的每次变更以一行JSON追加到 chat_history.jsonl，
+    写入成本只与本次变更有关。启动时先加载快照再重放日志；日志记录数达到阈值后
+    在后台合并写回快照。每条记录带递增序号，快照中记录已合并的序号，
+    合并过程中断时重放会跳过已包含在快照里的记录。
+
+    内存状态由 _lock 保护，持锁时间只覆盖一次内存修改和一行日志登记；
+    日志行由后台写入线程合并写盘，请求线程不等待磁盘。读取接口返回持锁复制出的
+    数据，不会与写入交错。
+
+    提供 archive 时，合并前把闲置超过 archive_idle_seconds 的对话写入归档文件并移出
+    内存，快照中只保留其元数据（archived 标记与消息数），内存和快照的大小只与活跃
+    对话有关。归档的对话被读取或修改时自动读回内存；归档文件要等当前快照和
+    保留的各代备份（.bak1 … .bak{BACKUP_GENERATIONS}）都记录该对话已读回后才删除，
+    任何时刻崩溃或从备份恢复，都能从快照、日志和归档中完整恢复。
+    对话顺序以 conversation_meta 为准，conversations 只保存内存中的对话。
+    """
+
+    def __init__(self, snapshot_file: Path, journal_file: Path,
+                 compact_threshold: int = JOURNAL_COMPACT_THRESHOLD,
+                 archive: ConversationArchive | None = None, archive_idle_seconds: float = 0):
+        super().__init__()
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        # 合并期间被换下的旧日志，快照写入成功后删除
+        self.rotated_journal_file = journal_file.with_name(journal_file.name + '.1')
+        self.compact_threshold = compact_threshold
+        self.conversations: Dict[str, list] = {}
+        self.conversation_titles: Dict[str, str] = {}
+        self.conversation_meta: Dict[str, Dict[str, Any]] = {}
+        # 对话的创建位置（meta['order']，取创建时的日志序号）按升序排列，用于分页游标
+        self._orders: list[int] = []
+        self._order_ids: Dict[int, str] = {}
+        self._seq = 0
+        self._pending_records = 0
+        self._journal = None
+        self._writer: WriteBehind | None = None
+        self.archive = archive
+        self.archive_idle_seconds = archive_idle_seconds
+        # 对话最近一次被读取的时间，读取也算活跃，避免刚打开的对话又被归档
+        self._accessed: Dict[str, float] = {}
+        # 已读回内存或已删除、等待下次快照写入的对话
+        self._stale_archives: set[str] = set()
+        # 最近几次快照各自登记的上述对话（旧的在前）。保留的备份快照中它们可能仍是归档状态，
+        # 归档文件要等到所有备份都不再引用时才删除；随快照保存，重启后继续计数
+        self._archive_gc: list[set[str]] = []
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compacting = False
+
+    def load(self) -> None:
+        """加载快照并重放日志"""
+        data = load_conversations()
+        self.conversations.update(data['conversations'])
+        self.conversation_titles.update(data['conversation_titles'])
+        self.conversation_meta.update(data['conversation_meta'])
+        for conv_id in self.conversations:
+            # 旧版本的快照没有元数据
+            self.conversation_meta.setdefault(conv_id, {'version': 0, 'created_at': 0, 'updated_at': 0})
+        total = len(self.conversation_meta)
+        for index, (conv_id, meta) in enumerate(self.conversation_meta.items()):
+            # 旧版本没有创建位置，按原有顺序排在所有日志记录之前
+            meta.setdefault('order', index - total)
+            self._register_order(conv_id, meta['order'])
+        self._seq = data['journal_seq']
+        self._archive_gc = [set(conv_ids) for conv_ids in data['archive_gc']]
+        snapshot_seq = self._seq
+        self._pending_records = (self._replay(self.rotated_journal_file, snapshot_seq)
+                                 + self._replay(self.journal_file, snapshot_seq))
+        print(f"重放对话日志记录: {self._pending_records} 条")
+        self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        self._writer = WriteBehind('journal', self._write_lines, self._sync_journal)
+        print(f"内存中的对话: {len(self.conversations)} 个，"
+              f"已归档: {len(self.conversation_meta) - len(self.conversations)} 个")
+        if (self._pending_records >= self.compact_threshold or self.rotated_journal_file.exists()
+                or self._idle_conversations_locked()):
+            self.compact()
+
+    def _replay(self, journal_file: Path, snapshot_seq: int) -> int:
+        """重放日志中快照之后的记录，返回重放的条数"""
+        if not journal_file.exists():
+            return 0
+        replayed = 0
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 写入中途崩溃只会损坏最后一行
+                    print(f"跳过损坏的日志记录: {journal_file.name} 第 {line_no} 行")
+                    continue
+                if record.get('seq', 0) <= snapshot_seq:
+                    continue
+                if record['seq'] > self._seq + 1:
+                    # 快照是从较旧的备份恢复的，两者之间的记录已随合并删除
+                    print(f"对话日志不连续，缺少记录 {self._seq + 1}-{record['seq'] - 1}")
+                self._apply(record)
+                self._seq = record['seq']
+                replayed += 1
+        return replayed
+
+    def _touch(self, conv_id: str, ts: float, seq: int) -> None:
+        """对话被修改：版本号加1并更新修改时间，新对话以日志序号 seq 作为创建位置"""
+        meta = self.conversation_meta.get(conv_id)
+        if meta is None:
+            meta = self.conversation_meta[conv_id] = {
+                'version': 0, 'created_at': ts, 'updated_at': ts, 'order': seq
+            }
+            self._register_order(conv_id, seq)
+        meta['version'] += 1
+        meta['updated_at'] = ts
+
+    def _register_order(self, conv_id: str, order: int) -> None:
+        bisect.insort(self._orders, order)
+        self._order_ids[order] = conv_id
+
+    def _unregister_order(self, order: int) -> None:
+        index = bisect.bisect_left(self._orders, order)
+        if index < len(self._orders) and self._orders[index] == order:
+            del self._orders[index]
+        self._order_ids.pop(order, None)
+
+    def _is_archived_locked(self, conv_id: str) -> bool:
+        return self.conversation_meta.get(conv_id, {}).get('archived', False)
+
+    def _mark_hot_locked(self, conv_id: str, messages: list[Dict[str, Any]]) -> None:
+        """把对话放回内存；原来是归档的，归档文件留到备份快照都不再引用后删除"""
+        self.conversations[conv_id] = messages
+        meta = self.conversation_meta.get(conv_id)
+        if meta and meta.pop('archived', False):
+            meta.pop('message_count', None)
+            self._stale_archives.add(conv_id)
+
+    def _rehydrate(self, conv_id: str) -> None:
+        """对话被访问：记录访问时间，归档的对话在锁外读取文件后放回内存"""
+        with self._lock:
+            if conv_id not in self.conversation_meta:
+                return
+            self._accessed[conv_id] = time.time()
+            if not self._is_archived_locked(conv_id):
+                return
+        messages = self.archive.read(conv_id)
+        with self._lock:
+            # 读取期间对话可能已被覆盖、删除或由其他请求读回
+            if self._is_archived_locked(conv_id):
+                self._mark_hot_locked(conv_id, messages or [])
+                print(f"已从归档读回对话: {conv_id}")
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        """将一条日志记录应用到内存状态
+
+        消息列表只会被追加或整体替换，已有的消息字典不会被原地修改，
+        因此浅拷贝出的快照可以在锁外安全地序列化。
+        """
+        op = record.get('op')
+        conv_id = record.get('id')
+        ts = record.get('ts', 0)
+        seq = record.get('seq', 0)
+        if op == 'append':
+            if self._is_archived_locked(conv_id):
+                # 请求线程通常已在锁外读回；重放日志或与归档交错时在这里读取
+                self._mark_hot_locked(conv_id, self.archive.read(conv_id) or [])
+            self.conversations.setdefault(conv_id, []).append(record['message'])
+            self._touch(conv_id, ts, seq)
+        elif op == 'put':
+            self._mark_hot_locked(conv_id, list(record['messages']))
+            if 'title' in record:
+                self.conversation_titles[conv_id] = record['title']
+            self._touch(conv_id, ts, seq)
+        elif op == 'title':
+            self.conversation_titles[conv_id] = record['title']
+            self._touch(conv_id, ts, seq)
+        elif op == 'delete':
+            if self._is_archived_locked(conv_id):
+                self._stale_archives.add(conv_id)
+            meta = self.conversation_meta.pop(conv_id, None)
+            if meta is not None:
+                self._unregister_order(meta['order'])
+            self.conversations.pop(conv_id, None)
+            self.conversation_titles.pop(conv_id, None)
+            self._accessed.pop(conv_id, None)
+        # 旧版本写入的 system 记录不再重放：系统提示词在组装请求时注入
+
+    def _write_lines(self, lines: list[str]) -> None:
+        """后台写入线程：一次写出合并的日志行"""
+        self._journal.write(''.join(lines))
+        self._journal.flush()
+
+    def _sync_journal(self) -> None:
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _write(self, record: Dict[str, Any]) -> int | None:
+        """应用一条变更并登记到后台写入的日志，返回被修改对话的新版本号"""
+        with self._lock:
+            self._seq += 1
+            record['seq'] = self._seq
+            record['ts'] = time.time()
+            self._apply(record)
+            # 持锁登记，保证日志行按序号顺序写出
+            self._writer.submit(json.dumps(record, ensure_ascii=False) + '\n')
+            self._pending_records += 1
+            start_compaction = self._pending_records >= self.compact_threshold and not self._compacting
+            if start_compaction:
+                self._compacting = True
+            meta = self.conversation_meta.get(record.get('id'))
+            version = meta['version'] if meta else None
+            if self._listeners:
+                event = {k: v for k, v in record.items() if k not in ('seq', 'ts')}
+                event['version'] = version
+                if record['op'] == 'append':
+                    event['message_seq'] = len(self.conversations[record['id']]) - 1
+                self._notify(event)
+        if start_compaction:
+            threading.Thread(target=self.compact, daemon=True).start()
+        return version
+
+    def append_message(self, conv_id: str, message: Dict[str, Any]) -> int:
+        """向对话追加一条消息"""
+        self._rehydrate(conv_id)
+        return self._write({'op': 'append', 'id': conv_id, 'message': message})
+
+    def put_conversation(self, conv_id: str, messages: list, title: str | None = None) -> int:
+        """整体写入一个对话（新建或覆盖）"""
+        record = {'op': 'put', 'id': conv_id, 'messages': messages}
+        if title is not None:
+            record['title'] = title
+        return self._write(record)
+
+    def set_title(self, conv_id: str, title: str) -> int:
+        """修改对话标题"""
+        return self._write({'op': 'title', 'id': conv_id, 'title': title})
+
+    def delete_conversation(self, conv_id: str) -> None:
+        """删除对话"""
+        self._write({'op': 'delete', 'id': conv_id})
+        self.discard_conversation_lock(conv_id)
+
+    def conversation_ids(self) -> list[str]:
+        with self._lock:
+            return list(self.conversation_meta)
+
+    def has_conversation(self, conv_id: str) -> bool:
+        return conv_id in self.conversation_meta
+
+    def get_messages(self, conv_id: str) -> list[Dict[str, Any]] | None:
+        self._rehydrate(conv_id)
+        with self._lock:
+            messages = self.conversations.get(conv_id)
+            return list(messages) if messages is not None else None
+
+    def scan_messages(self, conv_id: str) -> list[Dict[str, Any]] | None:
+        with self._lock:
+            messages = self.conversations.get(conv_id)
+            if messages is not None:
+                return list(messages)
+            if not self._is_archived_locked(conv_id):
+                return None
+        # 归档的对话直接读取文件，不放回内存
+        messages = self.archive.read(conv_id)
+        return messages if messages is not None else self.get_messages(conv_id)
+
+    def get_titles(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self.conversation_titles)
+
+    def get_version(self, conv_id: str) -> int | None:
+        meta = self.conversation_meta.get(conv_id)
+        return meta['version'] if meta else None
+
+    def get_versions(self) -> Dict[str, int]:
+        with self._lock:
+            return {conv_id: meta['version'] for conv_id, meta in self.conversation_meta.items()}
+
+    def export_all(self) -> Dict[str, Any]:
+        data = self.snapshot()
+        conversations = {}
+        for conv_id in data['conversation_meta']:
+            messages = data['conversations'].get(conv_id)
+            if messages is None:
+                messages = self.scan_messages(conv_id) or []
+            conversations[conv_id] = messages
+        return {
+            'conversations': conversations,
+            'conversation_titles': data['conversation_titles'],
+            'conversation_versions': {
+                conv_id: meta['version'] for conv_id, meta in data['conversation_meta'].items()
+            }
+        }
+
+    def list_conversations(self, limit: int, cursor: str | None = None) -> Dict[str, Any]:
+        # 游标是上一页最后一个对话的创建位置，该对话在两页之间被删除也不影响翻页
+        with self._lock:
+            end = len(self._orders)
+            if cursor is not None:
+                try:
+                    end = bisect.bisect_left(self._orders, int(cursor))
+                except ValueError:
+                    pass
+            start = max(end - limit, 0)
+            items = []
+            for order in reversed(self._orders[start:end]):
+                conv_id = self._order_ids[order]
+                meta = self.conversation_meta.get(conv_id, {})
+                items.append({
+                    'id': conv_id,
+                    'title': self.conversation_titles.get(conv_id),
+                    'created_at': meta.get('created_at', 0),
+                    'updated_at': meta.get('updated_at', 0),
+                    'message_count': (meta.get('message_count', 0) if meta.get('archived')
+                                      else len(self.conversations.get(conv_id, ()))),
+                    'version': meta.get('version', 0)
+                })
+            next_cursor = str(self._orders[start]) if start > 0 else None
+            total = len(self._orders)
+        return {
+            'items': items,
+            'next_cursor': next_cursor,
+            'total': total
+        }
+
+    def get_message_page(self, conv_id: str, limit: int,
+                         before: int | None = None) -> Dict[str, Any] | None:
+        self._rehydrate(conv_id)
+        with self._lock:
+            messages = self.conversations.get(conv_id)
+            if messages is None:
+                return None
+            end = len(messages) if before is None else min(before, len(messages))
+            start = max(end - limit, 0)
+            page = [dict(messages[seq], seq=seq) for seq in range(end - 1, start - 1, -1)]
+            total = len(messages)
+        return {
+            'messages': page,
+            'next_before': start if start > 0 else None,
+            'total': total
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """持锁复制当前完整数据（写时复制：只复制容器，消息字典共享）"""
+        with self._lock:
+            return self._snapshot_locked()
+
+    def _snapshot_locked(self) -> Dict[str, Any]:
+        return {
+            'conversations': {conv_id: list(messages) for conv_id, messages in self.conversations.items()},
+            'conversation_titles': dict(self.conversation_titles),
+            'conversation_meta': {conv_id: dict(meta) for conv_id, meta in self.conversation_meta.items()},
+            'journal_seq': self._seq
+        }
+
+    def _idle_conversations_locked(self) -> list[str]:
+        """内存中闲置超过 archive_idle_seconds 的对话"""
+        if self.archive is None or self.archive_idle_seconds <= 0:
+            return []
+        cutoff = time.time() - self.archive_idle_seconds
+        return [
+            conv_id for conv_id in self.conversations
+            if max(self.conversation_meta[conv_id]['updated_at'], self._accessed.get(conv_id, 0)) < cutoff
+        ]
+
+    def archive_idle(self) -> int:
+        """把闲置的对话写入归档文件并移出内存，返回归档的对话数量
+
+        归档文件在锁外写入；写入期间对话被修改或读取的，保留在内存中。
+        """
+        with self._lock:
+            candidates = {
+                conv_id: (list(self.conversations[conv_id]), self.conversation_meta[conv_id]['version'])
+                for conv_id in self._idle_conversations_locked()
+            }
+        archived = 0
+        for conv_id, (messages, version) in candidates.items():
+            try:
+                self.archive.write(conv_id, messages)
+            except OSError as e:
+                print(f"归档对话失败: {conv_id}: {e}")
+                continue
+            with self._lock:
+                meta = self.conversation_meta.get(conv_id)
+                if (meta is None or meta['version'] != version or conv_id not in self.conversations
+                        or conv_id not in self._idle_conversations_locked()):
+                    continue
+                del self.conversations[conv_id]
+                meta['archived'] = True
+                meta['message_count'] = len(messages)
+                self._accessed.pop(conv_id, None)
+                # 归档文件重新生效，之后再次读回时重新开始计数
+                self._stale_archives.discard(conv_id)
+                for pending in self._archive_gc:
+                    pending.discard(conv_id)
+                archived += 1
+        if archived:
+            print(f"已归档闲置对话: {archived} 个")
+        return archived
+
+    def compact(self) -> None:
+        """将日志合并到快照
+
+        合并前先归档闲置的对话。持锁期间只复制内存状态并换上新的日志文件，
+        序列化和写快照在锁外完成，期间其他对话的读写不受影响。
+        """
+        with self._compact_lock:
+            self.archive_idle()
+            with self._lock, self._writer.drained():
+                data = self._snapshot_locked()
+                self._journal.close()
+                if self.rotated_journal_file.exists():
+                    # 上次合并未完成，旧日志继续保留到快照写入成功
+                    with open(self.rotated_journal_file, 'a', encoding='utf-8') as rotated, \
+                            open(self.journal_file, 'r', encoding='utf-8') as current:
+                        rotated.write(current.read())
+                    self.journal_file.unlink()
+                else:
+                    self.journal_file.replace(self.rotated_journal_file)
+                self._journal = open(self.journal_file, 'a', encoding='utf-8')
+                self._pending_records = 0
+                stale_archives, self._stale_archives = self._stale_archives, set()
+                # 本次快照写入后最旧的 BACKUP_GENERATIONS 份备份里也都已不再引用 due 中的归档
+                pending = self._archive_gc + [stale_archives]
+                split = max(len(pending) - BACKUP_GENERATIONS, 0)
+                due, keep = pending[:split], pending[split:]
+                data['archive_gc'] = [sorted(conv_ids) for conv_ids in keep]
+            saved = False
+            try:
+                saved = save_conversations(data)
+                if saved:
+                    self.rotated_journal_file.unlink(missing_ok=True)
+                    with self._lock:
+                        self._archive_gc = keep
+                        # 期间又被归档的对话，归档文件仍在使用
+                        removable = {conv_id for conv_ids in due for conv_id in conv_ids
+                                     if not self._is_archived_locked(conv_id)}
+                    for conv_id in removable:
+                        self.archive.remove(conv_id)
+            finally:
+                with self._lock:
+                    if not saved:
+                        self._stale_archives |= stale_archives
+                    self._compacting = False
+
+    def write_stats(self) -> Dict[str, Any] | None:
+        return self._writer.stats() if self._writer else None
+
+    def close(self) -> None:
+        """等待进行中的合并完成，写出并同步剩余日志后关闭日志文件"""
+        with self._compact_lock, self._lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+class SQLiteStore(ConversationStore):
+    """SQLite对话存储（WAL模式）
+
+    conversations 表保存标题、时间戳和消息数，messages 表以 (对话ID, 序号) 为主键，
+    读取单个对话只访问该对话的行，启动时无需把全部历史读入内存。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            title TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            conversation_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            extra TEXT,
+            PRIMARY KEY (conversation_id, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_file: Path):
+        super().__init__()
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立连接，WAL模式下读操作互不阻塞"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_file), timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def load(self) -> None:
+        print(f"使用SQLite对话存储: {self.db_file}")
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.executescript(self.SCHEMA)
+            # 兼容没有 version 列的旧数据库
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(conversations)')}
+            if 'version' not in columns:
+                conn.execute(
+                    'ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0'
+                )
+
+    def get_meta(self, key: str) -> str | None:
+        """读取元数据"""
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        """写入元数据"""
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    @staticmethod
+    def _message_row(conv_id: str, seq: int, message: Dict[str, Any]) -> tuple:
+        """将消息拆分为数据库行，role/content 以外的字段存为JSON"""
+        extra = {k: v for k, v in message.items() if k not in ('role', 'content')}
+        return (
+            conv_id, seq, message.get('role', ''), message.get('content') or '',
+            json.dumps(extra, ensure_ascii=False) if extra else None
+        )
+
+    @staticmethod
+    def _row_message(role: str, content: str, extra: str | None) -> Dict[str, Any]:
+        message = {"role": role, "content": content}
+        if extra:
+            message.update(json.loads(extra))
+        return message
+
+    def conversation_ids(self) -> list[str]:
+        rows = self._connect().execute('SELECT id FROM conversations ORDER BY rowid').fetchall()
+        return [row[0] for row in rows]
+
+    def has_conversation(self, conv_id: str) -> bool:
+        row = self._connect().execute(
+            'SELECT 1 FROM conversations WHERE id = ?', (conv_id,)
+        ).fetchone()
+        return row is not None
+
+    def get_messages(self, conv_id: str) -> list[Dict[str, Any]] | None:
+        if not self.has_conversation(conv_id):
+            return None
+        rows = self._connect().execute(
+            'SELECT role, content, extra FROM messages WHERE conversation_id = ? ORDER BY seq',
+            (conv_id,)
+        ).fetchall()
+        return [self._row_message(*row) for row in rows]
+
+    def get_titles(self) -> Dict[str, str]:
+        rows = self._connect().execute(
+            'SELECT id, title FROM conversations WHERE title IS NOT NULL ORDER BY rowid'
+        ).fetchall()
+        return dict(rows)
+
+    def get_version(self, conv_id: str) -> int | None:
+        row = self._connect().execute(
+            'SELECT version FROM conversations WHERE id = ?', (conv_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_versions(self) -> Dict[str, int]:
+        return dict(self._connect().execute('SELECT id, version FROM conversations ORDER BY rowid'))
+
+    def export_all(self) -> Dict[str, Any]:
+        conn = self._connect()
+        all_conversations: Dict[str, list] = {conv_id: [] for conv_id in self.conversation_ids()}
+        for conv_id, role, content, extra in conn.execute(
+            'SELECT conversation_id, role, content, extra FROM messages ORDER BY conversation_id, seq'
+        ):
+            all_conversations.setdefault(conv_id, []).append(self._row_message(role, content, extra))
+        return {
+            'conversations': all_conversations,
+            'conversation_titles': self.get_titles(),
+            'conversation_versions': self.get_versions()
+        }
+
+    def list_conversations(self, limit: int, cursor: str | None = None) -> Dict[str, Any]:
+        conn = self._connect()
+        max_rowid = int(cursor) if cursor and cursor.isdigit() else None
+        rows = conn.execute(
+            'SELECT rowid, id, title, created_at, updated_at, message_count, version '
+            'FROM conversations WHERE ? IS NULL OR rowid < ? ORDER BY rowid DESC LIMIT ?',
+            (max_rowid, max_rowid, limit + 1)
+        ).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = [{
+            'id': row[1],
+            'title': row[2],
+            'created_at': row[3],
+            'updated_at': row[4],
+            'message_count': row[5],
+            'version': row[6]
+        } for row in rows]
+        total = conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+        return {
+            'items': items,
+            'next_cursor': str(rows[-1][0]) if has_more else None,
+            'total': total
+        }
+
+    def get_message_page(self, conv_id: str, limit: int,
+                         before: int | None = None) -> Dict[str, Any] | None:
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT message_count FROM conversations WHERE id = ?', (conv_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(
+            'SELECT seq, role, content, extra FROM messages '
+            'WHERE conversation_id = ? AND (? IS NULL OR seq < ?) ORDER BY seq DESC LIMIT ?',
+            (conv_id, before, before, limit)
+        ).fetchall()
+        oldest = rows[-1][0] if rows else 0
+        return {
+            'messages': [dict(self._row_message(*message_row[1:]), seq=message_row[0])
+                         for message_row in rows],
+            'next_before': oldest if oldest > 0 else None,
+            'total': row[0]
+        }
+
+    def append_message(self, conv_id: str, message: Dict[str, Any]) -> int:
+        conn = self._connect()
+        now = time.time()
+        with self._write_lock, conn:
+            row = conn.execute(
+                'SELECT message_count FROM conversations WHERE id = ?', (conv_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    'INSERT INTO conversations (id, created_at, updated_at) VALUES (?, ?, ?)',
+                    (conv_id, now, now)
+                )
+                seq = 0
+            else:
+                seq = row[0]
+            conn.execute(
+                'INSERT INTO messages (conversation_id, seq, role, content, extra) '
+                'VALUES (?, ?, ?, ?, ?)',
+                self._message_row(conv_id, seq, message)
+            )
+            conn.execute(
+                'UPDATE conversations SET message_count = ?, updated_at = ?, version = version + 1 '
+                'WHERE id = ?',
+                (seq + 1, now, conv_id)
+            )
+            version = self._version_locked(conn, conv_id)
+            self._notify({'op': 'append', 'id': conv_id, 'message': message,
+                          'message_seq': seq, 'version': version})
+            return version
+
+    @staticmethod
+    def _version_locked(conn: sqlite3.Connection, conv_id: str) -> int:
+        return conn.execute('SELECT version FROM conversations WHERE id = ?', (conv_id,)).fetchone()[0]
+
+    def put_conversation(self, conv_id: str, messages: list, title: str | None = None) -> int:
+        conn = self._connect()
+        now = time.time()
+        with self._write_lock, conn:
+            conn.execute(
+                'INSERT INTO conversations (id, title, created_at, updated_at, message_count, version) '
+                'VALUES (?, ?, ?, ?, ?, 1) '
+                'ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, '
+                'message_count = excluded.message_count, title = COALESCE(excluded.title, title), '
+                'version = version + 1',
+                (conv_id, title, now, now, len(messages))
+            )
+            conn.execute('DELETE FROM messages WHERE conversation_id = ?', (conv_id,))
+            conn.executemany(
+                'INSERT INTO messages (conversation_id, seq, role, content, extra) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [self._message_row(conv_id, seq, message) for seq, message in enumerate(messages)]
+            )
+            version = self._version_locked(conn, conv_id)
+            event = {'op': 'put', 'id': conv_id, 'messages': messages, 'version': version}
+            if title is not None:
+                event['title'] = title
+            self._notify(event)
+            return version
+
+    def set_title(self, conv_id: str, title: str) -> int:
+        conn = self._connect()
+        now = time.time()
+        with self._write_lock, conn:
+            conn.execute(
+                'INSERT INTO conversations (id, title, created_at, updated_at, version) '
+                'VALUES (?, ?, ?, ?, 1) '
+                'ON CONFLICT(id) DO UPDATE SET title = excluded.title, updated_at = excluded.updated_at, '
+                'version = version + 1',
+                (conv_id, title, now, now)
+            )
+            version = self._version_locked(conn, conv_id)
+            self._notify({'op': 'title', 'id': conv_id, 'title': title, 'version': version})
+            return version
+
+    def delete_conversation(self, conv_id: str) -> None:
+        conn = self._connect()
+        with self._write_lock, conn:
+            conn.execute('DELETE FROM messages WHERE conversation_id = ?', (conv_id,))
+            conn.execute('DELETE FROM conversations WHERE id = ?', (conv_id,))
+            self._notify({'op': 'delete', 'id': conv_id, 'version': None})
+        self.discard_conversation_lock(conv_id)
+
+    def import_all(self, data: Dict[str, Any]) -> int:
+        """在单个事务中批量导入对话，返回导入的对话数量"""
+        conn = self._connect()
+        now = time.time()
+        titles = data.get('conversation_titles', {})
+        versions = data.get('conversation_versions', {})
+        imported = 0
+        with self._write_lock, conn:
+            for conv_id, messages in data.get('conversations', {}).items():
+                conn.execute(
+                    'INSERT OR REPLACE INTO conversations '
+                    '(id, title, created_at, updated_at, message_count, version) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (conv_id, titles.get(conv_id), now, now, len(messages), versions.get(conv_id, 0))
+                )
+                conn.execute('DELETE FROM messages WHERE conversation_id = ?', (conv_id,))
+                conn.executemany(
+                    'INSERT INTO messages (conversation_id, seq, role, content, extra) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [self._message_row(conv_id, seq, message) for seq, message in enumerate(messages)]
+                )
+                imported += 1
+        return imported
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+def migrate_json_to_sqlite(sqlite_store: SQLiteStore) -> int:
+    """把JSON格式的对话历史（快照+日志）一次性导入SQLite，返回导入的对话数量"""
+    if sqlite_store.get_meta('json_migrated'):
+        return 0
+    imported = 0
+    if CHAT_HISTORY_FILE.exists() or CHAT_JOURNAL_FILE.exists():
+        legacy_store = JournalStore(CHAT_HISTORY_FILE, CHAT_JOURNAL_FILE,
+                                    archive=ConversationArchive(CHAT_ARCHIVE_DIR))
+        legacy_store.load()
+        imported = sqlite_store.import_all(legacy_store.export_all())
+        legacy_store.close()
+        print(f"已从JSON迁移 {imported} 个对话到SQLite")
+    sqlite_store.set_meta('json_migrated', str(time.time()))
+    return imported
+
+def create_store() -> ConversationStore:
+    """根据配置创建对话存储后端"""
+    if config['storage_backend'] == 'sqlite':
+        sqlite_store = SQLiteStore(CHAT_DB_FILE)
+        sqlite_store.load()
+        migrate_json_to_sqlite(sqlite_store)
+        return sqlite_store
+    journal_store = JournalStore(
+        CHAT_HISTORY_FILE, CHAT_JOURNAL_FILE,
+        archive=ConversationArchive(CHAT_ARCHIVE_DIR),
+        archive_idle_seconds=config['archive_idle_days'] * 86400
+    )
+    journal_store.load()
+    return journal_store
+
+# 全文检索分词：中日韩文字没有空格分词，按相邻两字切分，每段末尾再加上最后一个字，
+# 使单字查询也能以前缀匹配到；其他文字按单词切分。范围只含假名、汉字和谚文音节，
+# 不含「」、・、゛等标点符号，标点与空格一样作为分隔
+_SEARCH_CJK_CHARS = (
+    '\u3041-\u3096\u309d-\u309f\u30a1-\u30fa\u30fc-\u30ff'
+    '\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7a3\uf900-\ufaff'
+)
+_SEARCH_TOKEN_PATTERN = re.compile(f'([{_SEARCH_CJK_CHARS}]+)|[^\\W_{_SEARCH_CJK_CHARS}]+')
+SEARCH_SNIPPET_CHARS = 80   # 搜索结果摘要片段的长度（字符）
+
+def _search_tokens(text: str) -> str:
+    """把文本切分为空格分隔的索引词"""
+    tokens = []
+    for match in _SEARCH_TOKEN_PATTERN.finditer(text):
+        run = match.group(0).lower()
+        if match.group(1) is not None:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+def _search_match_query(query: str) -> tuple[str, list[str]]:
+    """把搜索内容转换为 FTS5 查询，返回 (查询语句, 用于标注摘要的关键词)
+
+    每段连续的文字作为一个短语（中日韩文字为相邻两字的序列），最后一个词按前缀匹配，
+    各短语之间为“且”的关系。所有词都加引号，用户输入不会被当作查询语法。
+    """
+    phrases = []
+    needles = []
+    for match in _SEARCH_TOKEN_PATTERN.finditer(query):
+        run = match.group(0).lower()
+        if match.group(1) is not None and len(run) > 1:
+            tokens = [run[i:i + 2] for i in range(len(run) - 1)]
+        else:
+            tokens = [run]
+        phrases.append('"' + ' '.join(tokens) + '"*')
+        needles.append(run)
+    return ' AND '.join(phrases), needles
+
+def _search_snippet(content: str, needles: list[str]) -> Dict[str, Any]:
+    """截取第一个关键词附近的原文，返回 {'text': 片段, 'highlights': [[起, 止], ...]}"""
+    lowered = content.lower()
+    positions = [pos for pos in (lowered.find(needle) for needle in needles) if pos >= 0]
+    start = max(min(positions) - SEARCH_SNIPPET_CHARS // 4, 0) if positions else 0
+    end = min(start + SEARCH_SNIPPET_CHARS, len(content))
+    prefix = '…' if start > 0 else ''
+    highlights = []
+    for needle in needles:
+        pos = lowered.find(needle, start, end)
+        while pos >= 0:
+            highlights.append([len(prefix) + pos - start, len(prefix) + min(pos + len(needle), end) - start])
+            pos = lowered.find(needle, pos + len(needle), end)
+    text = prefix + content[start:end].replace('\n', ' ') + ('…' if end < len(content) else '')
+    return {'text': text, 'highlights': sorted(highlights)}
+
+class SearchIndex:
+    """消息内容与对话标题的全文索引（SQLite FTS5）
+
+    docs 表以 (对话ID, 序号) 保存每条消息的原文，标题的序号记为 -1；search 是以
+    docs.id 为 rowid 的 FTS5 表，保存分词结果。存储的修改通知由后台写入线程合并为
+    一个事务写入索引，不占用请求时间。indexed 表记录每个对话已索引到的版本号：
+    版本号不大于它的通知直接跳过，追加消息与版本号不连续时重建该对话；
+    启动时 rebuild 对比存储中的版本号，只重建有变化的对话。
+    分词规则变化时递增 TOKENIZER_VERSION（记录在 user_version 中），打开旧索引时清空后全部重建。
+    当前的SQLite不支持FTS5时搜索不可用，其他功能不受影响。
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS docs (
+            id INTEGER PRIMARY KEY,
+            conversation_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            UNIQUE (conversation_id, seq)
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(tokens);
+        CREATE TABLE IF NOT EXISTS indexed (
+            conversation_id TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+    TITLE_SEQ = -1
+    TOKENIZER_VERSION = 1
+
+    def __init__(self, db_file: Path):
+        self.db_file = db_file
+        self.available = False
+        self._store: ConversationStore | None = None
+        # 写入连接只由后台写入线程使用；查询使用另一个连接，WAL模式下互不阻塞
+        self._write_conn: sqlite3.Connection | None = None
+        self._read_conn: sqlite3.Connection | None = None
+        self._read_lock = threading.Lock()
+        self._writer: WriteBehind | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_file), timeout=5, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def attach(self, conversation_store: ConversationStore) -> bool:
+        """打开索引并订阅存储的修改通知，返回搜索是否可用"""
+        try:
+            self._write_conn = self._connect()
+            with self._write_conn:
+                self._write_conn.executescript(self.SCHEMA)
+                self._reset_if_outdated(self._write_conn)
+            self._read_conn = self._connect()
+        except sqlite3.Error as e:
+            print(f"全文搜索不可用: {e}")
+            if self._write_conn is not None:
+                self._write_conn.close()
+                self._write_conn = None
+            return False
+        self._store = conversation_store
+        self._writer = WriteBehind('search', self._apply_events)
+        conversation_store.add_listener(self._writer.submit)
+        self.available = True
+        return True
+
+    def _reset_if_outdated(self, conn: sqlite3.Connection) -> None:
+        """索引由旧的分词规则生成时清空，之后由 rebuild 重建所有对话"""
+        if conn.execute('PRAGMA user_version').fetchone()[0] == self.TOKENIZER_VERSION:
+            return
+        conn.execute('DELETE FROM search')
+        conn.execute('DELETE FROM docs')
+        conn.execute('DELETE FROM indexed')
+        conn.execute(f'PRAGMA user_version = {self.TOKENIZER_VERSION}')
+
+    def rebuild(self) -> int:
+        """重建索引版本号与存储不一致的对话，删除已不存在的对话，返回重建的对话数量"""
+        if not self.available:
+            return 0
+        with self._read_lock:
+            indexed = dict(self._read_conn.execute('SELECT conversation_id, version FROM indexed'))
+        # 标题先于版本号读取：之后改名的通知版本号更大，会覆盖这里的旧标题
+        titles = self._store.get_titles()
+        versions = self._store.get_versions()
+        for conv_id in indexed.keys() - versions.keys():
+            self._writer.submit({'op': 'delete', 'id': conv_id, 'version': None})
+        rebuilt = 0
+        for conv_id, version in versions.items():
+            if indexed.get(conv_id) == version:
+                continue
+            if self._rebuild_conversation(conv_id, titles.get(conv_id)):
+                rebuilt += 1
+        print(f"全文索引已更新: 重建 {rebuilt} 个对话")
+        return rebuilt
+
+    def _rebuild_conversation(self, conv_id: str, title: str | None) -> bool:
+        # 在对话锁内读取版本号和消息，两者对应同一时刻
+        with self._store.conversation_lock(conv_id):
+            version = self._store.get_version(conv_id)
+            messages = self._store.scan_messages(conv_id)
+            if version is None or messages is None:
+                return False
+            self._writer.submit({'op': 'put', 'id': conv_id, 'messages': messages,
+                                 'title': title, 'version': version})
+        return True
+
+    def _apply_events(self, events: list[Dict[str, Any]]) -> None:
+        """后台写入线程：在一个事务中应用一批修改通知"""
+        stale: set[str] = set()
+        try:
+            with self._write_conn as conn:
+                for event in events:
+                    if not self._apply_event(conn, event):
+                        stale.add(event['id'])
+        except sqlite3.Error as e:
+            # 转为 OSError 由后台写入线程稍后重试，已应用的通知会按版本号跳过
+            raise OSError(f"写入全文索引失败: {e}") from e
+        for conv_id in stale:
+            threading.Thread(
+                target=self._rebuild_conversation,
+                args=(conv_id, self._store.get_titles().get(conv_id)),
+                daemon=True
+            ).start()
+
+    def _apply_event(self, conn: sqlite3.Connection, event: Dict[str, Any]) -> bool:
+        """应用一条通知，增量更新与已索引的版本号不连续时返回 False（需要重建该对话）"""
+        conv_id = event['id']
+        op = event['op']
+        if op == 'delete':
+            self._delete_docs(conn, conv_id)
+            conn.execute('DELETE FROM indexed WHERE conversation_id = ?', (conv_id,))
+            return True
+        row = conn.execute('SELECT version FROM indexed WHERE conversation_id = ?', (conv_id,)).fetchone()
+        indexed_version = row[0] if row else None
+        if indexed_version is not None and event['version'] <= indexed_version:
+            return True
+        if op == 'put':
+            self._delete_docs(conn, conv_id, keep_title='title' not in event)
+            for seq, message in enumerate(event['messages']):
+                self._put_doc(conn, conv_id, seq, message.get('role', ''), message.get('content') or '')
+            if event.get('title'):
+                self._put_doc(conn, conv_id, self.TITLE_SEQ, 'title', event['title'])
+        elif (indexed_version or 0) != event['version'] - 1:
+            return False
+        elif op == 'append':
+            message = event['message']
+            self._put_doc(conn, conv_id, event['message_seq'],
+                          message.get('role', ''), message.get('content') or '')
+        elif op == 'title':
+            self._put_doc(conn, conv_id, self.TITLE_SEQ, 'title', event['title'])
+        conn.execute(
+            'INSERT OR REPLACE INTO indexed (conversation_id, version) VALUES (?, ?)',
+            (conv_id, event['version'])
+        )
+        return True
+
+    @staticmethod
+    def _delete_docs(conn: sqlite3.Connection, conv_id: str, keep_title: bool = False) -> None:
+        condition = 'conversation_id = ?' + (' AND seq >= 0' if keep_title else '')
+        conn.execute(f'DELETE FROM search WHERE rowid IN (SELECT id FROM docs WHERE {condition})', (conv_id,))
+        conn.execute(f'DELETE FROM docs WHERE {condition}', (conv_id,))
+
+    @staticmethod
+    def _put_doc(conn: sqlite3.Connection, conv_id: str, seq: int, role: str, content: str) -> None:
+        """写入或替换一条文档；系统提示词和空消息不建索引"""
+        row = conn.execute(
+            'SELECT id FROM docs WHERE conversation_id = ? AND seq = ?', (conv_id, seq)
+        ).fetchone()
+        if row:
+            conn.execute('DELETE FROM search WHERE rowid = ?', (row[0],))
+            conn.execute('DELETE FROM docs WHERE id = ?', (row[0],))
+        if role == 'system' or not content:
+            return
+        doc_id = conn.execute(
+            'INSERT INTO docs (conversation_id, seq, role, content) VALUES (?, ?, ?, ?)',
+            (conv_id, seq, role, content)
+        ).lastrowid
+        conn.execute('INSERT INTO search (rowid, tokens) VALUES (?, ?)', (doc_id, _search_tokens(content)))
+
+    def search(self, query: str, limit: int = 20) -> list[Dict[str, Any]]:
+        """按相关度（BM25）返回匹配的消息和标题，每项带对话标题和摘要片段"""
+        match_query, needles = _search_match_query(query)
+        if not match_query or not self.available:
+            return []
+        try:
+            with self._read_lock:
+                rows = self._read_conn.execute(
+                    'SELECT d.conversation_id, d.seq, d.role, d.content, s.rank FROM '
+                    '(SELECT rowid, rank FROM search WHERE search MATCH ? ORDER BY rank LIMIT ?) s '
+                    'JOIN docs d ON d.id = s.rowid ORDER BY s.rank',
+                    (match_query, limit)
+                ).fetchall()
+                conv_ids = list({row[0] for row in rows})
+                titles = dict(self._read_conn.execute(
+                    f'SELECT conversation_id, content FROM docs WHERE seq = ? '
+                    f'AND conversation_id IN ({",".join("?" * len(conv_ids))})',
+                    (self.TITLE_SEQ, *conv_ids)
+                )) if conv_ids else {}
+        except sqlite3.Error as e:
+            print(f"全文搜索失败: {e}")
+            return []
+        return [{
+            'conversation_id': conv_id,
+            'title': titles.get(conv_id),
+            'seq': seq if seq != self.TITLE_SEQ else None,
+            'role': role,
+            'snippet': _search_snippet(content, needles),
+            'score': round(-rank, 4)
+        } for conv_id, seq, role, content, rank in rows]
+
+    def write_stats(self) -> Dict[str, Any] | None:
+        return self._writer.stats() if self._writer else None
+
+    def close(self) -> None:
+        """写出剩余的修改并关闭索引"""
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        for conn in (self._write_conn, self._read_conn):
+            if conn is not None:
+                conn.close()
+        self._write_conn = self._read_conn = None
+        self.available = False
 
 # 全局状态
 config = load_config()
-conversation_data = load_conversations()
-conversations = conversation_data['conversations']
-conversation_titles = conversation_data['conversation_titles']
+# 修改配置时持有；配置字典只整体替换、不原地修改
+_config_lock = threading.Lock()
+# 配置在后台写入，连续修改只写最后一份
+config_writer = WriteBehind('config', lambda configs: save_config(configs[-1]))
+store = create_store()
+# 全文索引订阅存储的修改通知；启动时在后台补建有变化的对话
+search_index = SearchIndex(CHAT_SEARCH_DB_FILE)
+search_index.attach(store)
 
 # 事件字典类型定义
 class Event(TypedDict):
@@ -148,11 +1677,15 @@ def callback_func(event_dict: Event, msg_dict: dict[str, str | int | float]):
         downloaded: int = msg_dict.get('Downloaded', 0)  # 已下载字节数
 
         # 更新进度显示
-        # 注意：Speed 字段已在 TTHSD 内核中移除，需自行计算
+        # 注意：Speed 字段已在 TTHSD 内核中移除，由 TTHSD_interface 的事件泵计算后补充
+        speed: float = msg_dict.get('Speed', 0.0)  # 下载速度（字节/秒）
+        eta: float | None = msg_dict.get('ETA')  # 预计剩余秒数
         if total > 0:
             percent = (downloaded / total) * 100
+            eta_text = f"，剩余 {eta:.0f} 秒" if eta is not None else ""
             print(
-                f"{event_showname}（{event_id}）：{downloaded}/{total} 字节 ({percent:.2f}%)",
+                f"{event_showname}（{event_id}）：{downloaded}/{total} 字节 ({percent:.2f}%)，"
+                f"{speed / 1024:.1f} KB/s{eta_text}",
                 end='\r', flush=True
             )
 
@@ -192,276 +1725,1381 @@ def callback_func(event_dict: Event, msg_dict: dict[str, str | int | float]):
         error: str = msg_dict.get('Error', '')  # 错误消息内容
         print(f"\n{event_showname}（{event_id}）：错误: {error}")
 
-# 检查更新函数
-def check_for_updates() -> Dict[str, Any]:
-    """检查是否有新版本可用"""
+# 检查更新
+def _download_version_file(version_file: Path) -> str:
+    """使用TTHSD下载版本文件，等待 end 事件（超时则停止下载），返回文件内容"""
+    version_file.unlink(missing_ok=True)
+    with TTHSDownloader() as dl:
+        # 单行文本文件，一个线程就够了
+        dl.submit(
+            urls=[VERSION_URL],
+            save_paths=[str(version_file)],
+            thread_count=1,
+            chunk_size_mb=1,
+            callback=callback_func,
+            timeout=VERSION_DOWNLOAD_TIMEOUT
+        ).result()
+    with open(version_file, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+def _fetch_version_urllib(etag: str | None, last_modified: str | None) -> tuple[str | None, Dict[str, str | None]]:
+    """使用Python标准库获取版本号，带上缓存校验头
+
+    返回 (版本号, 新的校验信息)；服务器返回304（未变化）时版本号为 None。
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    version_request = urllib.request.Request(VERSION_URL, headers=headers)
+    # 忽略SSL证书验证（仅用于版本检查）
+    context = ssl._create_unverified_context()
     try:
-        # 临时文件路径
-        version_file = TEMP_DIR / 'aichat.txt'
-
-        # 使用TTHSD下载器下载版本文件
-        with TTHSDownloader() as dl:
-            # 下载版本文件
-            dl.start_download(
-                urls=[VERSION_URL],
-                save_paths=[str(version_file)],
-                thread_count=8,
-                chunk_size_mb=1,
-                callback=callback_func
-            )
+        with urllib.request.urlopen(version_request, context=context, timeout=VERSION_DOWNLOAD_TIMEOUT) as response:
+            latest_version = response.read().decode('utf-8').strip()
+            return latest_version, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified')
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None, {'etag': etag, 'last_modified': last_modified}
+        raise
+
+class UpdateChecker:
+    """后台更新检查服务
 
-            # 等待下载完成（简单实现，实际应该使用回调）
-            time.sleep(2)
+    检查在后台线程中进行，结果连同 ETag/Last-Modified 保存到 update_check.json，
+    有效期内不再联网；接口直接返回缓存结果，不会阻塞请求线程。
+    """
 
-        # 读取版本文件
-        if not version_file.exists():
-            print(f"版本文件不存在: {version_file}")
-            # 尝试使用Python标准库下载（忽略SSL证书验证）
+    def __init__(self, cache_file: Path):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._idle = threading.Event()
+        self._idle.set()
+        self._cache: Dict[str, Any] = {}
+        if cache_file.exists():
             try:
-                # 忽略SSL证书验证（仅用于版本检查）
-                context = ssl._create_unverified_context()
-
-                # 下载文件
-                with urllib.request.urlopen(VERSION_URL, context=context) as response:
-                    with open(version_file, 'wb') as f:
-                        f.write(response.read())
-
-                if not version_file.exists():
-                    return {
-                        'current_version': APP_VERSION,
-                        'latest_version': None,
-                        'update_available': False,
-                        'error': '无法下载版本文件'
-                    }
-            except (urllib.error.URLError, urllib.error.HTTPError, OSError) as e:
-                print(f"备用下载方法也失败: {e}")
-                return {
-                    'current_version': APP_VERSION,
-                    'latest_version': None,
-                    'update_available': False,
-                    'error': f'无法下载版本文件: {str(e)}'
-                }
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    self._cache = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"读取更新检查缓存失败: {e}")
+
+    def _is_fresh(self) -> bool:
+        checked_at = self._cache.get('checked_at')
+        if checked_at is None:
+            return False
+        ttl = UPDATE_RETRY_INTERVAL if self._cache.get('error') else UPDATE_CHECK_TTL
+        return time.time() - checked_at < ttl
+
+    def refresh(self, force: bool = False) -> None:
+        """缓存过期（或 force）时在后台重新检查，已有检查在进行时不重复启动"""
+        with self._lock:
+            if self._thread is not None or (not force and self._is_fresh()):
+                return
+            self._idle.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout: float) -> bool:
+        """等待进行中的检查结束"""
+        return self._idle.wait(timeout)
+
+    def result(self) -> Dict[str, Any]:
+        """返回缓存的检查结果"""
+        with self._lock:
+            cache = dict(self._cache)
+            checking = self._thread is not None
+        latest_version = cache.get('latest_version')
+        result = {
+            'current_version': APP_VERSION,
+            'latest_version': latest_version,
+            'update_available': bool(latest_version) and compare_versions(latest_version, APP_VERSION),
+            'checked_at': cache.get('checked_at'),
+            'checking': checking,
+            'auto_update': Updater.supported()
+        }
+        # 有旧的检查结果时优先返回它，只在从未成功时返回错误
+        if not latest_version and cache.get('error'):
+            result['error'] = cache['error']
+        return result
+
+    def _check(self) -> Dict[str, Any]:
+        """联网获取最新版本号，返回新的缓存内容"""
+        etag = self._cache.get('etag')
+        last_modified = self._cache.get('last_modified')
+        latest_version = self._cache.get('latest_version')
+        if latest_version and (etag or last_modified):
+            # 有校验信息时用条件请求，版本未变化只需一次304响应
+            fetched, validators = _fetch_version_urllib(etag, last_modified)
+            return {'latest_version': fetched or latest_version, **validators}
+        try:
+            fetched = _download_version_file(TEMP_DIR / 'aichat.txt')
+            return {'latest_version': fetched, 'etag': None, 'last_modified': None}
+        except (OSError, TimeoutError) as e:
+            print(f"TTHSD下载版本文件失败，改用标准库: {e}")
+        fetched, validators = _fetch_version_urllib(None, None)
+        return {'latest_version': fetched, **validators}
+
+    def _run(self) -> None:
+        try:
+            try:
+                cache = self._check()
+                print(f"当前版本: {APP_VERSION}，最新版本: {cache['latest_version']}")
+            except (urllib.error.URLError, OSError, TimeoutError, ValueError) as e:
+                print(f"检查更新失败: {e}")
+                cache = {**self._cache, 'error': f'无法获取版本信息: {str(e)}'}
+            else:
+                cache.pop('error', None)
+            cache['checked_at'] = time.time()
+            with self._lock:
+                self._cache = cache
+            try:
+                # 缓存丢失只需重新检查，不保留备份
+                _atomic_write_json(self.cache_file, cache, backups=0)
+            except OSError as e:
+                print(f"保存更新检查缓存失败: {e}")
+        finally:
+            with self._lock:
+                self._thread = None
+            self._idle.set()
+
+def compare_versions(version1: str, version2: str) -> bool:
+    """比较两个版本号，返回version1是否大于version2"""
+    try:
+        v1_parts = list(map(int, version1.split('.')))
+        v2_parts = list(map(int, version2.split('.')))
+
+        # 确保版本号部分长度相同
+        max_length = max(len(v1_parts), len(v2_parts))
+        v1_parts.extend([0] * (max_length - len(v1_parts)))
+        v2_parts.extend([0] * (max_length - len(v2_parts)))
+
+        for v1, v2 in zip(v1_parts, v2_parts):
+            if v1 > v2:
+                return True
+            if v1 < v2:
+                return False
+        return False
+    except (ValueError, AttributeError):
+        return False
+
+update_checker = UpdateChecker(UPDATE_CHECK_FILE)
+
+download_sessions = ResumableDownloads(DOWNLOAD_SESSIONS_DIR)
+
+def resume_downloads() -> None:
+    """继续上次退出时未完成的下载"""
+    resumed = 0
+    for session_id in download_sessions.session_ids():
+        if session_id.startswith(UPDATE_SESSION_PREFIX):
+            # 更新包的下载由更新程序继续，完成后还要校验和拼接
+            updater.start()
+            continue
+        try:
+            if download_sessions.resume(session_id, callback=callback_func) is not None:
+                resumed += 1
+        except FileNotFoundError as e:
+            print(f"无法继续未完成的下载: {e}")
+            return
+    if resumed:
+        print(f"继续 {resumed} 个未完成的下载")
+
+def _sha256_file(path: Path) -> str:
+    """计算文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _local_blocks(path: Path, block_size: int) -> Dict[str, int]:
+    """按固定大小分块计算文件的SHA-256，返回 {分块哈希: 偏移}"""
+    blocks = {}
+    with open(path, 'rb') as f:
+        offset = 0
+        for block in iter(lambda: f.read(block_size), b''):
+            blocks.setdefault(hashlib.sha256(block).hexdigest(), offset)
+            offset += len(block)
+    return blocks
+
+def _fetch_release_manifest() -> Dict[str, Any]:
+    """获取发布清单（校验证书，可执行文件的哈希以它为准）"""
+    with urllib.request.urlopen(RELEASE_MANIFEST_URL, timeout=VERSION_DOWNLOAD_TIMEOUT) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def _write_swap_script(executable: Path, new_executable: Path, relaunch: bool) -> list[str]:
+    """写出在本进程退出后替换可执行文件的辅助脚本，返回启动它的命令"""
+    pid = os.getpid()
+    if sys.platform == 'win32':
+        script = UPDATE_DIR / 'apply_update.cmd'
+        lines = [
+            '@echo off',
+            ':wait',
+            f'tasklist /FI "PID eq {pid}" 2>NUL | find "{pid}" >NUL && (timeout /t 1 /nobreak >NUL & goto wait)',
+            'set n=0',
+            ':retry',
+            f'move /Y "{new_executable}" "{executable}" >NUL 2>&1 && goto done',
+            'set /a n+=1',
+            'if %n% lss 30 (timeout /t 1 /nobreak >NUL & goto retry)',
+            'goto end',
+            ':done',
+            f'start "" "{executable}"' if relaunch else 'rem',
+            ':end',
+            'del "%~f0"',
+        ]
+        script.write_text('\r\n'.join(lines) + '\r\n', encoding='mbcs')
+        return ['cmd', '/c', str(script)]
+    script = UPDATE_DIR / 'apply_update.sh'
+    exe, new = shlex.quote(str(executable)), shlex.quote(str(new_executable))
+    lines = [
+        '#!/bin/sh',
+        f'while kill -0 {pid} 2>/dev/null; do sleep 1; done',
+        f'mv -f {new} {exe} && chmod +x {exe}' + (f' && ({exe} >/dev/null 2>&1 &)' if relaunch else ''),
+        'rm -f "$0"',
+    ]
+    script.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return ['/bin/sh', str(script)]
+
+class Updater:
+    """应用内更新
+
+    从版本文件旁的 release.json 获取发布清单，通过TTHSD下载新版本可执行文件：
+    清单提供分块哈希时只下载本地可执行文件中没有的分块，再与本地分块拼出新文件；
+    否则下载整个文件，服务器支持Range时按字节区间下载。下载使用可续传会话，中途退出后
+    下次启动只继续未完成的部分。校验SHA-256后记入 pending.json，窗口关闭后由辅助脚本在本进程
+    退出后替换可执行文件。只有PyInstaller打包的程序支持。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._restart = False
+        self._state: Dict[str, Any] = {'status': 'idle'}
+        self._pending: Dict[str, Any] | None = None
+        self._task_bytes: Dict[str, int] = {}
+        if UPDATE_PENDING_FILE.exists():
+            try:
+                with open(UPDATE_PENDING_FILE, 'r', encoding='utf-8') as f:
+                    pending = json.load(f)
+                installable = compare_versions(pending['version'], APP_VERSION) and Path(pending['path']).exists()
+            except (OSError, json.JSONDecodeError, KeyError) as e:
+                print(f"读取待安装的更新失败: {e}")
+                installable = False
+            if installable:
+                self._pending = pending
+                self._state = {'status': 'ready', 'version': pending['version']}
+            else:
+                # 更新已经安装（或记录无效、文件已丢失），清理下载目录
+                shutil.rmtree(UPDATE_DIR, ignore_errors=True)
+
+    @staticmethod
+    def supported() -> bool:
+        """只有打包后的程序能替换自身的可执行文件"""
+        return bool(getattr(sys, 'frozen', False))
+
+    def status(self) -> Dict[str, Any]:
+        """返回更新状态：idle / checking / downloading / verifying / ready / error"""
+        with self._lock:
+            state = dict(self._state)
+        state.update({'supported': self.supported(), 'current_version': APP_VERSION})
+        return state
+
+    def _set(self, **state) -> None:
+        with self._lock:
+            self._state = state
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            self._state.update(fields)
+
+    def start(self) -> None:
+        """在后台下载更新；已在下载或已下载完成时不重复启动"""
+        with self._lock:
+            if self._thread is not None or self._pending is not None:
+                return
+            self._state = {'status': 'checking'}
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _on_event(self, event: Event, msg: dict) -> None:
+        """TTHSD事件回调：汇总各任务已下载字节数"""
+        if event.get('Type') == 'update':
+            with self._lock:
+                self._task_bytes[event.get('ID', '')] = int(msg.get('Downloaded', 0))
+                self._state['downloaded'] = self._state.get('resumed', 0) + sum(self._task_bytes.values())
+        callback_func(event, msg)
+
+    def _download(self, session_id: str, urls: list[str], save_paths: list[str], is_multiple: bool) -> None:
+        """通过可续传会话下载，上次未完成时只继续剩余的任务"""
+        with self._lock:
+            self._task_bytes = {}
+        if session_id in download_sessions.session_ids():
+            future = download_sessions.resume(session_id, callback=self._on_event, timeout=UPDATE_DOWNLOAD_TIMEOUT)
+        else:
+            future = download_sessions.submit(
+                urls, save_paths, session_id=session_id, callback=self._on_event,
+                is_multiple=is_multiple, timeout=UPDATE_DOWNLOAD_TIMEOUT
+            )
+        if future is not None:
+            future.result()
+
+    def _download_full(self, version: str, release: Dict[str, Any], target: Path) -> None:
+        """下载整个可执行文件；服务器支持Range时按字节区间下载，重启后只下载缺失的区间"""
+        if target.exists() and _sha256_file(target) == release['sha256'].lower():
+            return
+        self._set(status='downloading', version=version, downloaded=0, total=release['size'])
+        self._download(f'{UPDATE_SESSION_PREFIX}{version}', [release['url']], [str(target)], is_multiple=False)
+
+    def _download_delta(self, version: str, release: Dict[str, Any], block_url: str, target: Path) -> None:
+        """只下载本地可执行文件中没有的分块，再按清单顺序拼出新文件"""
+        block_size = release['block_size']
+        hashes = [h.lower() for h in release['blocks']]
+        local = _local_blocks(Path(sys.executable), block_size)
+        blocks_dir = UPDATE_DIR / 'blocks'
+        missing = sorted({h for h in hashes if h not in local})
+        # 上次已下载好的分块不再下载
+        fetch = [h for h in missing if not ((blocks_dir / h).exists() and _sha256_file(blocks_dir / h) == h)]
+        resumed = (len(missing) - len(fetch)) * block_size
+        self._set(
+            status='downloading', version=version, downloaded=resumed, resumed=resumed,
+            total=len(missing) * block_size, reused_blocks=len(hashes) - len(missing), total_blocks=len(hashes)
+        )
+        if fetch:
+            blocks_dir.mkdir(parents=True, exist_ok=True)
+            self._download(
+                f'{UPDATE_SESSION_PREFIX}{version}-blocks',
+                [block_url.format(hash=h) for h in fetch],
+                [str(blocks_dir / h) for h in fetch],
+                is_multiple=True
+            )
+        self._update(status='verifying')
+        tmp_target = target.with_suffix(target.suffix + '.part')
+        with open(sys.executable, 'rb') as src, open(tmp_target, 'wb') as out:
+            for h in hashes:
+                if h in local:
+                    src.seek(local[h])
+                    block = src.read(block_size)
+                else:
+                    block = (blocks_dir / h).read_bytes()
+                if hashlib.sha256(block).hexdigest() != h:
+                    raise ValueError(f'分块校验失败: {h}')
+                out.write(block)
+        tmp_target.replace(target)
+
+    def _run(self) -> None:
+        try:
+            manifest = _fetch_release_manifest()
+            version = manifest['version']
+            if not compare_versions(version, APP_VERSION):
+                self._set(status='idle', message='当前已是最新版本')
+                return
+            release = manifest['platforms'].get(platform.system().lower())
+            if release is None:
+                raise ValueError('发布清单中没有适用于当前系统的更新包')
+            UPDATE_DIR.mkdir(parents=True, exist_ok=True)
+            target = UPDATE_DIR / f'{APP_NAME}-{version}{Path(sys.executable).suffix}'
+            if release.get('blocks') and manifest.get('block_url'):
+                self._download_delta(version, release, manifest['block_url'], target)
+            else:
+                self._download_full(version, release, target)
+            self._update(status='verifying')
+            if target.stat().st_size != release['size'] or _sha256_file(target) != release['sha256'].lower():
+                target.unlink(missing_ok=True)
+                raise ValueError('更新包校验失败，已删除')
+            pending = {'version': version, 'path': str(target), 'sha256': release['sha256'].lower()}
+            _atomic_write_json(UPDATE_PENDING_FILE, pending, backups=0)
+            shutil.rmtree(UPDATE_DIR / 'blocks', ignore_errors=True)
+            with self._lock:
+                self._pending = pending
+                self._state = {'status': 'ready', 'version': version}
+            print(f"更新 {version} 已下载，重启后完成安装")
+        except (urllib.error.URLError, OSError, TimeoutError, ValueError, KeyError) as e:
+            print(f"下载更新失败: {e}")
+            self._set(status='error', error=str(e))
+        finally:
+            with self._lock:
+                self._thread = None
+
+    def request_restart(self) -> None:
+        """安装更新后重新启动程序，并关闭窗口"""
+        with self._lock:
+            self._restart = True
+        for window in list(webview.windows):
+            window.destroy()
+
+    def apply_on_exit(self) -> None:
+        """窗口关闭后调用：有已下载的更新时启动辅助脚本，在本进程退出后替换可执行文件"""
+        with self._lock:
+            pending = self._pending
+            relaunch = self._restart
+        if pending is None or not self.supported():
+            return
+        new_executable = Path(pending['path'])
+        try:
+            if _sha256_file(new_executable) != pending['sha256']:
+                print("待安装的更新包已损坏，放弃安装")
+                UPDATE_PENDING_FILE.unlink(missing_ok=True)
+                return
+            command = _write_swap_script(Path(sys.executable), new_executable, relaunch)
+            if sys.platform == 'win32':
+                flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+                subprocess.Popen(command, creationflags=flags, close_fds=True)
+            else:
+                subprocess.Popen(command, start_new_session=True, close_fds=True)
+            print(f"程序退出后将安装更新 {pending['version']}")
+        except OSError as e:
+            print(f"安装更新失败: {e}")
+
+updater = Updater()
+
+# OpenAI客户端缓存：按 (api_key, base_url) 复用底层HTTP连接池，避免每轮对话重新建立TCP/TLS连接
+_openai_clients: Dict[tuple[str, str], OpenAI] = {}
+_openai_clients_lock = threading.Lock()
+_client_stats_lock = threading.Lock()
+client_stats = {
+    'clients_created': 0,     # 新建的客户端数量
+    'client_cache_hits': 0,   # 命中缓存的次数
+    'requests': 0,            # 发出的HTTP请求数
+    'connections_opened': 0,  # 新建的TCP连接数
+    'tls_handshakes': 0       # TLS握手次数
+}
+
+def _count_client_stat(key: str) -> None:
+    """累加一项连接统计"""
+    with _client_stats_lock:
+        client_stats[key] += 1
+
+def _trace_connection(event_name: str, _info: Dict[str, Any]) -> None:
+    """httpcore 追踪回调：只有新建连接时才会触发 connect/start_tls 事件"""
+    if event_name in ('connection.connect_tcp.complete', 'connection.connect_unix_socket.complete'):
+        _count_client_stat('connections_opened')
+    elif event_name == 'connection.start_tls.complete':
+        _count_client_stat('tls_handshakes')
+
+def _on_http_request(http_request: httpx.Request) -> None:
+    """httpx 请求钩子：统计请求数并挂载连接追踪"""
+    _count_client_stat('requests')
+    http_request.extensions['trace'] = _trace_connection
+
+def get_openai_client() -> OpenAI:
+    """获取当前配置对应的OpenAI客户端，相同的API密钥和地址复用同一个连接池"""
+    cfg = config  # 配置按整体替换，取一次引用保证密钥与地址来自同一份配置
+    key = (cfg['api_key'], cfg['base_url'])
+    with _openai_clients_lock:
+        client = _openai_clients.get(key)
+        if client is not None:
+            _count_client_stat('client_cache_hits')
+            return client
+        http_client = httpx.Client(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120),
+            follow_redirects=True,
+            event_hooks={'request': [_on_http_request]}
+        )
+        client = OpenAI(api_key=key[0], base_url=key[1], http_client=http_client)
+        _openai_clients[key] = client
+        _count_client_stat('clients_created')
+        return client
+
+# ASGI模式使用的异步客户端，绑定在服务器的事件循环上
+_async_openai_clients: Dict[tuple[str, str], AsyncOpenAI] = {}
+
+async def _trace_connection_async(event_name: str, info: Dict[str, Any]) -> None:
+    """异步连接追踪回调（httpcore 异步接口要求协程函数）"""
+    _trace_connection(event_name, info)
+
+async def _on_http_request_async(http_request: httpx.Request) -> None:
+    """异步 httpx 请求钩子"""
+    _count_client_stat('requests')
+    http_request.extensions['trace'] = _trace_connection_async
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """获取当前配置对应的异步OpenAI客户端（只在ASGI事件循环中调用）"""
+    cfg = config
+    key = (cfg['api_key'], cfg['base_url'])
+    with _openai_clients_lock:
+        client = _async_openai_clients.get(key)
+        if client is not None:
+            _count_client_stat('client_cache_hits')
+            return client
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120),
+            follow_redirects=True,
+            event_hooks={'request': [_on_http_request_async]}
+        )
+        client = AsyncOpenAI(api_key=key[0], base_url=key[1], http_client=http_client)
+        _async_openai_clients[key] = client
+        _count_client_stat('clients_created')
+        return client
+
+def discard_stale_openai_clients() -> None:
+    """从缓存中移除与当前配置不一致的客户端（API密钥或地址被修改后调用）
+
+    进行中的流式回复可能仍在使用旧客户端，这里不主动关闭，最后一个使用者释放后由GC回收连接池。
+    """
+    cfg = config
+    current = (cfg['api_key'], cfg['base_url'])
+    with _openai_clients_lock:
+        for key in [key for key in _openai_clients if key != current]:
+            del _openai_clients[key]
+        for key in [key for key in _async_openai_clients if key != current]:
+            del _async_openai_clients[key]
+
+def get_client_stats() -> Dict[str, Any]:
+    """返回连接复用统计"""
+    with _client_stats_lock:
+        stats = dict(client_stats)
+    stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+    stats['reuse_ratio'] = (
+        round(stats['connections_reused'] / stats['requests'], 3) if stats['requests'] else 0.0
+    )
+    with _openai_clients_lock:
+        stats['cached_clients'] = len(_openai_clients) + len(_async_openai_clients)
+    with _generations_lock:
+        stats['inflight_completions'] = len(_generations)
+    return stats
+
+# 上下文窗口：按token预算截取发送给模型的历史消息
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+# 每条消息的格式开销（角色标记等）
+MESSAGE_TOKEN_OVERHEAD = 4
+# 早期对话摘要：{对话ID: {'covered': 已概括的消息数, 'summary': 摘要}}
+# 摘要请求的输入按 context_token_budget 分段，上一段的摘要与下一段对话一起发送
+SUMMARY_MAX_TOKENS = 500
+SUMMARY_PROMPT = "请用简洁的中文总结以下对话的要点，保留关键事实、结论和用户的偏好；如果给出了之前的摘要，把新内容合并进去。"
+_context_summaries: Dict[str, Dict[str, Any]] = {}
+_summaries_in_progress: set[str] = set()
+_summary_lock = threading.Lock()
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    """估算文本token数：中日韩字符按1个token计，其余按约4个字符1个token计"""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """估算单条消息的token数"""
+    return MESSAGE_TOKEN_OVERHEAD + estimate_tokens(message.get('content') or '')
+
+def build_context_window(conversation_id: str,
+                         messages: list[Dict[str, Any]]) -> tuple[list[Dict[str, Any]], Dict[str, Any]]:
+    """组装发送给模型的消息列表
+
+    保留系统提示词和最近的若干条消息，总量不超过 context_token_budget；
+    开启 context_summary 时，被丢弃的早期消息以缓存的摘要代替。
+    返回 (请求消息列表, 统计信息)。
+    """
+    request_messages = [{"role": m['role'], "content": m.get('content') or ''} for m in messages]
+    system = request_messages[:1] if request_messages and request_messages[0]['role'] == 'system' else []
+    history = request_messages[len(system):]
+    budget = config['context_token_budget']
+    total_tokens = sum(message_tokens(m) for m in request_messages)
+    stats = {
+        'prompt_tokens': total_tokens,
+        'dropped_tokens': 0,
+        'dropped_messages': 0,
+        'summarized': False
+    }
+    if budget <= 0 or total_tokens <= budget:
+        return request_messages, stats
+
+    # 从最新的消息往前保留，当前这条用户消息无论如何都会保留
+    remaining = budget - sum(message_tokens(m) for m in system)
+    keep_from = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        cost = message_tokens(history[index])
+        if cost > remaining and index < len(history) - 1:
+            break
+        remaining -= cost
+        keep_from = index
+    # 不以助手回复开头，保证上下文从完整的一轮对话开始
+    while keep_from < len(history) - 1 and history[keep_from]['role'] == 'assistant':
+        remaining += message_tokens(history[keep_from])
+        keep_from += 1
+
+    dropped = history[:keep_from]
+    kept = history[keep_from:]
+    dropped_tokens = sum(message_tokens(m) for m in dropped)
+    stats.update({
+        'prompt_tokens': total_tokens - dropped_tokens,
+        'dropped_tokens': dropped_tokens,
+        'dropped_messages': len(dropped)
+    })
+
+    if config['context_summary'] and dropped:
+        with _summary_lock:
+            cached = _context_summaries.get(conversation_id)
+        if cached and cached['covered'] <= len(dropped):
+            # 摘要并入系统提示词，避免出现多条系统消息
+            summary_text = f"以下是之前对话的摘要：\n{cached['summary']}"
+            summary_tokens = estimate_tokens(summary_text) + (0 if system else MESSAGE_TOKEN_OVERHEAD)
+            if summary_tokens <= remaining:
+                if system:
+                    summary_text = f"{system[0]['content']}\n\n{summary_text}"
+                system = [{"role": "system", "content": summary_text}]
+                stats['prompt_tokens'] += summary_tokens
+                stats['summarized'] = True
+        if not cached or cached['covered'] < len(dropped):
+            refresh_context_summary(conversation_id, dropped)
+
+    print(
+        f"上下文裁剪（{conversation_id}）：丢弃 {stats['dropped_messages']} 条消息，"
+        f"约 {stats['dropped_tokens']} tokens，发送约 {stats['prompt_tokens']} tokens"
+    )
+    return system + kept, stats
+
+def _summary_chunks(messages: list[Dict[str, Any]], limit: int) -> list[list[Dict[str, Any]]]:
+    """把消息按token上限分组，单条超过上限的消息截断（每个字符至多计1个token）"""
+    chunks: list[list[Dict[str, Any]]] = []
+    current: list[Dict[str, Any]] = []
+    used = 0
+    for message in messages:
+        content = message.get('content') or ''
+        if message_tokens(message) > limit:
+            content = content[:max(limit - MESSAGE_TOKEN_OVERHEAD, 0)]
+            message = {'role': message['role'], 'content': content}
+        cost = message_tokens(message)
+        if current and used + cost > limit:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(message)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _summarize_step(previous: str, chunk: list[Dict[str, Any]]) -> str:
+    """把一段对话并入已有摘要，返回新的摘要"""
+    transcript = '\n'.join(f"{m['role']}: {m.get('content') or ''}" for m in chunk)
+    if previous:
+        transcript = f"之前对话的摘要：\n{previous}\n\n之后的对话：\n{transcript}"
+    response = get_openai_client().chat.completions.create(
+        model=config['model'],
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": transcript}
+        ],
+        temperature=0.3,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        timeout=60
+    )
+    return response.choices[0].message.content or ''
+
+def update_context_summary(conversation_id: str, dropped: list[Dict[str, Any]]) -> None:
+    """逐步更新摘要：在已有摘要的基础上只概括尚未覆盖的消息，每次请求不超过上下文预算"""
+    with _summary_lock:
+        cached = _context_summaries.get(conversation_id)
+    # 早期消息被删减后已有摘要不再对应，从头概括
+    if cached and cached['covered'] <= len(dropped):
+        covered, summary = cached['covered'], cached['summary']
+    else:
+        covered, summary = 0, ''
+    budget = config['context_token_budget']
+    for chunk in _summary_chunks(dropped[covered:], max(budget - SUMMARY_MAX_TOKENS, budget // 2)):
+        summary = _summarize_step(summary, chunk)
+        covered += len(chunk)
+        # 每步的结果立即可用，中途失败时下次从这里继续
+        with _summary_lock:
+            _context_summaries[conversation_id] = {'covered': covered, 'summary': summary}
+    print(f"已生成对话摘要（{conversation_id}），概括 {covered} 条消息")
+
+def refresh_context_summary(conversation_id: str, dropped: list[Dict[str, Any]]) -> None:
+    """在后台为被丢弃的早期消息生成摘要，供后续请求使用"""
+    with _summary_lock:
+        if conversation_id in _summaries_in_progress:
+            return
+        _summaries_in_progress.add(conversation_id)
+
+    def worker():
+        try:
+            update_context_summary(conversation_id, dropped)
+        except (OpenAIError, ConnectionError, TimeoutError, ValueError) as e:
+            print(f"生成对话摘要失败: {e}")
+        finally:
+            with _summary_lock:
+                _summaries_in_progress.discard(conversation_id)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+# 确保默认对话存在
+if not store.has_conversation('default'):
+    store.put_conversation('default', [], "新对话 1")
+
+# Flask路由
+@app.route('/')
+def index():
+    """默认路由，返回HTML页面"""
+    return HTML_CONTENT
+
+@app.route('/api/config', methods=['GET', 'POST'])
+def api_config():
+    """配置管理API"""
+    global config
+    if request.method == 'GET':
+        return jsonify(config)
+    data = request.json
+    if data:
+        # 写时复制：整体替换配置字典，正在处理的请求读到的始终是完整的一份配置
+        with _config_lock:
+            config = {**config, **data}
+            config_writer.submit(config)
+        # 系统提示词只保存在配置中，发送请求时再注入，保存配置不涉及对话历史
+        discard_stale_openai_clients()
+    return jsonify({"status": "success"})
+
+@app.route('/api/conversations', methods=['GET', 'POST'])
+def api_conversations():
+    """对话管理API"""
+    if request.method == 'GET':
+        return jsonify(store.export_all())
+    data = request.json
+    if data:
+        # 只把有变化的对话写入日志
+        store.sync_all(data.get('conversations', {}), data.get('conversation_titles', {}))
+    return jsonify({"status": "success"})
+
+def _page_size(name: str, default: int = 50, maximum: int = 200) -> int:
+    """读取分页大小参数"""
+    try:
+        return min(max(int(request.args.get(name, default)), 1), maximum)
+    except ValueError:
+        return default
+
+@app.route('/api/conversations/list', methods=['GET'])
+def api_conversation_list():
+    """对话列表API：只返回ID、标题、时间戳和消息数，按游标分页"""
+    return jsonify(store.list_conversations(_page_size('limit'), request.args.get('cursor')))
+
+def _version_conflict(conversation_id: str, data: Dict[str, Any]):
+    """检查页面提交的版本号，与服务端不一致时返回409响应"""
+    expected = data.get('version')
+    current = store.get_version(conversation_id)
+    if current is not None and expected != current:
+        return jsonify({"error": "对话已在其他窗口被修改，已重新加载", "version": current}), 409
+    return None
+
+@app.route('/api/conversations/<conversation_id>', methods=['GET', 'PUT', 'PATCH', 'DELETE'])
+def api_conversation_detail(conversation_id: str):
+    """单个对话API：读取（只读取该对话的数据）、新建、重命名、删除
+
+    修改类请求需带上页面持有的版本号 version，新建时对话必须尚不存在。
+    """
+    if request.method == 'GET':
+        messages = store.get_messages(conversation_id)
+        if messages is None:
+            return jsonify({"error": "对话不存在"}), 404
+        return jsonify({
+            'id': conversation_id,
+            'title': store.get_titles().get(conversation_id),
+            'messages': messages,
+            'version': store.get_version(conversation_id)
+        })
+
+    data = request.get_json(silent=True) or {}
+    # 版本检查和修改在同一把对话锁内完成
+    with store.conversation_lock(conversation_id):
+        if request.method != 'PUT' and not store.has_conversation(conversation_id):
+            return jsonify({"error": "对话不存在"}), 404
+        conflict = _version_conflict(conversation_id, data)
+        if conflict:
+            return conflict
+
+        if request.method == 'PUT':
+            messages = data.get('messages') or []
+            version = store.put_conversation(conversation_id, messages, data.get('title'))
+        elif request.method == 'PATCH':
+            title = (data.get('title') or '').strip()
+            if not title:
+                return jsonify({"error": "缺少对话标题"}), 400
+            version = store.set_title(conversation_id, title)
+        else:
+            store.delete_conversation(conversation_id)
+            return jsonify({"status": "success"})
+    return jsonify({"status": "success", "version": version})
+
+@app.route('/api/conversations/<conversation_id>/messages', methods=['GET', 'POST'])
+def api_conversation_messages(conversation_id: str):
+    """对话消息API：GET 从新到旧分页读取消息，POST 追加一条消息"""
+    if request.method == 'GET':
+        before = request.args.get('before', type=int)
+        page = store.get_message_page(conversation_id, _page_size('limit'), before)
+        if page is None:
+            return jsonify({"error": "对话不存在"}), 404
+        page['version'] = store.get_version(conversation_id)
+        return jsonify(page)
+
+    data = request.get_json(silent=True) or {}
+    message = data.get('message')
+    if not isinstance(message, dict) or not message.get('role'):
+        return jsonify({"error": "缺少消息内容"}), 400
+    with store.conversation_lock(conversation_id):
+        if not store.has_conversation(conversation_id):
+            return jsonify({"error": "对话不存在"}), 404
+        conflict = _version_conflict(conversation_id, data)
+        if conflict:
+            return conflict
+        version = store.append_message(
+            conversation_id, {"role": message['role'], "content": message.get('content', '')}
+        )
+    return jsonify({"status": "success", "version": version})
+
+def _api_error_message(exc: Exception) -> str:
+    """将模型调用过程中的异常转换为提示给用户的错误信息"""
+    if isinstance(exc, AuthenticationError):
+        return "API认证失败，请检查API密钥"
+    if isinstance(exc, RateLimitError):
+        return "API速率限制，请稍后再试"
+    if isinstance(exc, OpenAIError):
+        return f"API调用失败: {str(exc)}"
+    return f"发生错误: {str(exc)}"
+
+def _parse_message_request(data: Dict[str, Any] | None) -> tuple[str, str, str | None]:
+    """校验消息请求，返回 (对话ID, 消息内容, 错误信息)"""
+    if not data or not isinstance(data, dict):
+        return '', '', "缺少消息数据"
+
+    conversation_id = data.get('conversation_id')
+    message = data.get('message')
+
+    if not conversation_id or not message:
+        return '', '', "缺少对话ID或消息内容"
+
+    # 检查API配置
+    if not config['api_key'] or not config['base_url']:
+        return '', '', "请先配置API密钥和地址"
+
+    return conversation_id, message, None
+
+def _with_system_prompt(history: list[Dict[str, Any]]) -> list[Dict[str, Any]]:
+    """在对话历史前加上系统提示词
+
+    对话开头带 override 标记的系统消息是该对话单独设置的提示词，原样保留；
+    旧版本保存在开头的系统消息只是当时全局提示词的副本，替换为当前配置中的提示词。
+    """
+    if history and history[0].get('role') == 'system':
+        if history[0].get('override'):
+            return history
+        history = history[1:]
+    return [{"role": "system", "content": config['system_prompt']}] + history
+
+def _build_request_messages(conversation_id: str, message: str) -> list[Dict[str, Any]]:
+    """组装本轮请求的消息列表（不修改已保存的对话历史）"""
+    history = _with_system_prompt(store.get_messages(conversation_id) or [])
+    return history + [{"role": "user", "content": message}]
+
+def _commit_reply(conversation_id: str, messages: list[Dict[str, Any]], content: str,
+                  truncated: bool = False) -> int:
+    """回复完成后把本轮的提问和回复追加到对话历史，返回对话的新版本号
+
+    提问和回复在对话锁内连续写入，同一对话的多个请求并发完成时每一轮都会完整保存，
+    不会因为别的请求先写入而丢失；模型调用本身不持锁。
+    被取消的回复以 truncated 标记保存已生成的部分。
+    """
+    reply = {"role": "assistant", "content": content}
+    if truncated:
+        reply['truncated'] = True
+    with store.conversation_lock(conversation_id):
+        store.append_message(conversation_id, messages[-1])
+        return store.append_message(conversation_id, reply)
+
+class Generation:
+    """一次进行中的模型回复，可以被 /api/message/cancel 取消
+
+    Flask模式下取消会关闭上游的流式响应，正在读取的工作线程随即退出；
+    ASGI模式下取消对应的异步任务。
+    """
+
+    def __init__(self, generation_id: str, conversation_id: str):
+        self.id = generation_id
+        self.conversation_id = conversation_id
+        self.cancelled = threading.Event()
+        # 回复结束（完成、出错或取消后已保存）时设置，result 为取消时保存的内容
+        self.finished = threading.Event()
+        self.result: Dict[str, Any] = {}
+        self._stream = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock = threading.Lock()
+
+    def attach_stream(self, stream: Any) -> None:
+        """登记上游流式响应，已被取消时立即关闭"""
+        with self._lock:
+            self._stream = stream
+            if self.cancelled.is_set():
+                stream.close()
+
+    def attach_task(self, task: asyncio.Task) -> None:
+        """登记ASGI补全任务"""
+        with self._lock:
+            self._task = task
+            self._loop = task.get_loop()
+
+    def cancel(self) -> None:
+        """取消回复（可从任意线程调用）"""
+        with self._lock:
+            if self.cancelled.is_set():
+                return
+            self.cancelled.set()
+            if self._task is not None:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            elif self._stream is not None:
+                self._stream.close()
+
+    def finish(self, **result: Any) -> None:
+        """标记回复结束"""
+        self.result = result
+        self.finished.set()
+
+# 进行中的回复：{生成ID: Generation}
+_generations: Dict[str, Generation] = {}
+_generations_lock = threading.Lock()
+
+def start_generation(conversation_id: str, generation_id: str | None = None) -> Generation:
+    """登记一次新的回复，页面未提供ID时自动生成"""
+    generation = Generation(generation_id or uuid.uuid4().hex, conversation_id)
+    with _generations_lock:
+        _generations[generation.id] = generation
+    return generation
+
+def end_generation(generation: Generation, **result: Any) -> None:
+    """回复结束后移出登记"""
+    with _generations_lock:
+        _generations.pop(generation.id, None)
+    generation.finish(**result)
+
+def _chunk_delta(chunk: Any) -> tuple[str | None, str | None]:
+    """从流式响应块中取出 (推理内容, 回复内容)"""
+    if not chunk.choices:
+        return None, None
+    delta = chunk.choices[0].delta
+    # DeepSeek-R1 等推理模型会先输出 reasoning_content
+    return getattr(delta, 'reasoning_content', None), delta.content
+
+def _sse_event(event: str, payload: Dict[str, Any]) -> str:
+    """格式化一条SSE事件"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/message', methods=['POST'])
+def api_message():
+    """消息处理API"""
+    conversation_id, message, error = _parse_message_request(request.json)
+    if error:
+        return jsonify({"error": error})
+
+    try:
+        # 获取OpenAI客户端（复用连接池）
+        client = get_openai_client()
+
+        # 获取对话历史
+        messages = _build_request_messages(conversation_id, message)
+        request_messages, context_stats = build_context_window(conversation_id, messages)
+
+        # 调用API
+        response = client.chat.completions.create(
+            model=config['model'],
+            messages=request_messages,
+            temperature=0.7,
+            max_tokens=2000,
+            timeout=30
+        )
+
+        # 获取回复
+        content = response.choices[0].message.content
 
-        with open(version_file, 'r', encoding='utf-8') as f:
-            latest_version = f.read().strip()
+        # 更新对话历史
+        version = _commit_reply(conversation_id, messages, content)
 
-        print(f"当前版本: {APP_VERSION}")
-        print(f"最新版本: {latest_version}")
-        print(f"版本文件内容: '{latest_version}'")
-        print(f"版本文件长度: {len(latest_version)}")
+        return jsonify({"content": content, "version": version, "context": context_stats})
 
-        # 比较版本
-        current_version = APP_VERSION
-        is_update_available = compare_versions(latest_version, current_version)
+    except (OpenAIError, ConnectionError, TimeoutError, ValueError) as e:
+        return jsonify({"error": _api_error_message(e)})
 
-        print(f"是否有更新: {is_update_available}")
-        print(
-            f"版本比较结果: compare_versions('{latest_version}', '{current_version}') "
-            f"= {is_update_available}"
-        )
+@app.route('/api/message/stream', methods=['POST'])
+def api_message_stream():
+    """流式消息处理API
 
-        return {
-            'current_version': current_version,
-            'latest_version': latest_version,
-            'update_available': is_update_available
-        }
-    except (OSError, json.JSONDecodeError) as e:
-        print(f"检查更新失败: {e}")
-        # 尝试使用Python标准库下载（忽略SSL证书验证）
-        try:
-            # 临时文件路径
-            version_file = TEMP_DIR / 'aichat.txt'
-
-            # 忽略SSL证书验证（仅用于版本检查）
-            context = ssl._create_unverified_context()
-
-            # 下载文件
-            with urllib.request.urlopen(VERSION_URL, context=context) as response:
-                with open(version_file, 'wb') as f:
-                    f.write(response.read())
-
-            # 读取版本文件
-            if not version_file.exists():
-                return {
-                    'current_version': APP_VERSION,
-                    'latest_version': None,
-                    'update_available': False,
-                    'error': '无法下载版本文件'
-                }
+    以SSE格式逐段推送：context（上下文裁剪统计）、reasoning（推理过程）、
+    delta（回复增量）、done（完整回复）、cancelled（已取消，附带保存的部分回复）、
+    error（错误信息）。回复完成后才写入对话历史。
 
-            with open(version_file, 'r', encoding='utf-8') as f:
-                latest_version = f.read().strip()
+    请求体中的 generation_id 用于 /api/message/cancel 取消本次回复；
+    页面中止请求（连接断开）同样视为取消。
+    """
+    data = request.json
+    conversation_id, message, error = _parse_message_request(data)
+    if error:
+        return jsonify({"error": error})
 
-            print(f"当前版本: {APP_VERSION}")
-            print(f"最新版本: {latest_version}")
+    messages = _build_request_messages(conversation_id, message)
+    request_messages, context_stats = build_context_window(conversation_id, messages)
+    generation = start_generation(conversation_id, data.get('generation_id'))
 
-            # 比较版本
-            current_version = APP_VERSION
-            is_update_available = compare_versions(latest_version, current_version)
+    def save_partial(parts: list[str]) -> Dict[str, Any]:
+        content = ''.join(parts)
+        # 什么都没生成时不保存这一轮
+        version = _commit_reply(conversation_id, messages, content, truncated=True) if content else None
+        return {"content": content, "version": version, "truncated": True}
 
-            print(f"是否有更新: {is_update_available}")
+    def generate():
+        parts = []
+        result = {}
+        saved = False
+        try:
+            yield _sse_event('context', dict(context_stats, generation_id=generation.id))
+            try:
+                client = get_openai_client()
+                stream = client.chat.completions.create(
+                    model=config['model'],
+                    messages=request_messages,
+                    temperature=0.7,
+                    max_tokens=2000,
+                    timeout=30,
+                    stream=True
+                )
+                generation.attach_stream(stream)
+                for chunk in stream:
+                    reasoning, delta_content = _chunk_delta(chunk)
+                    if reasoning:
+                        yield _sse_event('reasoning', {"content": reasoning})
+                    if delta_content:
+                        parts.append(delta_content)
+                        yield _sse_event('delta', {"content": delta_content})
+            except (OpenAIError, ConnectionError, TimeoutError, ValueError,
+                    httpx.HTTPError, httpx.StreamError) as e:
+                # 取消时关闭上游连接会让读取抛出异常，不作为错误处理
+                if not generation.cancelled.is_set():
+                    yield _sse_event('error', {"error": _api_error_message(e)})
+                    return
 
-            return {
-                'current_version': current_version,
-                'latest_version': latest_version,
-                'update_available': is_update_available
-            }
-        except (urllib.error.URLError, urllib.error.HTTPError, OSError) as e2:
-            print(f"备用下载方法也失败: {e2}")
-            return {
-                'current_version': APP_VERSION,
-                'latest_version': None,
-                'update_available': False,
-                'error': f'检查更新失败: {str(e)}\n备用方法也失败: {str(e2)}'
-            }
+            saved = True
+            if generation.cancelled.is_set():
+                result = save_partial(parts)
+                yield _sse_event('cancelled', result)
+                return
+            content = ''.join(parts)
+            version = _commit_reply(conversation_id, messages, content)
+            yield _sse_event('done', {"content": content, "version": version})
+        except GeneratorExit:
+            # 页面中止了请求：关闭上游连接并保存已生成的部分
+            generation.cancel()
+            if not saved:
+                result = save_partial(parts)
+            raise
+        finally:
+            end_generation(generation, **result)
 
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-def compare_versions(version1: str, version2: str) -> bool:
-    """比较两个版本号，返回version1是否大于version2"""
-    try:
-        v1_parts = list(map(int, version1.split('.')))
-        v2_parts = list(map(int, version2.split('.')))
+@app.route('/api/message/cancel', methods=['POST'])
+def api_message_cancel():
+    """取消进行中的回复，等待已生成的部分保存后返回"""
+    data = request.get_json(silent=True) or {}
+    with _generations_lock:
+        generation = _generations.get(data.get('generation_id'))
+    if generation is None:
+        return jsonify({"error": "回复已结束或不存在"}), 404
+    generation.cancel()
+    generation.finished.wait(timeout=5)
+    return jsonify({"status": "cancelled", **generation.result})
 
-        # 确保版本号部分长度相同
-        max_length = max(len(v1_parts), len(v2_parts))
-        v1_parts.extend([0] * (max_length - len(v1_parts)))
-        v2_parts.extend([0] * (max_length - len(v2_parts)))
+@app.route('/api/client-stats', methods=['GET'])
+def api_client_stats():
+    """OpenAI客户端连接复用统计API"""
+    return jsonify(get_client_stats())
 
-        for v1, v2 in zip(v1_parts, v2_parts):
-            if v1 > v2:
-                return True
-            if v1 < v2:
-                return False
-        return False
-    except (ValueError, AttributeError):
-        return False
+@app.route('/api/storage-stats', methods=['GET'])
+def api_storage_stats():
+    """后台写入统计API：写盘次数、合并条数与耗时直方图"""
+    return jsonify({
+        'journal': store.write_stats(),
+        'config': config_writer.stats(),
+        'search': search_index.write_stats()
+    })
 
-# 确保默认对话存在
-if 'default' not in conversations:
-    conversations['default'] = [{"role": "system", "content": config['system_prompt']}]
-    conversation_titles['default'] = "新对话 1"
-    save_conversations({
-        'conversations': conversations,
-        'conversation_titles': conversation_titles
+@app.route('/api/search', methods=['GET'])
+def api_search():
+    """全文搜索API：q 为搜索内容，按相关度返回匹配的消息和对话标题及摘要片段"""
+    if not search_index.available:
+        return jsonify({"error": "全文搜索不可用（当前SQLite不支持FTS5）"}), 503
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({"error": "缺少搜索内容"}), 400
+    started = time.perf_counter()
+    results = search_index.search(query, _page_size('limit', 20, 100))
+    return jsonify({
+        'results': results,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
     })
 
-# Flask路由
-@app.route('/')
-def index():
-    """默认路由，返回HTML页面"""
-    return HTML_CONTENT
+@app.route('/api/download-metrics', methods=['GET'])
+def api_download_metrics():
+    """TTHSD下载指标API：吞吐量、首字节时间、完成耗时等，id 指定单个下载器，tasks=1 时包含任务明细"""
+    include_tasks = bool(request.args.get('tasks'))
+    downloader_id = request.args.get('id', type=int)
+    if downloader_id is None:
+        return jsonify(get_download_metrics(include_tasks=include_tasks))
+    metrics = get_download_metrics(downloader_id, include_tasks)
+    if metrics is None:
+        return jsonify({"error": "下载器不存在"}), 404
+    return jsonify(metrics)
 
-@app.route('/api/config', methods=['GET', 'POST'])
-def api_config():
-    """配置管理API"""
-    global config
-    if request.method == 'GET':
-        return jsonify(config)
-    data = request.json
-    if data:
-        config.update(data)
-        save_config(config)
-        # 更新所有对话的系统提示词
-        for conv_id in conversations:
-            if conversations[conv_id]:
-                conversations[conv_id][0] = {"role": "system", "content": config['system_prompt']}
-        save_conversations({
-            'conversations': conversations,
-            'conversation_titles': conversation_titles
-        })
-    return jsonify({"status": "success"})
+@app.route('/api/check-update', methods=['GET'])
+def api_check_update():
+    """检查更新API：立即返回缓存的结果；refresh=1（手动检查）时重新检查并等待结果"""
+    if request.args.get('refresh'):
+        update_checker.refresh(force=True)
+        update_checker.wait(VERSION_DOWNLOAD_TIMEOUT * 2)
+    else:
+        # 缓存过期时在后台刷新，本次先返回旧结果
+        update_checker.refresh()
+    return jsonify(update_checker.result())
 
-@app.route('/api/conversations', methods=['GET', 'POST'])
-def api_conversations():
-    """对话管理API"""
-    global conversations, conversation_titles
-    if request.method == 'GET':
-        return jsonify({
-            'conversations': conversations,
-            'conversation_titles': conversation_titles
-        })
-    data = request.json
-    if data:
-        # 更新全局变量
-        conversations = data.get('conversations', {})
-        conversation_titles = data.get('conversation_titles', {})
-        # 保存到文件
-        save_conversations({
-            'conversations': conversations,
-            'conversation_titles': conversation_titles
-        })
-        # 重新加载数据以确保一致性
-        loaded_conversation_data = load_conversations()
-        conversations = loaded_conversation_data['conversations']
-        conversation_titles = loaded_conversation_data['conversation_titles']
-    return jsonify({"status": "success"})
+@app.route('/api/update/status', methods=['GET'])
+def api_update_status():
+    """应用内更新状态API"""
+    return jsonify(updater.status())
 
-@app.route('/api/message', methods=['POST'])
-def api_message():
-    """消息处理API"""
-    data = request.json
-    if not data:
-        return jsonify({"error": "缺少消息数据"})
+@app.route('/api/update/download', methods=['POST'])
+def api_update_download():
+    """在后台下载并校验更新包"""
+    if not updater.supported():
+        return jsonify({"error": "只有打包后的程序支持应用内更新"}), 400
+    updater.start()
+    return jsonify(updater.status())
 
-    conversation_id = data.get('conversation_id')
-    message = data.get('message')
+@app.route('/api/update/restart', methods=['POST'])
+def api_update_restart():
+    """关闭窗口，退出后安装更新并重新启动"""
+    if updater.status()['status'] != 'ready':
+        return jsonify({"error": "更新尚未下载完成"}), 409
+    # 稍后关闭窗口，先让本次请求返回
+    threading.Timer(0.5, updater.request_restart).start()
+    return jsonify({"status": "restarting"})
 
-    if not conversation_id or not message:
-        return jsonify({"error": "缺少对话ID或消息内容"})
+# ASGI服务模式：消息接口使用 AsyncOpenAI 原生异步处理，多个请求可同时等待模型回复，
+# 每个请求是独立的任务，客户端断开或调用取消接口时单独取消；其余接口在线程池中调用Flask应用
+async def _asgi_read_body(receive) -> bytes:
+    """读取完整的请求体"""
+    chunks = []
+    while True:
+        event = await receive()
+        if event['type'] == 'http.disconnect':
+            break
+        chunks.append(event.get('body', b''))
+        if not event.get('more_body'):
+            break
+    return b''.join(chunks)
 
-    # 检查API配置
-    if not config['api_key'] or not config['base_url']:
-        return jsonify({"error": "请先配置API密钥和地址"})
+async def _asgi_wait_disconnect(receive) -> None:
+    """等待客户端断开连接"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def _asgi_send_json(send, payload: Dict[str, Any], status: int = 200) -> None:
+    """发送JSON响应"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _asgi_save_partial(conversation_id: str, messages: list[Dict[str, Any]],
+                             parts: list[str]) -> Dict[str, Any]:
+    """保存被取消的回复中已生成的部分"""
+    content = ''.join(parts)
+    version = None
+    if content:
+        version = await asyncio.to_thread(_commit_reply, conversation_id, messages, content, True)
+    return {"content": content, "version": version, "truncated": True}
 
+async def _asgi_complete(conversation_id: str, messages: list[Dict[str, Any]],
+                         request_messages: list[Dict[str, Any]], context_stats: Dict[str, Any],
+                         send) -> Dict[str, Any]:
+    """非流式补全：等待完整回复后返回JSON"""
     try:
-        # 创建OpenAI客户端
-        client = OpenAI(
-            api_key=config['api_key'],
-            base_url=config['base_url']
+        response = await get_async_openai_client().chat.completions.create(
+            model=config['model'],
+            messages=request_messages,
+            temperature=0.7,
+            max_tokens=2000,
+            timeout=30
         )
+    except (OpenAIError, ConnectionError, TimeoutError, ValueError, httpx.HTTPError) as e:
+        await _asgi_send_json(send, {"error": _api_error_message(e)})
+        return {}
+    except asyncio.CancelledError:
+        # 非流式请求没有部分回复可保存
+        await _asgi_send_json(send, {"error": "已取消", "cancelled": True})
+        return {"content": "", "version": None, "truncated": True}
+    content = response.choices[0].message.content
+    version = await asyncio.to_thread(_commit_reply, conversation_id, messages, content)
+    await _asgi_send_json(send, {"content": content, "version": version, "context": context_stats})
+    return {}
 
-        # 获取对话历史
-        messages = conversations.get(conversation_id, [])
-        if not messages:
-            messages = [{"role": "system", "content": config['system_prompt']}]
-        messages.append({"role": "user", "content": message})
+async def _asgi_stream(conversation_id: str, messages: list[Dict[str, Any]],
+                       request_messages: list[Dict[str, Any]], context_stats: Dict[str, Any],
+                       send) -> Dict[str, Any]:
+    """流式补全：与 /api/message/stream 相同的SSE事件"""
+    async def send_event(event: str, payload: Dict[str, Any]) -> None:
+        await send({
+            'type': 'http.response.body',
+            'body': _sse_event(event, payload).encode('utf-8'),
+            'more_body': True
+        })
 
-        # 调用API
-        response = client.chat.completions.create(
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]
+    })
+    await send_event('context', context_stats)
+    parts = []
+    result = {}
+    stream = None
+    try:
+        stream = await get_async_openai_client().chat.completions.create(
             model=config['model'],
-            messages=messages,
+            messages=request_messages,
             temperature=0.7,
             max_tokens=2000,
-            timeout=30
+            timeout=30,
+            stream=True
         )
+        async for chunk in stream:
+            reasoning, delta_content = _chunk_delta(chunk)
+            if reasoning:
+                await send_event('reasoning', {"content": reasoning})
+            if delta_content:
+                parts.append(delta_content)
+                await send_event('delta', {"content": delta_content})
+    except (OpenAIError, ConnectionError, TimeoutError, ValueError,
+            httpx.HTTPError, httpx.StreamError) as e:
+        # 与 /api/message/stream 一致：上游连接中途断开时也发送错误事件
+        await send_event('error', {"error": _api_error_message(e)})
+    except asyncio.CancelledError:
+        # 被取消接口或客户端断开取消：保存已生成的部分（客户端已断开时发送会被忽略）
+        result = await _asgi_save_partial(conversation_id, messages, parts)
+        await send_event('cancelled', result)
+    else:
+        content = ''.join(parts)
+        version = await asyncio.to_thread(_commit_reply, conversation_id, messages, content)
+        await send_event('done', {"content": content, "version": version})
+    finally:
+        # 及时关闭上游连接
+        if stream is not None:
+            await stream.close()
+    await send({'type': 'http.response.body', 'body': b''})
+    return result
 
-        # 获取回复
-        content = response.choices[0].message.content
+async def _asgi_message(receive, send, streaming: bool) -> None:
+    """ASGI消息接口：每个补全运行在独立任务中，客户端断开或调用取消接口时取消"""
+    body = await _asgi_read_body(receive)
+    try:
+        data = json.loads(body) if body else None
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        data = None
+    if not isinstance(data, dict):
+        await _asgi_send_json(send, {"error": "缺少消息数据"}, 400)
+        return
+    conversation_id, message, error = _parse_message_request(data)
+    if error:
+        await _asgi_send_json(send, {"error": error})
+        return
 
-        # 更新对话历史
-        messages.append({"role": "assistant", "content": content})
-        conversations[conversation_id] = messages
-        save_conversations({
-            'conversations': conversations,
-            'conversation_titles': conversation_titles
-        })
+    messages = await asyncio.to_thread(_build_request_messages, conversation_id, message)
+    request_messages, context_stats = build_context_window(conversation_id, messages)
+    generation = start_generation(conversation_id, data.get('generation_id'))
+    context_stats = dict(context_stats, generation_id=generation.id)
+    handler = _asgi_stream if streaming else _asgi_complete
+    completion = asyncio.create_task(
+        handler(conversation_id, messages, request_messages, context_stats, send)
+    )
+    generation.attach_task(completion)
+    disconnect = asyncio.create_task(_asgi_wait_disconnect(receive))
+    result = {}
+    try:
+        await asyncio.wait({completion, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        if not completion.done():
+            print(f"客户端已断开，取消补全: {generation.id}")
+            generation.cancel()
+        disconnect.cancel()
+        outcome = (await asyncio.gather(completion, return_exceptions=True))[0]
+        if isinstance(outcome, dict):
+            result = outcome
+    finally:
+        end_generation(generation, **result)
 
-        return jsonify({"content": content})
+def _run_wsgi(scope: Dict[str, Any], body: bytes) -> tuple[int, list[tuple[bytes, bytes]], bytes]:
+    """在工作线程中以WSGI方式调用Flask应用"""
+    server = scope.get('server') or ('127.0.0.1', 5000)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
 
-    except AuthenticationError:
-        return jsonify({"error": "API认证失败，请检查API密钥"})
-    except RateLimitError:
-        return jsonify({"error": "API速率限制，请稍后再试"})
-    except OpenAIError as e:
-        return jsonify({"error": f"API调用失败: {str(e)}"})
-    except (ConnectionError, TimeoutError, ValueError) as e:
-        return jsonify({"error": f"发生错误: {str(e)}"})
+    response_start = {}
 
-@app.route('/api/check-update', methods=['GET'])
-def api_check_update():
-    """检查更新API"""
-    result = check_for_updates()
-    return jsonify(result)
+    def start_response(status: str, headers: list[tuple[str, str]], exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+        ]
+
+    result = app(environ, start_response)
+    try:
+        response_body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response_start['status'], response_start['headers'], response_body
+
+async def asgi_app(scope, receive, send) -> None:
+    """ASGI入口"""
+    if scope['type'] != 'http':
+        return
+    if scope['method'] == 'POST' and scope['path'] in ('/api/message', '/api/message/stream'):
+        await _asgi_message(receive, send, streaming=scope['path'].endswith('/stream'))
+        return
+    body = await _asgi_read_body(receive)
+    status, headers, response_body = await asyncio.to_thread(_run_wsgi, scope, body)
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response_body})
 
 # 前端HTML内容
 HTML_CONTENT = '''<!DOCTYPE html>
@@ -518,6 +3156,7 @@ HTML_CONTENT = '''<!DOCTYPE html>
                 <button id="new-conversation" class="w-full bg-primary text-white py-2 px-4 rounded-lg hover:bg-blue-600 transition-colors flex items-center justify-center">
                     <i class="fa fa-plus mr-2"></i> 新建对话
                 </button>
+                <input id="search-input" type="search" class="w-full mt-2 border border-gray-300 rounded-lg py-2 px-3 text-sm focus:outline-none focus:ring-2 focus:ring-primary focus:border-transparent" placeholder="搜索消息和标题...">
             </div>
             
             <!-- 对话列表 -->
@@ -574,6 +3213,9 @@ HTML_CONTENT = '''<!DOCTYPE html>
                     <button id="send-btn" class="bg-primary text-white py-2 px-6 rounded-lg hover:bg-blue-600 transition-colors">
                         <i class="fa fa-paper-plane"></i>
                     </button>
+                    <button id="stop-btn" class="hidden bg-red-500 text-white py-2 px-6 rounded-lg hover:bg-red-600 transition-colors" title="停止生成">
+                        <i class="fa fa-stop"></i>
+                    </button>
                 </div>
                 <div class="mt-2 text-sm text-gray-500">
                     <span>按Enter发送消息</span>
@@ -641,6 +3283,16 @@ HTML_CONTENT = '''<!DOCTYPE html>
                 <!-- 更新检查结果 -->
                 <div id="update-result" class="p-3 rounded-lg mb-4 hidden">
                     <p id="update-message" class="text-sm"></p>
+                    <!-- 应用内更新 -->
+                    <div id="update-actions" class="mt-2 hidden">
+                        <p id="update-progress" class="text-xs mb-2"></p>
+                        <button id="update-download-btn" class="w-full bg-primary text-white py-1 px-3 rounded-lg hover:bg-blue-600 transition-colors text-sm hidden">
+                            <i class="fa fa-download mr-2"></i> 下载并安装更新
+                        </button>
+                        <button id="update-restart-btn" class="w-full bg-secondary text-white py-1 px-3 rounded-lg hover:bg-green-600 transition-colors text-sm hidden">
+                            <i class="fa fa-repeat mr-2"></i> 重启以完成更新
+                        </button>
+                    </div>
                 </div>
                 
                 <!-- 保存按钮 -->
@@ -742,7 +3394,18 @@ HTML_CONTENT = '''<!DOCTYPE html>
         let currentConversationId = 'default';
         let conversations = {};
         let conversationTitles = {};
+        let conversationVersions = {};
+        let pendingSyncs = {};
         let isProcessing = false;
+        let activeGeneration = null;     // 进行中的回复：{ id, controller, onCancelled, partial }
+        
+        // 分页状态
+        const CONVERSATION_PAGE_SIZE = 50;
+        const MESSAGE_PAGE_SIZE = 50;
+        let conversationCursor = null;   // 对话列表下一页游标，null 表示已全部加载
+        let totalConversations = 0;
+        let messageCursors = {};         // 各对话更早一页消息的游标，null 表示已全部加载
+        let searchTimer = null;          // 搜索输入的防抖定时器
         
         // 初始化
         function init() {
@@ -800,42 +3463,113 @@ HTML_CONTENT = '''<!DOCTYPE html>
             });
         }
         
-        // 初始化对话
+        // 初始化对话：只加载第一页对话列表，消息在切换到对话时再加载
         function initConversations() {
-            fetch('/api/conversations').then(response => response.json()).then(data => {
-                if (data) {
-                    console.log('加载对话历史:', data);
-                    conversations = data.conversations || {};
-                    conversationTitles = data.conversation_titles || {};
-                    
-                    if (!conversations[currentConversationId]) {
-                        createNewConversation();
-                    } else {
-                        // 加载当前对话的聊天历史
-                        loadChatHistory();
-                    }
-                    
-                    updateConversationList();
-                    updateConversationTitle();
-                } else {
+            conversations = {};
+            conversationTitles = {};
+            conversationVersions = {};
+            messageCursors = {};
+            conversationCursor = null;
+            
+            loadConversationPage().then(() => {
+                if (totalConversations === 0) {
                     createNewConversation();
+                    return;
+                }
+                if (!(currentConversationId in conversationTitles)) {
+                    currentConversationId = Object.keys(conversationTitles)[0];
                 }
+                switchConversation(currentConversationId);
             }).catch(error => {
                 console.error('加载对话历史失败:', error);
             });
         }
         
+        // 加载下一页对话列表
+        function loadConversationPage() {
+            const params = new URLSearchParams({ limit: CONVERSATION_PAGE_SIZE });
+            if (conversationCursor) {
+                params.set('cursor', conversationCursor);
+            }
+            return fetch('/api/conversations/list?' + params).then(response => response.json()).then(data => {
+                data.items.forEach(item => {
+                    conversationTitles[item.id] = item.title || '未命名对话';
+                    conversationVersions[item.id] = item.version;
+                });
+                conversationCursor = data.next_cursor;
+                totalConversations = data.total;
+                updateConversationList();
+            });
+        }
+        
+        // 加载对话中更早的一页消息（首次加载为最新的一页）
+        function loadMessagePage(conversationId) {
+            const params = new URLSearchParams({ limit: MESSAGE_PAGE_SIZE });
+            if (messageCursors[conversationId]) {
+                params.set('before', messageCursors[conversationId]);
+            }
+            const url = '/api/conversations/' + encodeURIComponent(conversationId) + '/messages?' + params;
+            return fetch(url).then(response => response.json()).then(data => {
+                if (data.error) {
+                    showError(data.error);
+                    return;
+                }
+                // 接口按从新到旧返回，本地按时间顺序保存
+                const olderMessages = data.messages.reverse();
+                conversations[conversationId] = olderMessages.concat(conversations[conversationId] || []);
+                messageCursors[conversationId] = data.next_before;
+                conversationVersions[conversationId] = data.version;
+            });
+        }
+        
         // 创建新对话
         function createNewConversation() {
             const newId = 'conv_' + Date.now();
-            conversations[newId] = [{ role: 'system', content: document.getElementById('system-prompt').value }];
-            conversationTitles[newId] = '新对话 ' + (Object.keys(conversations).length);
+            conversations[newId] = [];
+            messageCursors[newId] = null;
+            totalConversations += 1;
+            // 新对话显示在列表最前面
+            conversationTitles = { [newId]: '新对话 ' + totalConversations, ...conversationTitles };
             currentConversationId = newId;
             
             updateConversationList();
             updateConversationTitle();
             clearChatHistory();
-            saveConversations();
+            syncConversation(newId, 'PUT', {
+                title: conversationTitles[newId],
+                messages: conversations[newId]
+            });
+        }
+        
+        // 把单个对话的改动同步到后端，同一对话的请求按顺序发送
+        function syncConversation(conversationId, method, body) {
+            const previous = pendingSyncs[conversationId] || Promise.resolve();
+            const current = previous.then(() => fetch('/api/conversations/' + encodeURIComponent(conversationId), {
+                method: method,
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(body)
+            })).then(response => response.json().then(data => {
+                if (response.status === 409) {
+                    // 版本冲突：以服务端数据为准重新加载
+                    showError(data.error);
+                    initConversations();
+                } else if (data.error) {
+                    console.error('同步对话失败:', data.error);
+                } else if (data.version !== undefined) {
+                    conversationVersions[conversationId] = data.version;
+                }
+                return data;
+            })).catch(error => {
+                console.error('同步对话时发生错误:', error);
+            }).finally(() => {
+                if (pendingSyncs[conversationId] === current) {
+                    delete pendingSyncs[conversationId];
+                }
+            });
+            pendingSyncs[conversationId] = current;
+            return current;
         }
         
         // 更新对话列表
@@ -854,6 +3588,85 @@ HTML_CONTENT = '''<!DOCTYPE html>
                 };
                 listContainer.appendChild(conversationItem);
             }
+            
+            // 还有未加载的对话时显示“加载更多”
+            if (conversationCursor) {
+                const moreItem = document.createElement('div');
+                moreItem.className = 'p-2 rounded-lg cursor-pointer text-center text-sm text-gray-500 hover:bg-gray-100';
+                moreItem.textContent = '加载更多';
+                moreItem.onclick = () => loadConversationPage();
+                listContainer.appendChild(moreItem);
+            }
+        }
+        
+        // 搜索消息和标题（输入停顿后再请求）
+        function onSearchInput() {
+            clearTimeout(searchTimer);
+            const query = document.getElementById('search-input').value.trim();
+            if (!query) {
+                updateConversationList();
+                return;
+            }
+            searchTimer = setTimeout(() => {
+                fetch('/api/search?q=' + encodeURIComponent(query)).then(response => response.json()).then(data => {
+                    // 结果返回前输入已变化时丢弃
+                    if (document.getElementById('search-input').value.trim() === query) {
+                        renderSearchResults(data);
+                    }
+                });
+            }, 200);
+        }
+        
+        // 在对话列表位置显示搜索结果，关键词高亮
+        function renderSearchResults(data) {
+            const listContainer = document.getElementById('conversation-list');
+            listContainer.innerHTML = '';
+            if (data.error || !data.results.length) {
+                const emptyItem = document.createElement('div');
+                emptyItem.className = 'p-2 text-sm text-gray-500 text-center';
+                emptyItem.textContent = data.error || '没有找到匹配的内容';
+                listContainer.appendChild(emptyItem);
+                return;
+            }
+            for (const result of data.results) {
+                const resultItem = document.createElement('div');
+                resultItem.className = 'p-2 rounded-lg cursor-pointer mb-1 hover:bg-gray-100';
+                const titleElement = document.createElement('div');
+                titleElement.className = 'text-sm font-medium text-gray-800 truncate';
+                titleElement.textContent = result.title || conversationTitles[result.conversation_id] || '新对话';
+                resultItem.appendChild(titleElement);
+                
+                // 高亮位置按字符计算，用 Array.from 按字符而不是UTF-16编码单元切分
+                const chars = Array.from(result.snippet.text);
+                const snippetElement = document.createElement('div');
+                snippetElement.className = 'text-xs text-gray-500 break-all';
+                let offset = 0;
+                for (const [start, end] of result.snippet.highlights) {
+                    if (start < offset) {
+                        continue;
+                    }
+                    snippetElement.appendChild(document.createTextNode(chars.slice(offset, start).join('')));
+                    const mark = document.createElement('mark');
+                    mark.textContent = chars.slice(start, end).join('');
+                    snippetElement.appendChild(mark);
+                    offset = end;
+                }
+                snippetElement.appendChild(document.createTextNode(chars.slice(offset).join('')));
+                resultItem.appendChild(snippetElement);
+                
+                resultItem.onclick = () => openSearchResult(result);
+                listContainer.appendChild(resultItem);
+            }
+        }
+        
+        // 打开搜索结果所在的对话
+        function openSearchResult(result) {
+            const conversationId = result.conversation_id;
+            if (!(conversationId in conversationTitles)) {
+                conversationTitles[conversationId] = result.title || '新对话';
+            }
+            document.getElementById('search-input').value = '';
+            switchConversation(conversationId);
         }
         
         // 显示对话菜单
@@ -899,13 +3712,17 @@ HTML_CONTENT = '''<!DOCTYPE html>
             if (newTitle && newTitle.trim()) {
                 conversationTitles[conversationId] = newTitle.trim();
                 updateConversationList();
-                saveConversations();
+                updateConversationTitle();
+                syncConversation(conversationId, 'PATCH', {
+                    title: conversationTitles[conversationId],
+                    version: conversationVersions[conversationId]
+                });
             }
         }
         
         // 删除对话
         function deleteConversation(conversationId) {
-            if (Object.keys(conversations).length <= 1) {
+            if (totalConversations <= 1) {
                 alert('不能删除最后一个对话');
                 return;
             }
@@ -913,17 +3730,22 @@ HTML_CONTENT = '''<!DOCTYPE html>
             if (confirm('确定要删除这个对话吗？删除后无法恢复。')) {
                 if (conversationId === currentConversationId) {
                     // 切换到第一个对话
-                    const otherConversationId = Object.keys(conversations).find(id => id !== conversationId);
+                    const otherConversationId = Object.keys(conversationTitles).find(id => id !== conversationId);
                     if (otherConversationId) {
                         switchConversation(otherConversationId);
                     }
                 }
                 
                 // 删除对话
+                syncConversation(conversationId, 'DELETE', {
+                    version: conversationVersions[conversationId]
+                });
                 delete conversations[conversationId];
                 delete conversationTitles[conversationId];
+                delete conversationVersions[conversationId];
+                delete messageCursors[conversationId];
+                totalConversations -= 1;
                 updateConversationList();
-                saveConversations();
             }
         }
         
@@ -932,7 +3754,17 @@ HTML_CONTENT = '''<!DOCTYPE html>
             currentConversationId = id;
             updateConversationList();
             updateConversationTitle();
-            loadChatHistory();
+            if (conversations[id]) {
+                loadChatHistory();
+                return;
+            }
+            // 首次打开对话时才加载消息
+            clearChatHistory();
+            loadMessagePage(id).then(() => {
+                if (currentConversationId === id) {
+                    loadChatHistory();
+                }
+            });
         }
         
         // 更新对话标题
@@ -945,10 +3777,29 @@ HTML_CONTENT = '''<!DOCTYPE html>
         function loadChatHistory() {
             clearChatHistory();
             
-            const messages = conversations[currentConversationId] || [];
+            // 还有更早的消息时在顶部显示加载按钮
+            const conversationId = currentConversationId;
+            if (messageCursors[conversationId]) {
+                const chatHistory = document.getElementById('chat-history');
+                const moreDiv = document.createElement('div');
+                moreDiv.className = 'flex justify-center';
+                moreDiv.innerHTML = '<button class="text-sm text-gray-500 hover:text-primary">加载更早的消息</button>';
+                moreDiv.querySelector('button').onclick = () => {
+                    const distanceFromBottom = chatHistory.scrollHeight - chatHistory.scrollTop;
+                    loadMessagePage(conversationId).then(() => {
+                        if (currentConversationId === conversationId) {
+                            loadChatHistory();
+                            chatHistory.scrollTop = chatHistory.scrollHeight - distanceFromBottom;
+                        }
+                    });
+                };
+                chatHistory.appendChild(moreDiv);
+            }
+            
+            const messages = conversations[conversationId] || [];
             messages.forEach(msg => {
                 if (msg.role !== 'system') {
-                    addMessageToChat(msg.role, msg.content);
+                    addMessageToChat(msg.role, msg.content, msg.truncated);
                 }
             });
         }
@@ -959,8 +3810,8 @@ HTML_CONTENT = '''<!DOCTYPE html>
             chatHistory.innerHTML = '';
         }
         
-        // 添加消息到聊天界面
-        function addMessageToChat(role, content) {
+        // 添加消息到聊天界面（truncated 表示回复被中途停止）
+        function addMessageToChat(role, content, truncated) {
             const chatHistory = document.getElementById('chat-history');
             const messageDiv = document.createElement('div');
             
@@ -980,8 +3831,54 @@ HTML_CONTENT = '''<!DOCTYPE html>
                 `;
             }
             
+            if (truncated) {
+                markTruncated(messageDiv);
+            }
+            
             chatHistory.appendChild(messageDiv);
             chatHistory.scrollTop = chatHistory.scrollHeight;
+            return messageDiv;
+        }
+        
+        // 在回复气泡下方标注“已停止生成”
+        function markTruncated(messageDiv) {
+            const note = document.createElement('p');
+            note.className = 'text-xs text-gray-400 mt-2';
+            note.textContent = '（已停止生成）';
+            messageDiv.firstElementChild.appendChild(note);
+        }
+        
+        // 读取SSE事件流，每解析出一条事件调用一次 onEvent(event, data)
+        function readEventStream(response, onEvent) {
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder('utf-8');
+            let buffer = '';
+            
+            function pump() {
+                return reader.read().then(({ done, value }) => {
+                    if (done) return;
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                        const rawEvent = buffer.slice(0, boundary);
+                        buffer = buffer.slice(boundary + 2);
+                        let eventName = 'message';
+                        let eventData = '';
+                        rawEvent.split('\\n').forEach(line => {
+                            if (line.startsWith('event:')) {
+                                eventName = line.slice(6).trim();
+                            } else if (line.startsWith('data:')) {
+                                eventData += line.slice(5).trim();
+                            }
+                        });
+                        if (eventData) {
+                            onEvent(eventName, JSON.parse(eventData));
+                        }
+                    }
+                    return pump();
+                });
+            }
+            return pump();
         }
         
         // 发送消息
@@ -998,77 +3895,171 @@ HTML_CONTENT = '''<!DOCTYPE html>
             addMessageToChat('user', message);
             
             // 添加用户消息到对话历史
-            if (!conversations[currentConversationId]) {
-                conversations[currentConversationId] = [{ role: 'system', content: document.getElementById('system-prompt').value }];
+            const conversationId = currentConversationId;
+            if (!conversations[conversationId]) {
+                conversations[conversationId] = [];
             }
-            conversations[currentConversationId].push({ role: 'user', content: message });
+            conversations[conversationId].push({ role: 'user', content: message });
             
-            // 显示加载中
-            document.getElementById('loading-modal').classList.remove('hidden');
             isProcessing = true;
+            const generationId = conversationId + '_' + Date.now() + '_' + Math.random().toString(36).slice(2, 8);
+            const controller = new AbortController();
+            activeGeneration = { id: generationId, controller: controller, onCancelled: null, partial: null };
+            setGenerating(true);
+            
+            // 先放置AI回复气泡，收到增量内容后逐步填充
+            const chatHistory = document.getElementById('chat-history');
+            const replyDiv = addMessageToChat('assistant', '...');
+            const contentElement = replyDiv.querySelector('p');
+            contentElement.classList.add('whitespace-pre-wrap');
+            let reasoningElement = null;
+            let reasoning = '';
+            let reply = '';
+            let renderPending = false;
+            
+            // 每帧最多渲染一次，避免逐token重绘
+            function scheduleRender() {
+                if (renderPending) return;
+                renderPending = true;
+                requestAnimationFrame(() => {
+                    renderPending = false;
+                    if (reasoningElement) {
+                        reasoningElement.textContent = reasoning;
+                    }
+                    if (reply) {
+                        contentElement.textContent = reply;
+                    }
+                    chatHistory.scrollTop = chatHistory.scrollHeight;
+                });
+            }
+            
+            function finish() {
+                isProcessing = false;
+                activeGeneration = null;
+                setGenerating(false);
+                if (reasoningElement) {
+                    reasoningElement.remove();
+                }
+            }
+            
+            // 回复被停止：显示并记录已保存的部分，什么都没生成时撤回这条提问
+            function applyCancelled(data) {
+                if (!isProcessing) return;
+                finish();
+                if (data.content) {
+                    contentElement.textContent = data.content;
+                    markTruncated(replyDiv);
+                    conversations[conversationId].push({ role: 'assistant', content: data.content, truncated: true });
+                } else {
+                    replyDiv.remove();
+                    replyDiv.previousElementSibling && replyDiv.previousElementSibling.remove();
+                    conversations[conversationId].pop();
+                    inputElement.value = message;
+                }
+                if (data.version !== null && data.version !== undefined) {
+                    conversationVersions[conversationId] = data.version;
+                }
+            }
+            activeGeneration.onCancelled = applyCancelled;
+            activeGeneration.partial = () => reply;
             
-            // 调用后端API获取回复
-            fetch('/api/message', {
+            // 调用后端流式API获取回复（等待该对话尚未完成的同步请求）
+            (pendingSyncs[conversationId] || Promise.resolve()).then(() => fetch('/api/message/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify({
-                    conversation_id: currentConversationId,
-                    message: message
-                })
-            }).then(response => response.json()).then(response => {
-                // 隐藏加载中
-                document.getElementById('loading-modal').classList.add('hidden');
-                isProcessing = false;
-                
-                if (response.error) {
-                    showError(response.error);
-                } else {
-                    // 添加AI回复到聊天界面
-                    addMessageToChat('assistant', response.content);
-                    
-                    // 添加AI回复到对话历史
-                    conversations[currentConversationId].push({ role: 'assistant', content: response.content });
-                    
-                    // 保存对话
-                    saveConversations();
+                    conversation_id: conversationId,
+                    message: message,
+                    generation_id: generationId
+                }),
+                signal: controller.signal
+            })).then(response => {
+                const contentType = response.headers.get('Content-Type') || '';
+                if (!contentType.includes('text/event-stream')) {
+                    // 请求校验失败时后端直接返回JSON错误
+                    return response.json().then(data => {
+                        finish();
+                        replyDiv.remove();
+                        showError(data.error || '发送消息失败');
+                    });
                 }
+                
+                return readEventStream(response, (event, data) => {
+                    if (event === 'context') {
+                        if (data.dropped_messages > 0) {
+                            console.log('上下文已裁剪:', data);
+                        }
+                    } else if (event === 'reasoning') {
+                        if (!reasoningElement) {
+                            reasoningElement = document.createElement('p');
+                            reasoningElement.className = 'text-sm text-gray-400 whitespace-pre-wrap mb-2';
+                            contentElement.parentElement.insertBefore(reasoningElement, contentElement);
+                        }
+                        reasoning += data.content;
+                        scheduleRender();
+                    } else if (event === 'delta') {
+                        reply += data.content;
+                        scheduleRender();
+                    } else if (event === 'cancelled') {
+                        applyCancelled(data);
+                    } else if (event === 'done') {
+                        finish();
+                        contentElement.textContent = data.content;
+                        
+                        // 添加AI回复到对话历史（后端已保存）
+                        conversations[conversationId].push({ role: 'assistant', content: data.content });
+                        conversationVersions[conversationId] = data.version;
+                    } else if (event === 'error') {
+                        finish();
+                        replyDiv.remove();
+                        showError(data.error);
+                    }
+                }).then(() => {
+                    // 连接意外中断时也要恢复输入状态
+                    if (isProcessing) {
+                        finish();
+                    }
+                });
             }).catch(error => {
-                document.getElementById('loading-modal').classList.add('hidden');
-                isProcessing = false;
+                if (error.name === 'AbortError') {
+                    // 停止生成时主动中止的请求，结果已由取消接口返回
+                    return;
+                }
+                finish();
+                replyDiv.remove();
                 showError('发送消息失败: ' + error.message);
             });
         }
         
-        // 保存对话
-        function saveConversations() {
-            console.log('开始保存对话...');
-            console.log('对话数量:', Object.keys(conversations).length);
-            console.log('当前对话:', currentConversationId);
-            console.log('对话内容:', conversations[currentConversationId]);
-            
-            fetch('/api/conversations', {
+        // 切换发送/停止按钮
+        function setGenerating(generating) {
+            document.getElementById('send-btn').classList.toggle('hidden', generating);
+            document.getElementById('stop-btn').classList.toggle('hidden', !generating);
+        }
+        
+        // 停止生成：通知后端取消并保存已生成的部分，然后中止请求释放连接
+        function stopGeneration() {
+            const generation = activeGeneration;
+            if (!generation) return;
+            fetch('/api/message/cancel', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
-                body: JSON.stringify({
-                    conversations: conversations,
-                    conversation_titles: conversationTitles
-                })
-            }).then(response => {
-                console.log('保存对话响应状态:', response.status);
-                if (!response.ok) {
-                    console.error('保存对话失败:', response.status);
-                } else {
-                    console.log('保存对话成功');
+                body: JSON.stringify({ generation_id: generation.id })
+            }).then(response => response.json()).then(data => {
+                // 回复已经结束（404）时不中止，让流中的 done 事件正常到达
+                if (data.status === 'cancelled') {
+                    generation.onCancelled(data);
+                    generation.controller.abort();
                 }
-                return response.json();
-            }).then(data => {
-                console.log('保存对话响应数据:', data);
             }).catch(error => {
-                console.error('保存对话时发生错误:', error);
+                console.error('取消回复失败:', error);
+                // 直接中止请求，后端在连接断开时同样会保存已生成的部分
+                generation.controller.abort();
+                generation.onCancelled({ content: generation.partial() });
             });
         }
         
@@ -1087,15 +4078,9 @@ HTML_CONTENT = '''<!DOCTYPE html>
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify(config)
-            }).then(() => {
+            }).then(response => response.json()).then(data => {
                 document.getElementById('settings-modal').classList.add('hidden');
                 document.getElementById('current-model').textContent = config.model;
-                
-                // 更新当前对话的系统提示词
-                if (conversations[currentConversationId]) {
-                    conversations[currentConversationId][0] = { role: 'system', content: config.system_prompt };
-                    saveConversations();
-                }
             });
         }
         
@@ -1110,6 +4095,9 @@ HTML_CONTENT = '''<!DOCTYPE html>
             // 发送按钮
             document.getElementById('send-btn').addEventListener('click', sendMessage);
             
+            // 停止生成
+            document.getElementById('stop-btn').addEventListener('click', stopGeneration);
+            
             // 输入框回车发送
             document.getElementById('message-input').addEventListener('keypress', function(e) {
                 if (e.key === 'Enter') {
@@ -1120,6 +4108,9 @@ HTML_CONTENT = '''<!DOCTYPE html>
             // 新建对话
             document.getElementById('new-conversation').addEventListener('click', createNewConversation);
             
+            // 搜索
+            document.getElementById('search-input').addEventListener('input', onSearchInput);
+            
             // 设置按钮
             document.getElementById('settings-btn').addEventListener('click', function() {
                 // 隐藏更新检查结果
@@ -1212,6 +4203,8 @@ HTML_CONTENT = '''<!DOCTYPE html>
             
             // 检测更新按钮
             document.getElementById('check-update-btn').addEventListener('click', checkUpdate);
+            document.getElementById('update-download-btn').addEventListener('click', downloadUpdate);
+            document.getElementById('update-restart-btn').addEventListener('click', restartForUpdate);
         }
         
         // 检查更新
@@ -1219,7 +4212,7 @@ HTML_CONTENT = '''<!DOCTYPE html>
             // 显示加载中
             document.getElementById('loading-modal').classList.remove('hidden');
             
-            fetch('/api/check-update').then(response => response.json()).then(data => {
+            fetch('/api/check-update?refresh=1').then(response => response.json()).then(data => {
                 // 隐藏加载中
                 document.getElementById('loading-modal').classList.add('hidden');
                 
@@ -1229,12 +4222,18 @@ HTML_CONTENT = '''<!DOCTYPE html>
                 // 显示结果区域
                 resultDiv.classList.remove('hidden');
                 
+                document.getElementById('update-actions').classList.add('hidden');
                 if (data.error) {
                     resultDiv.className = 'p-3 rounded-lg mb-4 bg-red-100 text-red-700';
                     messageDiv.innerHTML = '检查更新失败: ' + data.error;
                 } else if (data.update_available) {
                     resultDiv.className = 'p-3 rounded-lg mb-4 bg-yellow-100 text-yellow-700';
-                    messageDiv.innerHTML = `发现新版本 ${data.latest_version}<br>当前版本 ${data.current_version}<br>请前往官网下载更新`;
+                    if (data.auto_update) {
+                        messageDiv.innerHTML = `发现新版本 ${data.latest_version}<br>当前版本 ${data.current_version}`;
+                        refreshUpdateStatus();
+                    } else {
+                        messageDiv.innerHTML = `发现新版本 ${data.latest_version}<br>当前版本 ${data.current_version}<br>请前往官网下载更新`;
+                    }
                 } else {
                     resultDiv.className = 'p-3 rounded-lg mb-4 bg-green-100 text-green-700';
                     messageDiv.innerHTML = `当前已是最新版本 ${data.current_version}`;
@@ -1253,14 +4252,80 @@ HTML_CONTENT = '''<!DOCTYPE html>
             });
         }
         
-        // 应用加载完成后自动检测更新
-        function checkUpdateOnLoad() {
+        // 应用内更新：下载进度每秒刷新一次
+        let updatePollTimer = null;
+
+        function refreshUpdateStatus() {
+            fetch('/api/update/status').then(response => response.json()).then(renderUpdateStatus).catch(error => {
+                console.log('获取更新状态失败:', error);
+            });
+        }
+
+        function renderUpdateStatus(data) {
+            const actions = document.getElementById('update-actions');
+            const progress = document.getElementById('update-progress');
+            clearTimeout(updatePollTimer);
+            if (!data.supported) {
+                actions.classList.add('hidden');
+                return;
+            }
+            actions.classList.remove('hidden');
+            document.getElementById('update-download-btn').classList.toggle('hidden', !['idle', 'error'].includes(data.status));
+            document.getElementById('update-restart-btn').classList.toggle('hidden', data.status !== 'ready');
+            let text = '';
+            if (data.status === 'checking') {
+                text = '正在获取发布信息...';
+            } else if (data.status === 'downloading') {
+                const percent = data.total ? Math.min(100, Math.floor(data.downloaded * 100 / data.total)) : 0;
+                text = `正在下载 ${data.version}：${percent}%`;
+                if (data.total_blocks) {
+                    text += `（复用本地分块 ${data.reused_blocks}/${data.total_blocks}）`;
+                }
+            } else if (data.status === 'verifying') {
+                text = '正在校验更新包...';
+            } else if (data.status === 'ready') {
+                text = `${data.version} 已下载，重启后完成更新`;
+            } else if (data.status === 'error') {
+                text = '更新失败: ' + data.error;
+            } else if (data.message) {
+                text = data.message;
+            }
+            progress.textContent = text;
+            if (['checking', 'downloading', 'verifying'].includes(data.status)) {
+                updatePollTimer = setTimeout(refreshUpdateStatus, 1000);
+            }
+        }
+
+        function downloadUpdate() {
+            fetch('/api/update/download', { method: 'POST' }).then(response => response.json()).then(data => {
+                if (data.error && !data.status) {
+                    document.getElementById('update-progress').textContent = '更新失败: ' + data.error;
+                    return;
+                }
+                renderUpdateStatus(data);
+            }).catch(error => {
+                document.getElementById('update-progress').textContent = '更新失败: ' + error.message;
+            });
+        }
+
+        function restartForUpdate() {
+            fetch('/api/update/restart', { method: 'POST' }).then(response => response.json()).then(data => {
+                document.getElementById('update-progress').textContent = data.error ? '更新失败: ' + data.error : '正在重启...';
+            });
+        }
+
+        // 应用加载完成后自动检测更新（后端立即返回缓存结果，后台检查尚未完成时稍后再查询）
+        function checkUpdateOnLoad(attempt = 0) {
             console.log('开始自动检测更新');
             fetch('/api/check-update').then(response => {
                 console.log('更新检查响应状态:', response.status);
                 return response.json();
             }).then(data => {
                 console.log('更新检查结果:', data);
+                if (data.checking && !data.latest_version && attempt < 5) {
+                    setTimeout(() => checkUpdateOnLoad(attempt + 1), 3000);
+                    return;
+                }
                 // 只有在检测到更新时才显示通知
                 if (data.update_available) {
                     console.log('发现更新，显示通知');
@@ -1286,7 +4351,7 @@ HTML_CONTENT = '''<!DOCTYPE html>
                                 <p style="font-size: 14px; font-weight: 500; margin: 0 0 4px 0;">发现新版本</p>
                                 <p style="font-size: 14px; margin: 4px 0;">当前版本: ${data.current_version}</p>
                                 <p style="font-size: 14px; margin: 4px 0;">最新版本: ${data.latest_version}</p>
-                                <p style="font-size: 14px; margin: 8px 0 0 0;">请前往官网下载更新</p>
+                                <p style="font-size: 14px; margin: 8px 0 0 0;">${data.auto_update ? '可在设置页面中下载并安装更新' : '请前往官网下载更新'}</p>
                             </div>
                             <button onclick="this.parentElement.parentElement.remove()" style="background: none; border: none; color: #F59E0B; cursor: pointer;">
                                 <i class="fa fa-times"></i>
@@ -1322,12 +4387,23 @@ HTML_CONTENT = '''<!DOCTYPE html>
 
 # 启动Flask服务器
 def start_flask_server():
-    """启动Flask服务器"""
+    """启动Flask服务器（server_mode 为 asgi 时改用 uvicorn 运行 ASGI 应用）"""
+    if config['server_mode'] == 'asgi':
+        if uvicorn is not None:
+            uvicorn.run(asgi_app, host='127.0.0.1', port=5000, log_level='warning', lifespan='off')
+            return
+        print("未安装uvicorn，使用Flask开发服务器")
     app.run(host='127.0.0.1', port=5000, debug=False, use_reloader=False)
 
 # 主函数
 def main():
     """主函数"""
+    # 后台检查更新（缓存有效期内不联网）
+    update_checker.refresh()
+    # 后台继续上次未完成的下载
+    threading.Thread(target=resume_downloads, daemon=True).start()
+    threading.Thread(target=search_index.rebuild, daemon=True).start()
+
     # 启动Flask服务器线程
     flask_thread = threading.Thread(target=start_flask_server, daemon=True)
     flask_thread.start()
@@ -1347,5 +4423,14 @@ def main():
     # 启动webview
     webview.start()
 
+    # 窗口关闭后停止仍在进行的下载，关闭对话日志
+    TTHSDManager.instance().stop_all()
+    # 写出后台写入队列中的配置与对话日志并同步到磁盘
+    config_writer.close()
+    search_index.close()
+    store.close()
+    # 有已下载的更新时，在程序退出后替换可执行文件
+    updater.apply_on_exit()
+
 if __name__ == '__main__':
     main()
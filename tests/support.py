@@ -0,0 +1,19 @@
+"""
+测试共用的环境：main 在导入时创建数据目录和对话存储，导入前先指向临时目录
+
+用法: from support import main
+"""
+
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+DATA_ROOT = tempfile.mkdtemp(prefix='ai_chat2_test_')
+os.environ['APPDATA'] = DATA_ROOT
+atexit.register(shutil.rmtree, DATA_ROOT, ignore_errors=True)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402,F401
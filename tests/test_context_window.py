@@ -0,0 +1,125 @@
+"""
+上下文窗口裁剪与对话摘要测试
+
+运行: python -m unittest discover tests
+"""
+
+import unittest
+from unittest import mock
+
+from support import main
+
+# 每条消息 100 + 4 个token
+TEXT = 'a' * 400
+COST = 100 + main.MESSAGE_TOKEN_OVERHEAD
+
+
+def conversation(turns: int) -> list[dict]:
+    messages = [{'role': 'system', 'content': 'sys'}]
+    for i in range(turns):
+        messages.append({'role': 'user', 'content': f'{i}' + TEXT[1:]})
+        messages.append({'role': 'assistant', 'content': f'{i}' + TEXT[1:]})
+    return messages
+
+
+class ContextWindowTest(unittest.TestCase):
+
+    def setUp(self):
+        main._context_summaries.clear()
+        self.refresh = mock.patch.object(main, 'refresh_context_summary').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def use_config(self, **overrides):
+        mock.patch.object(main, 'config', dict(main.config, **overrides)).start()
+
+    def test_within_budget_sends_everything(self):
+        self.use_config(context_token_budget=10000, context_summary=False)
+        messages = conversation(3)
+        request, stats = main.build_context_window('c', messages)
+        self.assertEqual(len(request), len(messages))
+        self.assertEqual(stats['dropped_messages'], 0)
+
+    def test_budget_keeps_latest_messages_from_a_user_turn(self):
+        system_cost = main.message_tokens({'content': 'sys'})
+        # 能放下 3 条消息，但第一条会是助手回复，因此只保留最后 2 条
+        self.use_config(context_token_budget=system_cost + 3 * COST, context_summary=False)
+        messages = conversation(5)
+        request, stats = main.build_context_window('c', messages)
+        self.assertEqual(request, [{'role': m['role'], 'content': m['content']}
+                                   for m in messages[:1] + messages[-2:]])
+        self.assertEqual(stats['dropped_messages'], 8)
+        self.assertEqual(stats['dropped_tokens'], 8 * COST)
+        self.refresh.assert_not_called()
+
+    def test_latest_message_always_kept(self):
+        self.use_config(context_token_budget=10, context_summary=False)
+        request, _ = main.build_context_window('c', conversation(2))
+        self.assertEqual(request[-1]['content'], conversation(2)[-1]['content'])
+
+    def test_cached_summary_merged_into_system_prompt(self):
+        system_cost = main.message_tokens({'content': 'sys'})
+        # 保留最后 4 条消息后还剩 50 个token，足够放下摘要
+        self.use_config(context_token_budget=system_cost + 4 * COST + 50, context_summary=True)
+        messages = conversation(5)
+        main._context_summaries['c'] = {'covered': 4, 'summary': '早期摘要'}
+        request, stats = main.build_context_window('c', messages)
+        self.assertTrue(stats['summarized'])
+        self.assertEqual(request[0]['role'], 'system')
+        self.assertTrue(request[0]['content'].startswith('sys\n\n'))
+        self.assertIn('早期摘要', request[0]['content'])
+        self.assertEqual(len(request), 1 + 4)
+        # 摘要只覆盖 4 条，被丢弃的有 6 条，后台继续概括
+        self.refresh.assert_called_once()
+
+
+class ContextSummaryTest(unittest.TestCase):
+
+    def setUp(self):
+        main._context_summaries.clear()
+        mock.patch.object(main, 'config', dict(main.config, context_token_budget=1000)).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_chunks_fit_limit_and_long_messages_truncated(self):
+        messages = [{'role': 'user', 'content': TEXT}] * 5 + [{'role': 'user', 'content': 'b' * 10000}]
+        chunks = main._summary_chunks(messages, 250)
+        for chunk in chunks:
+            self.assertLessEqual(sum(main.message_tokens(m) for m in chunk), 250)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(messages))
+
+    def test_summary_updated_step_by_step(self):
+        calls = []
+
+        def summarize(previous, chunk):
+            calls.append((previous, len(chunk)))
+            return f'摘要{len(calls)}'
+
+        with mock.patch.object(main, '_summarize_step', side_effect=summarize):
+            dropped = [{'role': 'user', 'content': TEXT}] * 12
+            main.update_context_summary('c', dropped)
+            self.assertEqual(main._context_summaries['c']['covered'], 12)
+            self.assertGreater(len(calls), 1)
+            self.assertEqual(calls[0][0], '')
+            self.assertEqual(calls[1][0], '摘要1')
+
+            # 之后只概括新增的消息
+            calls.clear()
+            main.update_context_summary('c', dropped + [{'role': 'assistant', 'content': TEXT}])
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(calls[0][1], 1)
+            self.assertEqual(main._context_summaries['c']['covered'], 13)
+
+    def test_failed_step_keeps_progress(self):
+        def summarize(previous, chunk):
+            if previous:
+                raise main.OpenAIError('context too long')
+            return '第一段'
+
+        with mock.patch.object(main, '_summarize_step', side_effect=summarize):
+            with self.assertRaises(main.OpenAIError):
+                main.update_context_summary('c', [{'role': 'user', 'content': TEXT}] * 12)
+        self.assertEqual(main._context_summaries['c']['summary'], '第一段')
+        self.assertLess(main._context_summaries['c']['covered'], 12)
+
+
+if __name__ == '__main__':
+    unittest.main()
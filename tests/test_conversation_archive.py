@@ -0,0 +1,96 @@
+"""
+对话归档与快照备份的恢复测试
+
+运行: python -m unittest discover tests
+"""
+
+import shutil
+import time
+import unittest
+
+from support import main
+
+MESSAGES = [{'role': 'user', 'content': '归档前的提问'}, {'role': 'assistant', 'content': '归档前的回复'}]
+
+
+def setUpModule():
+    main.search_index.close()
+    main.store.close()
+
+
+class ArchiveRecoveryTest(unittest.TestCase):
+
+    def setUp(self):
+        for path in main.APP_DATA_DIR.iterdir():
+            if path.name.startswith('chat_history') or path.name == 'archive':
+                shutil.rmtree(path) if path.is_dir() else path.unlink()
+        self.store = None
+
+    def tearDown(self):
+        if self.store is not None:
+            self.store.close()
+
+    def open_store(self) -> main.JournalStore:
+        if self.store is not None:
+            self.store.close()
+        self.store = main.JournalStore(
+            main.CHAT_HISTORY_FILE, main.CHAT_JOURNAL_FILE,
+            archive=main.ConversationArchive(main.CHAT_ARCHIVE_DIR), archive_idle_seconds=86400
+        )
+        self.store.load()
+        return self.store
+
+    def archive_conversation(self, store: main.JournalStore) -> None:
+        store.put_conversation('old', MESSAGES, '旧对话')
+        store.conversation_meta['old']['updated_at'] = time.time() - 2 * 86400
+        store.compact()
+        self.assertTrue(store.conversation_meta['old'].get('archived'))
+        self.assertNotIn('old', store.conversations)
+
+    def corrupt_snapshot(self) -> None:
+        main.CHAT_HISTORY_FILE.write_text('{"conversations": ', encoding='utf-8')
+
+    def test_rehydrated_messages_survive_recovery_from_backup(self):
+        store = self.open_store()
+        self.archive_conversation(store)
+        self.assertEqual(store.get_messages('old'), MESSAGES)
+        # 快照记录对话已读回，.bak1 中仍是归档状态
+        store.compact()
+        self.corrupt_snapshot()
+
+        store = self.open_store()
+        self.assertEqual(store.get_messages('old'), MESSAGES)
+
+    def test_archive_kept_until_no_backup_references_it(self):
+        store = self.open_store()
+        self.archive_conversation(store)
+        store.get_messages('old')
+        # 保持活跃，重启时不会再次归档
+        store.conversation_meta['old']['updated_at'] = time.time()
+        archive_path = store.archive.path('old')
+        for _ in range(main.BACKUP_GENERATIONS):
+            store.compact()
+            self.assertTrue(archive_path.exists())
+        # 重启后继续计数
+        store = self.open_store()
+        store.compact()
+        self.assertFalse(archive_path.exists())
+        self.assertEqual(store.get_messages('old'), MESSAGES)
+
+    def test_rearchived_conversation_keeps_its_file(self):
+        store = self.open_store()
+        self.archive_conversation(store)
+        store.get_messages('old')
+        store.compact()
+        store._accessed.pop('old')
+        store.conversation_meta['old']['updated_at'] = time.time() - 2 * 86400
+        store.compact()
+        self.assertTrue(store.conversation_meta['old'].get('archived'))
+        for _ in range(main.BACKUP_GENERATIONS + 1):
+            store.compact()
+        self.assertTrue(store.archive.path('old').exists())
+        self.assertEqual(store.get_messages('old'), MESSAGES)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+DownloadTuner 参数选择测试（探测请求以桩函数代替）
+
+运行: python -m unittest discover tests
+"""
+
+import sys
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import TTHSD_interface  # noqa: E402
+from TTHSD_interface import DownloadTuner  # noqa: E402
+
+MB = 1 << 20
+URL = 'http://example.com/file.bin'
+
+
+class TierTest(unittest.TestCase):
+
+    def test_tier_boundaries(self):
+        cases = [(0, 0), (MB - 1, 0), (MB, 1), (16 * MB - 1, 1), (16 * MB, 2),
+                 (128 * MB, 3), (1 << 30, 4), (1 << 40, 4)]
+        for size, tier in cases:
+            self.assertEqual(DownloadTuner._tier_index(size), tier, size)
+
+
+class ChooseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tuner = DownloadTuner(probe_timeout=1.0)
+
+    def stub_probe(self, sizes: dict[str, int | None], delay: float = 0.0) -> mock.Mock:
+        def probe(url, user_agent=None):
+            time.sleep(delay)
+            return sizes.get(url)
+
+        stub = mock.Mock(side_effect=probe)
+        self.tuner.probe_size = stub
+        return stub
+
+    def test_threads_limited_by_chunk_count(self):
+        self.stub_probe({URL: 3 * MB})
+        # 1-16 MB 档位为 4 线程 1 MB 分块，3 MB 只有 3 个分块
+        self.assertEqual(self.tuner.choose([URL]), (3, 1))
+
+    def test_unknown_size_uses_default_tier(self):
+        self.stub_probe({})
+        _, threads, chunk = TTHSD_interface._SIZE_TIERS[TTHSD_interface._UNKNOWN_SIZE_TIER]
+        self.assertEqual(self.tuner.choose([URL]), (threads, chunk))
+
+    def test_median_of_sampled_urls(self):
+        urls = [f'http://example.com/{i}' for i in range(10)]
+        stub = self.stub_probe({url: (i + 1) * 200 * MB for i, url in enumerate(urls)})
+        self.assertEqual(self.tuner.choose(urls), (32, 8))
+        self.assertEqual(stub.call_count, TTHSD_interface._PROBE_SAMPLE)
+
+    def test_probes_run_concurrently(self):
+        urls = [f'http://example.com/{i}' for i in range(4)]
+        self.stub_probe({url: 100 * MB for url in urls}, delay=0.3)
+        started = time.monotonic()
+        self.assertEqual(self.tuner.choose(urls), (16, 4))
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_slow_probes_bounded_by_timeout(self):
+        self.tuner.probe_timeout = 0.2
+        self.stub_probe({URL: 100 * MB}, delay=2.0)
+        started = time.monotonic()
+        self.tuner.choose([URL])
+        self.assertLess(time.monotonic() - started, 1.0)
+
+    def test_known_url_size_skips_probe(self):
+        self.tuner._history = {'example.com|2': [
+            {'url': URL, 'thread_count': 16, 'chunk_size_mb': 4, 'throughput': 1.0, 'file_size': 100 * MB},
+        ]}
+        stub = self.stub_probe({})
+        self.assertEqual(self.tuner.choose([URL]), (16, 4))
+        stub.assert_not_called()
+
+    def test_host_history_used_when_probe_fails(self):
+        self.tuner._history = {'example.com|3': [
+            {'url': None, 'thread_count': 32, 'chunk_size_mb': 8, 'throughput': 1.0, 'file_size': 300 * MB},
+        ]}
+        self.stub_probe({})
+        self.assertEqual(self.tuner.choose(['http://example.com/other.bin']), (32, 8))
+
+    def test_fastest_history_params_preferred(self):
+        run = {'url': None, 'file_size': 100 * MB}
+        self.tuner._history = {'example.com|2': [
+            dict(run, thread_count=16, chunk_size_mb=4, throughput=10.0),
+            dict(run, thread_count=16, chunk_size_mb=4, throughput=12.0),
+            dict(run, thread_count=8, chunk_size_mb=2, throughput=30.0),
+            dict(run, thread_count=8, chunk_size_mb=2, throughput=40.0),
+            # 只有一次记录的组合不参与比较
+            dict(run, thread_count=64, chunk_size_mb=16, throughput=99.0),
+        ]}
+        self.stub_probe({URL: 100 * MB})
+        self.assertEqual(self.tuner.choose([URL]), (8, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
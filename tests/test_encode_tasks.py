@@ -0,0 +1,52 @@
+"""
+_encode_tasks 编码测试
+
+运行: python -m unittest discover tests
+"""
+
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from TTHSD_interface import _encode_tasks  # noqa: E402
+
+
+class EncodeTasksTest(unittest.TestCase):
+
+    def test_round_trip_with_names_and_ids(self):
+        urls = ['http://example.com/a.bin', 'https://example.com/路径/b.zip?token="x"\\y']
+        save_paths = ['/tmp/a.bin', 'C:\\下载\\b "1".zip']
+        tasks = json.loads(_encode_tasks(urls, save_paths, ['甲', 'b\n2'], ['id-1', 'id-2']))
+        self.assertEqual(tasks, [
+            {'url': urls[0], 'save_path': save_paths[0], 'show_name': '甲', 'id': 'id-1'},
+            {'url': urls[1], 'save_path': save_paths[1], 'show_name': 'b\n2', 'id': 'id-2'},
+        ])
+
+    def test_default_names_and_ids(self):
+        urls = ['http://example.com/dir/file.txt?x=1', 'http://example.com/dir/', 'http://example.com']
+        tasks = json.loads(_encode_tasks(urls, [Path('/tmp/1'), '/tmp/2', '/tmp/3']))
+        self.assertEqual([task['show_name'] for task in tasks], ['file.txt', 'dir', 'example.com'])
+        self.assertEqual(tasks[0]['save_path'], str(Path('/tmp/1')))
+        # 同一批共用随机前缀，序号区分
+        prefixes = {task['id'].rpartition('-')[0] for task in tasks}
+        self.assertEqual(len(prefixes), 1)
+        self.assertEqual([task['id'].rpartition('-')[2] for task in tasks], ['0', '1', '2'])
+        self.assertNotEqual(json.loads(_encode_tasks(urls[:1], ['/tmp/1']))[0]['id'], tasks[0]['id'])
+
+    def test_partial_names_and_ids_fall_back_to_defaults(self):
+        tasks = json.loads(_encode_tasks(['http://h/a', 'http://h/b'], ['/a', '/b'], ['名称'], ['x']))
+        self.assertEqual([task['show_name'] for task in tasks], ['名称', 'b'])
+        self.assertEqual(tasks[0]['id'], 'x')
+        self.assertTrue(tasks[1]['id'].endswith('-1'))
+
+    def test_empty_and_mismatched(self):
+        self.assertEqual(json.loads(_encode_tasks([], [])), [])
+        with self.assertRaises(ValueError):
+            _encode_tasks(['http://h/a'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+"""
+可续传下载会话测试（内核由 TTHSD_shim 代替，区间下载使用本地 HTTP 服务器）
+
+运行: python -m unittest discover tests
+"""
+
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import TTHSD_interface  # noqa: E402
+from TTHSD_interface import ResumableDownloads, TTHSDownloader  # noqa: E402
+from TTHSD_shim import ShimLibrary  # noqa: E402
+
+SEGMENT = 16 * 1024
+FILES = {
+    '/big.bin': bytes(range(256)) * (10 * SEGMENT // 256),
+    '/small.txt': b'small file',
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """支持 HEAD 与 Range 的静态文件；fail_from 之后的区间返回 500。"""
+
+    etag = '"v1"'
+    fail_from: int | None = None
+    ranges: list[tuple[int, int]] = []
+    lock = threading.Lock()
+
+    def _headers(self, status: int, length: int, extra: dict | None = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self.etag)
+        for key, value in (extra or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, len(FILES[self.path]))
+
+    def do_GET(self):
+        body = FILES[self.path]
+        header = self.headers.get('Range')
+        if header is None:
+            self._headers(200, len(body))
+            self.wfile.write(body)
+            return
+        start, end = (int(x) for x in header[len('bytes='):].split('-'))
+        with self.lock:
+            type(self).ranges.append((start, end + 1))
+        if self.fail_from is not None and start >= self.fail_from:
+            self._headers(500, 0)
+            return
+        self._headers(206, end + 1 - start, {'Content-Range': f'bytes {start}-{end}/{len(body)}'})
+        self.wfile.write(body[start:end + 1])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ResumableDownloadsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix='tthsd_sessions_'))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        _Handler.etag = '"v1"'
+        _Handler.fail_from = None
+        _Handler.ranges = []
+        for name, value in (('_RANGED_MIN_SIZE', 4 * SEGMENT), ('_RANGE_SEGMENT_SIZE', SEGMENT),
+                            ('_RANGED_THREADS', 1)):
+            patcher = mock.patch.object(TTHSD_interface, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def sessions(self) -> ResumableDownloads:
+        return ResumableDownloads(self.root / 'sessions', downloader=TTHSDownloader(library=ShimLibrary()))
+
+    def manifest(self, session_id: str) -> dict:
+        return json.loads((self.root / 'sessions' / f'{session_id}.session.json').read_text('utf-8'))
+
+    def test_manifest_removed_after_all_tasks_finish(self):
+        sessions = self.sessions()
+        target = self.root / 'out' / 'small.txt'
+        future = sessions.submit([self.base + '/small.txt'], [str(target)], session_id='s1',
+                                 thread_count=1, chunk_size_mb=1)
+        future.result(timeout=10)
+        self.assertEqual(target.read_bytes(), FILES['/small.txt'])
+        self.assertEqual(sessions.session_ids(), [])
+
+    def test_resume_skips_finished_tasks_and_redownloads_changed_ones(self):
+        sessions = self.sessions()
+        done = self.root / 'out' / 'done.txt'
+        done.parent.mkdir()
+        done.write_bytes(FILES['/small.txt'])
+        manifest = {
+            'session_id': 's2', 'created_at': 0,
+            'options': {'thread_count': 1, 'chunk_size_mb': 1, 'is_multiple': False, 'user_agent': None},
+            'tasks': [
+                {'id': 's2-0', 'url': self.base + '/small.txt', 'save_path': str(done), 'show_name': 'done.txt',
+                 'downloaded': 10, 'total': 10, 'done': True, 'etag': '"v1"', 'last_modified': None},
+                {'id': 's2-1', 'url': self.base + '/small.txt', 'save_path': str(self.root / 'out' / 'todo.txt'),
+                 'show_name': 'todo.txt', 'downloaded': 3, 'total': 10, 'done': False},
+            ],
+        }
+        sessions._save_manifest(manifest)
+        self.assertEqual(sessions.pending()[0]['done_tasks'], 1)
+
+        future = sessions.resume('s2')
+        self.assertEqual(future.result(timeout=10).task_bytes, {'s2-1': 10})
+        self.assertEqual(sessions.session_ids(), [])
+
+        # 服务器上的文件变化后，已完成的任务也重新下载
+        manifest['tasks'][1]['done'] = False
+        manifest['tasks'][0]['etag'] = '"v0"'
+        sessions._save_manifest(manifest)
+        future = sessions.resume('s2')
+        self.assertEqual(set(future.result(timeout=10).task_bytes), {'s2-0', 's2-1'})
+
+    def test_large_file_resumes_from_completed_ranges(self):
+        sessions = self.sessions()
+        target = self.root / 'out' / 'big.bin'
+        _Handler.fail_from = 6 * SEGMENT
+        future = sessions.submit([self.base + '/big.bin'], [str(target)], session_id='s3')
+        with self.assertRaises(TTHSD_interface.TTHSDError):
+            future.result(timeout=10)
+        task = self.manifest('s3')['tasks'][0]
+        self.assertEqual(task['ranges'], [[0, 6 * SEGMENT]])
+
+        # 重启后只请求缺失的区间
+        _Handler.fail_from = None
+        _Handler.ranges = []
+        future = self.sessions().resume('s3')
+        future.result(timeout=10)
+        self.assertEqual(_Handler.ranges, [(i * SEGMENT, (i + 1) * SEGMENT) for i in range(6, 10)])
+        self.assertEqual(target.read_bytes(), FILES['/big.bin'])
+        self.assertEqual(sessions.session_ids(), [])
+
+    def test_changed_validators_discard_completed_ranges(self):
+        sessions = self.sessions()
+        target = self.root / 'out' / 'big.bin'
+        _Handler.fail_from = 6 * SEGMENT
+        with self.assertRaises(TTHSD_interface.TTHSDError):
+            sessions.submit([self.base + '/big.bin'], [str(target)], session_id='s4').result(timeout=10)
+
+        _Handler.fail_from = None
+        _Handler.etag = '"v2"'
+        _Handler.ranges = []
+        self.sessions().resume('s4').result(timeout=10)
+        self.assertEqual(len(_Handler.ranges), 10)
+        self.assertEqual(target.read_bytes(), FILES['/big.bin'])
+
+
+class ManifestTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp(prefix='tthsd_sessions_'))
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.sessions = ResumableDownloads(self.root)
+        self.manifest = {
+            'session_id': 's', 'created_at': 0, 'options': {},
+            'tasks': [{'id': f's-{i}', 'url': f'http://h/{i}', 'save_path': f'/tmp/{i}', 'show_name': str(i),
+                       'downloaded': 0, 'total': None, 'done': False} for i in range(2)],
+        }
+        self.sessions._save_manifest(self.manifest)
+        self.events = []
+        self.tracker = TTHSD_interface._ManifestTracker(
+            self.sessions, self.manifest, lambda event, msg: self.events.append(event['Type'])
+        )
+
+    def saved(self) -> dict:
+        return json.loads((self.root / 's.session.json').read_text('utf-8'))
+
+    def send(self, event_type: str, task_id: str = '', **msg) -> None:
+        self.tracker({'Type': event_type, 'ID': task_id}, msg)
+
+    def test_progress_saved_at_most_once_per_interval(self):
+        self.send('update', 's-0', Downloaded=10, Total=100)
+        self.assertEqual(self.saved()['tasks'][0]['downloaded'], 10)
+        self.assertEqual(self.saved()['tasks'][0]['total'], 100)
+        self.send('update', 's-0', Downloaded=20, Total=100)
+        self.assertEqual(self.saved()['tasks'][0]['downloaded'], 10)
+        self.assertEqual(self.manifest['tasks'][0]['downloaded'], 20)
+
+    def test_finished_task_saved_immediately(self):
+        self.send('update', 's-0', Downloaded=10, Total=100)
+        self.send('endOne', 's-0')
+        task = self.saved()['tasks'][0]
+        self.assertTrue(task['done'])
+        self.assertEqual(task['downloaded'], 100)
+
+    def test_manifest_kept_until_every_task_done(self):
+        self.send('endOne', 's-0')
+        self.send('err', 's-1', Error='boom')
+        self.send('end')
+        self.assertEqual(self.sessions.session_ids(), ['s'])
+        self.assertEqual(self.sessions.pending()[0]['done_tasks'], 1)
+
+        self.send('endOne', 's-1')
+        self.send('end')
+        self.assertEqual(self.sessions.session_ids(), [])
+        self.assertEqual(self.events, ['endOne', 'err', 'end', 'endOne', 'end'])
+
+
+class RangeHelpersTest(unittest.TestCase):
+
+    def test_add_range_merges_adjacent_and_overlapping(self):
+        ranges = TTHSD_interface._add_range([], 10, 20)
+        ranges = TTHSD_interface._add_range(ranges, 0, 10)
+        self.assertEqual(ranges, [[0, 20]])
+        ranges = TTHSD_interface._add_range(ranges, 30, 40)
+        self.assertEqual(ranges, [[0, 20], [30, 40]])
+        self.assertEqual(TTHSD_interface._add_range(ranges, 15, 35), [[0, 40]])
+
+    def test_missing_segments(self):
+        self.assertEqual(TTHSD_interface._missing_segments([[0, 10], [25, 30]], 42, 10),
+                         [(10, 20), (20, 25), (30, 40), (40, 42)])
+        self.assertEqual(TTHSD_interface._missing_segments([[0, 42]], 42, 10), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
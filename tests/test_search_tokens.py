@@ -0,0 +1,32 @@
+"""
+全文检索分词测试
+
+运行: python -m unittest discover tests
+"""
+
+import unittest
+
+from support import main
+
+
+class SearchTokenTest(unittest.TestCase):
+
+    def test_cjk_bigrams(self):
+        self.assertEqual(main._search_tokens('你好世界'), '你好 好世 世界 界')
+        self.assertEqual(main._search_tokens('Hello 世界'), 'hello 世界 界')
+
+    def test_punctuation_separates_runs(self):
+        for text in ('你好，世界。', '「你好」世界', '你好・世界', '你好゛世界'):
+            self.assertEqual(main._search_tokens(text), '你好 好 世界 界', text)
+
+    def test_query_ignores_punctuation(self):
+        expected = main._search_match_query('你好 世界')
+        for query in ('你好，世界', '「你好」。世界', '你好・世界'):
+            self.assertEqual(main._search_match_query(query), expected, query)
+
+    def test_kana_words_keep_long_vowel_mark(self):
+        self.assertEqual(main._search_tokens('コーヒー'), 'コー ーヒ ヒー ー')
+
+
+if __name__ == '__main__':
+    unittest.main()
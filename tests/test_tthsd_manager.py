@@ -0,0 +1,86 @@
+"""
+TTHSDManager 会话跟踪测试（使用 TTHSD_shim 代替动态库）
+
+运行: python -m unittest discover tests
+"""
+
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from TTHSD_interface import TTHSDManager, TTHSDownloader  # noqa: E402
+from TTHSD_shim import ShimLibrary  # noqa: E402
+
+BODY_SIZE = 1 << 20
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    """缓慢输出响应体，保证测试期间下载一直在进行。"""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(BODY_SIZE))
+        self.end_headers()
+        try:
+            for _ in range(BODY_SIZE // 1024):
+                self.wfile.write(b'\0' * 1024)
+                time.sleep(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ManagerSessionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _SlowHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/slow.bin'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.save_dir = tempfile.mkdtemp(prefix='tthsd_test_')
+        self.manager = TTHSDManager.instance()
+        self.downloader = TTHSDownloader(library=ShimLibrary())
+
+    def tearDown(self):
+        shutil.rmtree(self.save_dir, ignore_errors=True)
+
+    def wait_released(self, downloader_id: int, timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if downloader_id not in self.manager.active_ids():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def test_stop_all_stops_download_without_callback(self):
+        downloader_id = self.downloader.start_download(
+            [self.url], [str(Path(self.save_dir) / 'slow.bin')], thread_count=1, chunk_size_mb=1
+        )
+        self.assertNotEqual(downloader_id, -1)
+        self.assertIn(downloader_id, self.manager.active_ids())
+
+        results = self.manager.stop_all()
+        self.assertTrue(results[downloader_id])
+        # end 事件后会话被释放
+        self.assertTrue(self.wait_released(downloader_id))
+
+
+if __name__ == '__main__':
+    unittest.main()